@@ -1,5 +1,6 @@
 import os
 from Deck import Deck
+from Storage import MemoryBackend, StorageError
 
 class App:
     """
@@ -11,15 +12,125 @@ class App:
         A reference to the Hearthstone database
     decks : list of Deck objects
         A list of decks stored in the application
+    storage : StorageBackend
+        Where the decks are kept between runs
     """
 
-    def __init__(self, db):
+    def __init__(self, db, storage=None):
         """
         Constructor
+
+        Parameters
+        ----------
+        db : HSDB
+            A reference to the Hearthstone database
+        storage : StorageBackend
+            Where the decks are kept, e.g. a SQLiteBackend to keep them in the database.
+            By default a MemoryBackend, so the decks are lost on exit.
         """
 
         self.db = db
+        self.storage = storage if storage is not None else MemoryBackend()
+        self.revisions = {}
         self.decks = []
+        self.load_decks()
+
+    def _deck_from_storage(self, stored):
+        # Cards that are no longer valid are reported by add_card and left out
+        deck = Deck(self.db, stored.name, stored.hero, format_name=stored.format_name)
+        if deck.hero is not None:
+            for card_name in stored.cards:
+                deck.add_card(card_name)
+        self.revisions[stored.name] = stored.revision
+        return deck
+
+    def load_decks(self):
+        """
+        Load the decks of the storage backend.
+        """
+
+        for name in self.storage.deck_names():
+            stored = self.storage.load_deck(name)
+            if stored is not None:
+                self.decks.append(self._deck_from_storage(stored))
+
+    def reload_deck(self, deck, name=None):
+        """
+        Replace a deck with the version of the storage backend, or remove it if it is no
+        longer stored.
+
+        Parameters
+        ----------
+        deck : Deck
+            The deck
+        name : str
+            The name the deck is stored under, if it differs from its name
+        """
+
+        name = deck.name if name is None else name
+        stored = self.storage.load_deck(name)
+        position = self.decks.index(deck)
+        if stored is None:
+            del self.decks[position]
+            self.revisions.pop(name, None)
+        else:
+            self.decks[position] = self._deck_from_storage(stored)
+
+    def store_deck(self, deck, old_name=None):
+        """
+        Save a deck to the storage backend. The write only happens if nobody else changed
+        the stored deck since it was loaded (or last saved) by this application, otherwise
+        the deck is replaced with the stored version and False is returned. If the deck was
+        renamed to a name that another client stored in the meantime, it keeps its old
+        name; if another client changed the deck under its old name, their version is kept
+        as a separate deck. If the write fails, the deck is kept as it is and False is
+        returned.
+
+        Parameters
+        ----------
+        deck : Deck
+            The deck
+        old_name : str
+            The name the deck was stored under, if it was renamed
+        """
+
+        if deck.hero is None:
+            return False
+
+        name = deck.name if old_name is None else old_name
+        revision = self.revisions.get(name, 0)
+        try:
+            if name != deck.name:
+                # Renamed: the new name must be free, then the old deck goes away
+                new_revision = self.storage.save_deck(deck.name, deck.hero, deck.cards, deck.format_name, revision=0)
+                if new_revision is not None:
+                    self.revisions[deck.name] = new_revision
+                    if name not in self.revisions or self.storage.delete_deck(name, revision):
+                        self.revisions.pop(name, None)
+                    else:
+                        # Another client changed the deck under its old name, keep their version
+                        print(name, "was changed by someone else and was not deleted")
+                        stored = self.storage.load_deck(name)
+                        if stored is None:
+                            self.revisions.pop(name, None)
+                        else:
+                            self.decks.append(self._deck_from_storage(stored))
+                else:
+                    # Another client stored a deck under the new name, keep the old one
+                    print("A deck named", deck.name, "already exists, the deck keeps the name", name)
+                    deck.set_name(name)
+            if name == deck.name:
+                new_revision = self.storage.save_deck(deck.name, deck.hero, deck.cards, deck.format_name, revision=revision)
+        except StorageError as e:
+            print("Error while saving {}: {}".format(deck.name, e))
+            return False
+
+        if new_revision is None:
+            print(deck.name, "was changed by someone else, your changes were not saved")
+            self.reload_deck(deck, name)
+            return False
+        self.revisions[deck.name] = new_revision
+        return True
 
     def run(self):
         """
@@ -113,6 +224,25 @@ class App:
 
         return is_duplicate
 
+    def print_completions(self, prefix, hero_class):
+        """
+        Print the cards of the given class whose name starts with the given prefix.
+
+        Parameters
+        ----------
+        prefix : str
+            The beginning of the card name
+        hero_class : str
+            The class of the deck
+        """
+
+        completions = self.db.autocomplete(prefix, hero_class)
+        if len(completions) == 0:
+            print("No card starts with", prefix)
+        else:
+            for card in completions:
+                print(card)
+
     def view_decks(self):
         """
         Enter the part of the application where the user can view the list of decks stored in the application.
@@ -128,12 +258,20 @@ class App:
             print("")
 
             # An optional request to look at a particular deck in more detail
-            deck_name = input("Enter the name of the deck you want to view, or skip to go back: ")
+            deck_name = input("Enter the name of the deck you want to view, '*' for the meta report of all decks, or skip to go back: ")
             deck_name = deck_name.strip()
             print("")
 
             if deck_name == "":
                 return
+            elif deck_name == "*":
+                # MetaReport imports multiprocessing, only pay for it when a report is asked for
+                from MetaReport import MetaAggregator, load_catalog, print_report
+                aggregator = MetaAggregator(load_catalog(self.db))
+                for deck in self.decks:
+                    if deck.hero_class is not None:
+                        aggregator.add(deck)
+                print_report(aggregator.report(10))
             else:
                 for deck in self.decks:
                     if deck_name == deck.name:
@@ -170,14 +308,19 @@ class App:
         new_deck = Deck(self.db, deck_name, hero_name)
 
         # Ask for the first card
-        card_name = input("Pick a card: ")
+        card_name = input("Pick a card (end with '?' to list the matching cards): ")
         card_name = card_name.strip()
         print("")
 
         entering_cards = True
         while entering_cards:
+            # List the cards that start with what was typed so far
+            if card_name.endswith("?"):
+                self.print_completions(card_name[:-1].strip(), new_deck.hero_class)
+                print("")
+
             # Try adding the card to the deck
-            if new_deck.add_card(card_name) == True:
+            elif new_deck.add_card(card_name) == True:
                 print("Card successfully added to the deck\n")
             else:
                 print("Failed to insert card\n")
@@ -192,7 +335,8 @@ class App:
                 entering_cards = False
 
         # Append the newly created deck to the list
-        self.decks.append(new_deck)        
+        self.decks.append(new_deck)
+        self.store_deck(new_deck)
 
     def edit_deck(self):
         """
@@ -214,6 +358,7 @@ class App:
         if deck is None:
             print("Deck does not exist")
             return
+        old_name = deck.name
 
         # Enter the editing loop
         editing = True
@@ -260,12 +405,16 @@ class App:
 
             elif key == 2:  # Add a card
                 # Ask for the card name
-                card_name = input("Please enter the name of the card: ")
+                card_name = input("Please enter the name of the card (end with '?' to list the matching cards): ")
                 card_name = card_name.strip()
                 print("")
 
+                # List the cards that start with what was typed so far
+                if card_name.endswith("?"):
+                    self.print_completions(card_name[:-1].strip(), deck.hero_class)
+
                 # Try adding the card to the deck
-                if deck.add_card(card_name) == True:
+                elif deck.add_card(card_name) == True:
                     print("Card successfully added to the deck")
                 else:
                     print("Failed to insert card")
@@ -290,6 +439,7 @@ class App:
 
             elif key == 0:  # Exit the loop gracefully
                 editing = False
+                self.store_deck(deck, old_name)
 
             else:
                 print("Invalid input")
@@ -309,6 +459,17 @@ class App:
         # Find the deck and delete it if it exists
         for deck in self.decks:
             if deck_name == deck.name:
+                revision = self.revisions.get(deck_name)
+                try:
+                    deleted = revision is None or self.storage.delete_deck(deck_name, revision)
+                except StorageError as e:
+                    print("Error while deleting {}: {}".format(deck_name, e))
+                    return
+                self.revisions.pop(deck_name, None)
+                if not deleted:
+                    print(deck_name, "was changed by someone else and was not deleted")
+                    self.reload_deck(deck)
+                    return
                 self.decks.remove(deck)
                 del deck
                 print(deck_name, "is successfully deleted")
@@ -343,6 +504,7 @@ class App:
                 else:
                     # Append the deck to the list
                     self.decks.append(new_deck)
+                    self.store_deck(new_deck)
                     print("Deck successfully created")
                     print("")
 
@@ -432,6 +594,7 @@ class App:
                     # Append the deck to the list
                     accept = True
                     self.decks.append(new_deck)
+                    self.store_deck(new_deck)
                     print("Deck successfully created")
 
             elif ok == "no" or ok == "n":
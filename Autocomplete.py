@@ -0,0 +1,185 @@
+from bisect import bisect_left
+
+def edit_distance(a, b):
+    """
+    Return the Levenshtein distance between two strings.
+
+    This is the bit-parallel algorithm of Myers (in Hyyro's formulation): every column
+    of the dynamic programming table is kept as two bit vectors of vertical +1/-1
+    deltas, so each character of b costs a few integer operations instead of a loop
+    over a.
+
+    Parameters
+    ----------
+    a : str
+        The first string
+    b : str
+        The second string
+    """
+
+    m = len(a)
+    if m == 0:
+        return len(b)
+
+    # Bit i of peq[c] is set if a[i] == c
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv = full
+    mv = 0
+    score = m
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & full)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = mh | (~(xv | ph) & full)
+        mv = ph & xv
+    return score
+
+class NameIndex:
+    """
+    A prefix index over card names: the names are kept sorted by their lower case form,
+    so all the names that start with a prefix are a contiguous slice found by bisection.
+
+    Attributes
+    ----------
+    keys : list of str
+        The lower case names, sorted
+    names : list of str
+        The names, in the same order as keys
+    """
+
+    def __init__(self, names):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        names : iterable of str
+            The names to index
+        """
+
+        pairs = sorted(set((name.lower(), name) for name in names))
+        self.keys = [key for key, _ in pairs]
+        self.names = [name for _, name in pairs]
+
+    def __len__(self):
+        return len(self.names)
+
+    def complete(self, prefix, limit=10):
+        """
+        Return up to limit names that start with the given prefix (case insensitive), in
+        alphabetical order.
+
+        Parameters
+        ----------
+        prefix : str
+            The beginning of the name
+        limit : int
+            The maximum number of names returned, None for all of them
+        """
+
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        end = start
+        while end < len(self.keys) and self.keys[end].startswith(prefix) and (limit is None or end - start < limit):
+            end += 1
+        return self.names[start:end]
+
+class BKTree:
+    """
+    A Burkhard-Keller tree over card names, used to find the names within a given edit
+    distance of a misspelled name without comparing it to every name.
+
+    Every node is [lower case name, name, {distance: child node}].
+    """
+
+    def __init__(self, names):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        names : iterable of str
+            The names to index
+        """
+
+        self.root = None
+        self.size = 0
+        for name in sorted(set(names)):
+            self.add(name)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, name):
+        """
+        Add a name to the tree.
+
+        Parameters
+        ----------
+        name : str
+            The name
+        """
+
+        key = name.lower()
+        if self.root is None:
+            self.root = [key, name, {}]
+            self.size = 1
+            return
+
+        node = self.root
+        while True:
+            distance = edit_distance(key, node[0])
+            if distance == 0:
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, name, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, name, max_distance=2):
+        """
+        Return the (distance, name) pairs of every name within max_distance of the given
+        name (case insensitive), closest first.
+
+        Parameters
+        ----------
+        name : str
+            The name to look for
+        max_distance : int
+            The maximum edit distance
+        """
+
+        if self.root is None:
+            return []
+
+        key = name.lower()
+        results = []
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            distance = edit_distance(key, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            # By the triangle inequality, only the children whose distance to this node is
+            # within max_distance of our distance to it can hold a match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+
+        results.sort()
+        return results
@@ -0,0 +1,684 @@
+"""
+Benchmark suite for the Hearthstone database.
+
+Synthetic catalogs (cards/heroes/keywords/classes csv files) and deck corpora are
+generated at several sizes, then ingest, card searches, keyword searches, deck
+validation, deck statistics, random deck generation, the storage backends and
+concurrent deck writes are timed on each of them.
+The results are written as JSON so that two runs can be compared:
+
+    python Benchmark.py --sizes 1000 10000 100000 --output after.json
+    python Benchmark.py --compare before.json after.json
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import contextlib
+from HSDB import HSDB
+from Deck import Deck
+from DecklistParser import DecklistParser
+from ResultCache import ResultCache
+from Storage import SQLiteBackend, MemoryBackend, GroupCommitWriter, StorageError, check_conformance
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_NUM_DECKS = 200
+REGRESSION_THRESHOLD = 0.10
+STRESS_THREADS = 8          # concurrent writers of the deck_writes benchmark
+STRESS_DECKS = 4            # decks they all edit in the contended run
+STRESS_EDITS = 50           # edits per writer
+
+RARITIES = ["Free", "Common", "Rare", "Epic", "Legendary"]
+RARITY_WEIGHTS = [10, 45, 25, 12, 8]
+TYPES = ["Minion", "Spell", "Weapon"]
+TYPE_WEIGHTS = [60, 35, 5]
+COST_WEIGHTS = [3, 10, 16, 16, 14, 11, 9, 7, 5, 3, 3, 1]  # 0 to 11 mana
+
+ADJECTIVES = ["Ancient", "Arcane", "Blazing", "Bloodfen", "Cursed", "Dire", "Drakkari", "Emerald",
+              "Fel", "Frost", "Gilded", "Grim", "Hungry", "Iron", "Jade", "Lost", "Molten",
+              "Mystic", "Noble", "Plagued", "Primal", "Radiant", "Savage", "Shadow", "Silent",
+              "Spectral", "Storm", "Sunfury", "Twisted", "Venomous", "Wild", "Wretched"]
+NOUNS = ["Acolyte", "Behemoth", "Blade", "Bolt", "Brute", "Channeler", "Colossus", "Conjurer",
+         "Drake", "Elemental", "Golem", "Guardian", "Harpy", "Hound", "Hydra", "Knight",
+         "Mage", "Murloc", "Oracle", "Pirate", "Raptor", "Revenant", "Rune", "Seer",
+         "Sentinel", "Serpent", "Shaman", "Spider", "Totem", "Treant", "Warden", "Wyrm"]
+
+# Searches timed by the get_cards benchmark
+CARD_FILTERS = [
+    {},
+    {"card_cost": 3},
+    {"class_name": "Mage"},
+    {"class_name": "Neutral", "card_cost": 2},
+    {"card_rarity": "Legendary", "card_type": "Minion"},
+    {"card_name": "Drake"},
+]
+
+# Card browser clicks timed by the faceted_query benchmark: a filter, one page and the
+# counts of every facet
+FACETED_QUERIES = [
+    {"limit": 20},
+    {"card_cost": (1, 3), "limit": 20},
+    {"class_name": ["Mage", "Neutral"], "card_cost": (None, 4), "sort_by": "cost", "limit": 20},
+    {"card_rarity": ["Epic", "Legendary"], "card_type": "Minion", "card_attack": (4, None), "limit": 20},
+    {"keywords": ["Taunt"], "keywords_any": ["Battlecry", "Deathrattle"], "offset": 20, "limit": 20},
+    {"card_name": "Drake", "sort_by": "rarity", "limit": 20},
+]
+
+# Searches timed by the keyword_search benchmark
+KEYWORD_SEARCHES = [
+    ["Taunt"],
+    ["Battlecry"],
+    ["Taunt", "Battlecry"],
+    ["Deathrattle", "Rush", "Lifesteal"],
+]
+
+def read_reference_data(data_dir="data"):
+    """
+    Return the classes and the keywords of the real catalog, which the synthetic
+    catalogs reuse.
+
+    Parameters
+    ----------
+    data_dir : str
+        The folder that holds classes.csv and keywords.csv
+    """
+
+    with open(os.path.join(data_dir, "classes.csv"), "r") as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        next(reader)
+        classes = [row[0] for row in reader if len(row) > 0]
+
+    with open(os.path.join(data_dir, "keywords.csv"), "r") as f:
+        reader = csv.reader(f, skipinitialspace=True)
+        next(reader)
+        keywords = [(row[0], row[1]) for row in reader if len(row) > 1]
+
+    return classes, keywords
+
+def generate_dataset(directory, num_cards, seed=0, heroes_per_class=3, data_dir="data"):
+    """
+    Write a synthetic catalog (cards.csv, heroes.csv, keywords.csv and classes.csv) to
+    the given folder. Return a dictionary describing it, used to generate deck corpora:
+        - classes (list of str)
+        - heroes (list of (hero name, class name))
+        - cards_by_class (dict of class name -> list of card names)
+
+    Parameters
+    ----------
+    directory : str
+        The folder to write the csv files to
+    num_cards : int
+        The number of cards in the catalog
+    seed : int
+        Seed of the random generator, the same seed always gives the same catalog
+    heroes_per_class : int
+        The number of heroes of every class
+    data_dir : str
+        The folder of the real catalog, whose classes and keywords are reused
+    """
+
+    rng = random.Random(seed)
+    classes, keywords = read_reference_data(data_dir)
+    playable_classes = [c for c in classes if c != "Neutral"]
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, "classes.csv"), "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        f.write("class_name\n")
+        for class_name in classes:
+            writer.writerow([class_name])
+
+    with open(os.path.join(directory, "keywords.csv"), "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        f.write("keyword_name, keyword_description\n")
+        for keyword in keywords:
+            writer.writerow(keyword)
+
+    heroes = []
+    with open(os.path.join(directory, "heroes.csv"), "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(["Name", "Hero Power Name", "Hero Power Cost", "Hero Power Text", "Class"])
+        for class_name in playable_classes:
+            for i in range(heroes_per_class):
+                hero_name = "{} Champion {}".format(class_name, i + 1)
+                writer.writerow([hero_name, "{} Power".format(class_name), 2, "Do something.", class_name])
+                heroes.append((hero_name, class_name))
+
+    cards_by_class = {class_name: [] for class_name in classes}
+    combinations = len(ADJECTIVES) * len(NOUNS)
+    with open(os.path.join(directory, "cards.csv"), "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(["Name", "Type", "Rarity", "Cost", "Attack", "Health", "Text", "Classes"])
+        for i in range(num_cards):
+            name = "{} {}".format(ADJECTIVES[i % len(ADJECTIVES)], NOUNS[(i // len(ADJECTIVES)) % len(NOUNS)])
+            if i >= combinations:
+                name += " {}".format(i // combinations + 1)
+
+            card_type = rng.choices(TYPES, TYPE_WEIGHTS)[0]
+            rarity = rng.choices(RARITIES, RARITY_WEIGHTS)[0]
+            cost = rng.choices(range(len(COST_WEIGHTS)), COST_WEIGHTS)[0]
+            attack = ""
+            health = ""
+            if card_type == "Minion":
+                attack = max(0, cost + rng.randint(-2, 2))
+                health = max(1, cost + rng.randint(-2, 2))
+            elif card_type == "Weapon":
+                attack = max(1, cost - rng.randint(0, 2))
+                health = rng.randint(1, 4)
+
+            card_keywords = rng.sample(keywords, rng.choice([0, 0, 1, 1, 1, 2]))
+            text = ". ".join([k[0] for k in card_keywords] + ["Deal {} damage".format(rng.randint(1, 6))]) + "."
+
+            roll = rng.random()
+            if roll < 0.4:
+                card_classes = ["Neutral"]
+            elif roll < 0.45:
+                card_classes = rng.sample(playable_classes, 2)
+            else:
+                card_classes = [rng.choice(playable_classes)]
+            for class_name in card_classes:
+                cards_by_class[class_name].append(name)
+
+            writer.writerow([name, card_type, rarity, cost, attack, health, text, "|".join(card_classes)])
+
+    return {"classes": classes, "heroes": heroes, "cards_by_class": cards_by_class}
+
+def generate_deck_corpus(directory, dataset, num_decks, seed=0, deck_size=30):
+    """
+    Write num_decks legal decklists, in the format of data/deck_format.txt, to the given
+    folder. Return the list of paths.
+
+    Parameters
+    ----------
+    directory : str
+        The folder to write the decklists to
+    dataset : dict
+        The description of the catalog returned by generate_dataset
+    num_decks : int
+        The number of decklists
+    seed : int
+        Seed of the random generator
+    deck_size : int
+        The number of cards in every deck
+    """
+
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(num_decks):
+        hero_name, class_name = rng.choice(dataset["heroes"])
+        pool = dataset["cards_by_class"][class_name] + dataset["cards_by_class"]["Neutral"]
+        path = os.path.join(directory, "deck_{:06d}.txt".format(i))
+        with open(path, "w") as f:
+            f.write("Name Deck {}\n".format(i))
+            f.write("Class {}\n".format(class_name))
+            f.write("Hero {}\n".format(hero_name))
+            for card_name in rng.choices(pool, k=deck_size):
+                f.write(card_name + "\n")
+        paths.append(path)
+    return paths
+
+def timed(function, calls=1):
+    """
+    Call function the given number of times and return the timing as a dictionary.
+    Anything printed by the function is discarded.
+
+    Parameters
+    ----------
+    function : callable
+        The function to time, called without arguments
+    calls : int
+        The number of calls
+    """
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+    return {"calls": calls, "seconds": elapsed, "per_call": elapsed / calls}
+
+def bench_ingest(env):
+    db = env["db"]
+    return timed(db.create_tables_from_data)
+
+def timed_with_cache(db, run, repeat):
+    # Time run through the result cache, then without it, and add the hit rate
+    cache = db.result_cache = ResultCache()
+    result = timed(run, repeat)
+    result["hit_rate"] = cache.stats()["hit_rate"]
+    db.result_cache = None
+    result["uncached_per_call"] = timed(run, repeat)["per_call"]
+    db.result_cache = cache
+    return result
+
+def bench_get_cards(env):
+    db = env["db"]
+    repeat = env["repeat"]
+
+    def run():
+        for filters in CARD_FILTERS:
+            db.get_cards(**filters)
+
+    result = timed_with_cache(db, run, repeat)
+    result["queries_per_call"] = len(CARD_FILTERS)
+    return result
+
+def bench_faceted_query(env):
+    db = env["db"]
+    repeat = env["repeat"]
+
+    def run():
+        for query in FACETED_QUERIES:
+            db.query_cards(**query)
+
+    # The index is built once per catalog, time it separately from the queries
+    db.invalidate_caches()
+    build = timed(db.get_facet_index)
+    result = timed(run, repeat)
+    result["index_build_seconds"] = build["seconds"]
+    result["queries_per_call"] = len(FACETED_QUERIES)
+    return result
+
+def bench_keyword_search(env):
+    db = env["db"]
+    repeat = env["repeat"]
+
+    def run():
+        for keywords in KEYWORD_SEARCHES:
+            db.viewCardsByKeyword(keywords)
+
+    result = timed_with_cache(db, run, repeat)
+    result["queries_per_call"] = len(KEYWORD_SEARCHES)
+    return result
+
+def bench_deck_validation(env):
+    db = env["db"]
+    decks = []
+
+    def run():
+        for path in env["deck_paths"]:
+            deck = Deck(db)
+            if deck.generate_deck_from_text_file(path):
+                decks.append(deck)
+
+    result = timed(run)
+    result["decks"] = len(env["deck_paths"])
+    result["valid"] = len(decks)
+    env["decks"] = decks
+    return result
+
+def dirty_decklist(text, rng):
+    """
+    Return a decklist in the style of community lists: comments, blank lines, counts,
+    odd spacing and case, and now and then a misspelled card.
+
+    Parameters
+    ----------
+    text : str
+        A clean decklist, as written by generate_deck_corpus
+    rng : random.Random
+        The random generator
+    """
+
+    lines = text.splitlines()
+    header, cards = lines[:3], lines[3:]
+    counts = {}
+    for card_name in cards:
+        counts[card_name] = counts.get(card_name, 0) + 1
+
+    dirty = ["# Imported deck", ""]
+    dirty.extend(rng.sample(header, len(header)))
+    dirty.append("// cards")
+    for card_name, count in counts.items():
+        if rng.random() < 0.05:
+            position = rng.randrange(len(card_name))
+            card_name = card_name[:position] + card_name[position + 1:]
+        if rng.random() < 0.3:
+            card_name = card_name.lower()
+        style = rng.randrange(3)
+        if style == 0:
+            dirty.append("{}x {}".format(count, card_name))
+        elif style == 1:
+            dirty.append("  {} x{}  # comment".format(card_name, count))
+        else:
+            dirty.extend([card_name] * count)
+        if rng.random() < 0.1:
+            dirty.append("")
+    return "\n".join(dirty) + "\n"
+
+def bench_decklist_parse(env):
+    db = env["db"]
+    rng = random.Random(env["seed"])
+    texts = []
+    for path in env["deck_paths"]:
+        with open(path, "r") as f:
+            texts.append(dirty_decklist(f.read(), rng))
+    parser = DecklistParser(db)
+    valid = []
+
+    def run():
+        valid.clear()
+        for text in texts:
+            if parser.parse_text(text).ok:
+                valid.append(text)
+
+    result = timed(run, env["repeat"])
+    result["decks"] = len(texts)
+    result["valid"] = len(valid)
+    result["decks_per_second"] = len(texts) / result["per_call"]
+
+    # The "did you mean" search of misspelled cards dominates, time the parser without it
+    parser = DecklistParser(db, suggest=False)
+    result["decks_per_second_without_suggestions"] = len(texts) / timed(run, env["repeat"])["per_call"]
+    return result
+
+def bench_deck_statistics(env):
+    decks = env.get("decks", [])
+
+    def run():
+        for deck in decks:
+            deck.get_deck_statistics()
+
+    result = timed(run)
+    result["decks"] = len(decks)
+    return result
+
+def bench_random_generation(env):
+    db = env["db"]
+    random.seed(env["seed"])
+    result = timed(lambda: Deck(db).randomize(), env["repeat"])
+    return result
+
+def bench_storage(env):
+    # The same reads and deck round trips on both backends. The SQLite backend is timed
+    # without the result cache, the memory backend is loaded from it once.
+    db = env["db"]
+    rng = random.Random(env["seed"])
+    dataset = env["dataset"]
+    names = [name for cards in dataset["cards_by_class"].values() for name in cards]
+    lookups = [rng.choice(names) for _ in range(200)]
+    hero_names = [hero_name for hero_name, _ in dataset["heroes"]]
+    decks = [("Storage bench {}".format(i), rng.choice(hero_names), [rng.choice(names) for _ in range(30)]) for i in range(20)]
+
+    def run(backend):
+        for card_name in lookups:
+            backend.get_card(card_name)
+        for filters in CARD_FILTERS:
+            backend.find_cards(**filters)
+        for class_name in dataset["classes"]:
+            backend.get_pool_cards(class_name)
+        for hero_name in hero_names:
+            backend.get_hero(hero_name)
+        for keywords in KEYWORD_SEARCHES:
+            backend.cards_with_keywords(keywords)
+        for name, hero, cards in decks:
+            backend.save_deck(name, hero, cards)
+            backend.load_deck(name)
+        for name, _, _ in decks:
+            backend.delete_deck(name)
+
+    cache = db.result_cache
+    db.result_cache = None
+    sqlite_backend = SQLiteBackend(db)
+    memory_backend = MemoryBackend()
+    load = timed(lambda: memory_backend.load(sqlite_backend))
+    result = timed(lambda: run(sqlite_backend), env["repeat"])
+    memory = timed(lambda: run(memory_backend), env["repeat"])
+    result["memory_per_call"] = memory["per_call"]
+    result["memory_load_seconds"] = load["seconds"]
+    result["mismatches"] = len(check_conformance(memory_backend, sqlite_backend))
+    db.result_cache = cache
+    return result
+
+def stress_deck_writes(db_file, make_backend, card_names, hero, seed, shared=True):
+    # STRESS_THREADS threads add STRESS_EDITS cards each to STRESS_DECKS shared decks, or
+    # to a deck of their own (a burst of unrelated writes), every edit a load then a
+    # compare-and-swap save, retried on conflict or failure. Return the time, the number
+    # of conflicts, the number of failed writes (e.g. the database was locked) and the
+    # number of edits missing from the decks at the end.
+    deck_names = ["Stress deck {}".format(i) for i in range(STRESS_DECKS if shared else STRESS_THREADS)]
+    backend = make_backend()
+    for deck_name in deck_names:
+        backend.save_deck(deck_name, hero, [])
+    conflicts = [0] * STRESS_THREADS
+    failures = [0] * STRESS_THREADS
+
+    def writer(index):
+        db = HSDB()
+        db.connect(db_file)
+        thread_backend = make_backend(db)
+        rng = random.Random(seed + index)
+        for _ in range(STRESS_EDITS):
+            deck_name = rng.choice(deck_names) if shared else deck_names[index]
+            while True:
+                stored = thread_backend.load_deck(deck_name)
+                try:
+                    if thread_backend.save_deck(deck_name, stored.hero, stored.cards + [rng.choice(card_names)],
+                                                revision=stored.revision) is not None:
+                        break
+                    conflicts[index] += 1
+                except StorageError:
+                    failures[index] += 1
+        db.conn.close()
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(STRESS_THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stored_cards = sum(len(backend.load_deck(deck_name).cards) for deck_name in deck_names)
+    for deck_name in deck_names:
+        backend.delete_deck(deck_name)
+    return elapsed, sum(conflicts), sum(failures), STRESS_THREADS * STRESS_EDITS - stored_cards
+
+def bench_deck_writes(env):
+    # Concurrent deck edits, each writer committing on its own connection, then all of
+    # them going through one group-commit writer. per_call is the time per edit of the
+    # contended run, the burst_ keys are for the run where every writer has its own deck.
+    db_file = env["db"].db_file
+    dataset = env["dataset"]
+    card_names = [name for cards in dataset["cards_by_class"].values() for name in cards]
+    hero = dataset["heroes"][0][0]
+    edits = STRESS_THREADS * STRESS_EDITS
+    group_writer = GroupCommitWriter(db_file)
+
+    def direct(db=None):
+        return SQLiteBackend(env["db"] if db is None else db)
+
+    def grouped(db=None):
+        return SQLiteBackend(env["db"] if db is None else db, group_writer)
+
+    result = {"calls": edits, "lost_updates": 0}
+    for prefix, shared in (("", True), ("burst_", False)):
+        elapsed, conflicts, failures, lost = stress_deck_writes(db_file, direct, card_names, hero, env["seed"], shared)
+        result[prefix + "per_call"] = elapsed / edits
+        result[prefix + "conflicts"] = conflicts
+        result[prefix + "failures"] = failures
+        result["lost_updates"] += lost
+        elapsed, conflicts, failures, lost = stress_deck_writes(db_file, grouped, card_names, hero, env["seed"], shared)
+        result[prefix + "group_commit_per_call"] = elapsed / edits
+        result[prefix + "group_commit_conflicts"] = conflicts
+        result[prefix + "group_commit_failures"] = failures
+        result["lost_updates"] += lost
+    group_writer.close()
+    result["seconds"] = result["per_call"] * edits
+    result["writes_per_batch"] = group_writer.stats()["writes_per_batch"]
+    return result
+
+# The benchmarks, in the order they run. Each one takes the environment of the current
+# catalog size and returns a dictionary with at least "calls", "seconds" and "per_call".
+BENCHMARKS = [
+    ("ingest", bench_ingest),
+    ("get_cards", bench_get_cards),
+    ("faceted_query", bench_faceted_query),
+    ("keyword_search", bench_keyword_search),
+    ("deck_validation", bench_deck_validation),
+    ("decklist_parse", bench_decklist_parse),
+    ("deck_statistics", bench_deck_statistics),
+    ("random_generation", bench_random_generation),
+    ("storage", bench_storage),
+    ("deck_writes", bench_deck_writes),
+]
+
+def run_size(workdir, num_cards, num_decks, repeat, seed, only=None):
+    """
+    Generate a catalog of the given size and run every benchmark on it. Return the
+    results by benchmark name.
+
+    Parameters
+    ----------
+    workdir : str
+        The folder where the catalog, the database and the decks are written
+    num_cards : int
+        The number of cards in the catalog
+    num_decks : int
+        The number of decks in the corpus
+    repeat : int
+        How many times the query benchmarks are repeated
+    seed : int
+        Seed of the random generators
+    only : list of str
+        If not None, only run the benchmarks with these names (ingest always runs)
+    """
+
+    directory = os.path.join(workdir, "cards_{}".format(num_cards))
+    dataset = generate_dataset(directory, num_cards, seed)
+    deck_paths = generate_deck_corpus(os.path.join(directory, "decks"), dataset, num_decks, seed)
+
+    db_file = os.path.join(directory, "hs.sqlite")
+    if os.path.exists(db_file):
+        os.remove(db_file)
+    db = HSDB()
+    db.connect(db_file)
+    db.data_dir = directory
+
+    env = {
+        "db": db,
+        "directory": directory,
+        "dataset": dataset,
+        "deck_paths": deck_paths,
+        "repeat": repeat,
+        "seed": seed,
+    }
+
+    results = {}
+    for name, benchmark in BENCHMARKS:
+        if only is not None and name not in only and name != "ingest":
+            continue
+        print("  {:<20}".format(name), end="", flush=True)
+        results[name] = benchmark(env)
+        print("{:>12.3f} ms/call".format(results[name]["per_call"] * 1000))
+
+    db.conn.close()
+    return results
+
+def git_revision():
+    # The commit the benchmark runs on, if this is a git checkout
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(before, after, threshold=REGRESSION_THRESHOLD):
+    """
+    Print the per-call time of every benchmark in two result files side by side. Return
+    the list of (size, benchmark, ratio) that got slower by more than the threshold.
+
+    Parameters
+    ----------
+    before : dict
+        The results of the reference run
+    after : dict
+        The results of the new run
+    threshold : float
+        The relative slowdown above which a benchmark is reported as a regression
+    """
+
+    regressions = []
+    print("{:<8} {:<20} {:>14} {:>14} {:>8}".format("Cards", "Benchmark", "Before (ms)", "After (ms)", "Ratio"))
+    for size, results in after["results"].items():
+        for name, result in results.items():
+            reference = before["results"].get(size, {}).get(name)
+            if reference is None:
+                continue
+            ratio = result["per_call"] / reference["per_call"] if reference["per_call"] > 0 else float("inf")
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = " REGRESSION"
+                regressions.append((size, name, ratio))
+            print("{:<8} {:<20} {:>14.3f} {:>14.3f} {:>8.2f}{}".format(
+                size, name, reference["per_call"] * 1000, result["per_call"] * 1000, ratio, flag))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Hearthstone database on synthetic catalogs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="catalog sizes, in number of cards")
+    parser.add_argument("--decks", type=int, default=DEFAULT_NUM_DECKS,
+                        help="number of decks in every deck corpus")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="number of repetitions of the query benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", metavar="BENCHMARK",
+                        help="only run these benchmarks, among: " + ", ".join(name for name, _ in BENCHMARKS))
+    parser.add_argument("--workdir", help="where to generate the catalogs (a temporary folder by default)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated catalogs")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="compare two result files instead of running the benchmarks")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                        help="relative slowdown reported as a regression by --compare")
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        with open(args.compare[0], "r") as f:
+            before = json.load(f)
+        with open(args.compare[1], "r") as f:
+            after = json.load(f)
+        regressions = compare(before, after, args.threshold)
+        return 1 if len(regressions) > 0 else 0
+
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix="hsdb_bench_")
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "decks": args.decks,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": {},
+    }
+
+    try:
+        for size in args.sizes:
+            print("{} cards".format(size))
+            report["results"][str(size)] = run_size(workdir, size, args.decks, args.repeat, args.seed, args.only)
+    finally:
+        if not args.keep and args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("Results written to", args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
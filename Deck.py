@@ -1,4 +1,28 @@
 import random
+from collections import Counter
+from DecklistParser import DecklistParser
+
+RARITIES = ("Free", "Common", "Rare", "Epic", "Legendary")
+CARD_TYPES = ("Minion", "Spell", "Weapon")
+
+def diff_decks(old, new):
+    """
+    Return the cards added and removed between two decks, as a dictionary with:
+        - added (dict): card name -> number of copies in new but not in old
+        - removed (dict): card name -> number of copies in old but not in new
+
+    Parameters
+    ----------
+    old : Deck
+        The deck before the change
+    new : Deck
+        The deck after the change
+    """
+
+    return {
+        "added": dict(new.card_counts - old.card_counts),
+        "removed": dict(old.card_counts - new.card_counts),
+    }
 
 class Deck:
     """
@@ -16,18 +40,24 @@ class Deck:
         The class of the hero
     cards : list of str
         A list of card names
+    card_counts : Counter
+        The number of copies of each card name in the deck
+    format_name : str
+        The format the deck is built for (e.g. "Standard"), None for any card
     """
 
-    def __init__(self, db, name=None, hero=None, cards=[]):
+    def __init__(self, db, name=None, hero=None, cards=[], format_name=None):
         """
         Constructor
         """
 
         self.db = db
+        self.format_name = format_name
         self.name = None
         self.hero = None
         self.hero_class = None
         self.cards = []
+        self._reset_statistics()
         
         if name is not None:
             self.set_name(name)
@@ -61,10 +91,12 @@ class Deck:
             The new hero
         """
 
-        if self.db.check_hero(hero):
+        hero_row = self.db.get_hero(hero)
+        if hero_row is not None:
             self.hero = hero
-            self.hero_class = self.db.get_hero_class(hero)
+            self.hero_class = hero_row.class_name
             self.cards = []
+            self._reset_statistics()
             return True
         else:
             print(hero, "is not a valid hero!")
@@ -89,14 +121,15 @@ class Deck:
             return False
 
         for card in cards:
-            if self.db.check_card(card) is False:
+            if self.db.get_card_key(card) is None:
                 print(card, "is not a valid card")
                 return False
-            elif self.db.check_card_class(card, self.hero_class) is False:
+            elif self.db.is_legal(card, self.hero_class, self.format_name) is False:
                 print(card, "does not fit the deck's class")
                 return False
 
         self.cards = [card for card in cards]
+        self._recount_statistics()
 
         return True
 
@@ -114,31 +147,92 @@ class Deck:
             print("Deck is full")
             return False
 
-        if self.db.check_card(card_name) is False:
+        if self.db.get_card_key(card_name) is None:
             print(card_name, "is not a valid card")
+            self.print_suggestions(card_name)
             return False
 
-        if self.db.check_neutral(card_name) is False and self.db.check_card_class(card_name, self.hero_class) is False:
+        if self.db.is_legal(card_name, self.hero_class, self.format_name) is False:
             print(card_name, "does not fit the class of the deck")
             return False
 
         self.cards.append(card_name)
+        self._count_card(card_name, 1)
         
         return True
 
+    def print_suggestions(self, card_name, hero_class=None):
+        """
+        Print the legal cards whose name is close to the given (misspelled) card name.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name that was typed
+        hero_class : str
+            The class whose legal pool is searched, defaults to the class of the deck
+        """
+
+        if hero_class is None:
+            hero_class = self.hero_class
+        suggestions = self.db.suggest_cards(card_name, hero_class, format_name=self.format_name)
+        if len(suggestions) > 0:
+            print("Did you mean:", ", ".join(suggestions) + "?")
+
     def remove_card(self, card_name):
         """
         Remove a card from the deck.
         """
 
         self.cards.remove(card_name)
+        self._count_card(card_name, -1)
 
     def check_card(self, card_name):
         """
         Check if a card is in the deck.
         """
 
-        return card_name in self.cards
+        return card_name in self.card_counts
+
+    def _reset_statistics(self):
+        # Statistics of an empty deck. They are then kept up to date by _count_card on
+        # every card added or removed, for the catalog generation they were computed with.
+        self.card_counts = Counter()
+        self._type_count = {card_type: 0 for card_type in CARD_TYPES}
+        self._mana_curve = [0] * 12  # 0,1,2,3,4,5,6,7,8,9,10,>10
+        self._rarity_count = {rarity: 0 for rarity in RARITIES}
+        self._total_cost = 0
+        self._total_attack = 0
+        self._total_health = 0
+        self._statistics_generation = self.db.generation
+
+    def _recount_statistics(self):
+        # Compute the statistics from scratch, after the whole list of cards was replaced
+        # or the catalog changed
+        self._reset_statistics()
+        for card_name in self.cards:
+            self._count_card(card_name, 1)
+
+    def _count_card(self, card_name, sign):
+        # Add (sign 1) or remove (sign -1) one copy of a card from the statistics
+        self.card_counts[card_name] += sign
+        if self.card_counts[card_name] <= 0:
+            del self.card_counts[card_name]
+
+        info = self.db.get_card_info(card_name)
+        if info is None:
+            return
+
+        # The catalog allows cards without a cost, they count as 0 mana
+        card_cost = info.card_cost or 0
+        if info.card_type in self._type_count:
+            self._type_count[info.card_type] += sign
+        self._mana_curve[min(card_cost, 11)] += sign  # 11 for anything above 10 mana
+        if info.card_rarity in self._rarity_count:
+            self._rarity_count[info.card_rarity] += sign
+        self._total_cost += sign * card_cost
+        self._total_attack += sign * (info.card_attack or 0)
+        self._total_health += sign * (info.card_health or 0)
 
     def get_deck_statistics(self):
         """
@@ -152,50 +246,45 @@ class Deck:
             - Number of weapons (int)
             - Mana curve (list of int)
             - Rarity count (dict)
+            - Average cost (float)
+            - Total attack of the minions and weapons (int)
+            - Total health of the minions (int)
+
+        The statistics are updated as cards are added and removed, so this does not query
+        the database unless the catalog changed since they were computed.
         """
 
+        if self._statistics_generation != self.db.generation:
+            self._recount_statistics()
+
         deck_stats = {}
         deck_stats["deck_name"] = self.name
         deck_stats["hero_name"] = self.hero
         deck_stats["class_name"] = self.hero_class
         deck_stats["num_cards"] = len(self.cards)
-        deck_stats["num_minions"] = 0
-        deck_stats["num_spells"] = 0
-        deck_stats["num_weapons"] = 0
-        deck_stats["mana_curve"] = [0] * 12  # 0,1,2,3,4,5,6,7,8,9,10,>10
-        deck_stats["rarity_count"] = {}
-        deck_stats["rarity_count"]["Free"] = 0
-        deck_stats["rarity_count"]["Common"] = 0
-        deck_stats["rarity_count"]["Rare"] = 0
-        deck_stats["rarity_count"]["Epic"] = 0
-        deck_stats["rarity_count"]["Legendary"] = 0
+        deck_stats["num_minions"] = self._type_count["Minion"]
+        deck_stats["num_spells"] = self._type_count["Spell"]
+        deck_stats["num_weapons"] = self._type_count["Weapon"]
+        deck_stats["mana_curve"] = list(self._mana_curve)
+        deck_stats["rarity_count"] = dict(self._rarity_count)
+        deck_stats["average_cost"] = self._total_cost / len(self.cards) if len(self.cards) > 0 else 0.0
+        deck_stats["total_attack"] = self._total_attack
+        deck_stats["total_health"] = self._total_health
 
-        for card_name in self.cards:
-            card_stats = self.db.get_card_statistics(card_name)
-            
-            if card_stats["type"] == "Minion":
-                deck_stats["num_minions"] += 1
-                mana_cost = card_stats["minion_cost"]
-                rarity = card_stats["minion_rarity"]
-
-            elif card_stats["type"] == "Spell":
-                deck_stats["num_spells"] += 1
-                mana_cost = card_stats["spell_cost"]
-                rarity = card_stats["spell_rarity"]
-
-            elif card_stats["type"] == "Weapon":
-                deck_stats["num_weapons"] += 1
-                mana_cost = card_stats["weapon_cost"]
-                rarity = card_stats["weapon_rarity"]
-
-            if mana_cost <= 10:
-                deck_stats["mana_curve"][mana_cost] += 1
-            else:
-                deck_stats["mana_curve"][11] += 1  # for anything above 10 mana
+        return deck_stats
 
-            deck_stats["rarity_count"][rarity] += 1
+    def diff(self, other):
+        """
+        Return the cards added and removed to go from this deck to the other one, see
+        diff_decks.
 
-        return deck_stats
+        Parameters
+        ----------
+        other : Deck
+            The other deck
+        """
+
+        return diff_decks(self, other)
 
     def print_deck_statistics(self):
         """
@@ -212,6 +301,8 @@ class Deck:
             print("Hero:", stats["hero_name"])
             print("Class:", stats["class_name"])
             print("Number of cards:", stats["num_cards"])
+            print("Average cost: {:.2f}".format(stats["average_cost"]))
+            print("Total attack:", stats["total_attack"], " Total health:", stats["total_health"])
             print("")
             
             # Number of minions, spells, and weapons in the deck
@@ -256,7 +347,7 @@ class Deck:
 
             if hero_class is not None:
                 if self.db.check_class(hero_class):
-                    valid_heroes = self.db.get_heroes(hero_class=hero_class)
+                    valid_heroes = self.db.get_heroes(class_name=hero_class)
                 else:
                     print(hero_class, "is not a valid class")
                     return
@@ -274,17 +365,20 @@ class Deck:
             self.name += " "
             self.name += str(random.randint(1,10000))
 
-        # Set cards
-        valid_cards = self.db.get_cards(class_name=self.hero_class) + self.db.get_cards(class_name="Neutral")
+        # Set cards, from the legal pool of the class (class cards and neutral cards)
+        valid_cards = self.db.get_pool_cards(self.hero_class, self.format_name)
         while len(self.cards) < card_count:
             # Choose a random card
             random_card = random.choice(valid_cards)
 
             self.cards.append(random_card)
+            self._count_card(random_card, 1)
 
     def generate_deck_from_text_file(self, textfile):
         """
-        Fill out the deck from the content of the given text file.
+        Fill out the deck from the content of the given text file, see DecklistParser for
+        the format. Every problem found in the file is printed with its line number.
+        Return True if the file has no error, return False otherwise.
 
         Parameters
         ----------
@@ -292,56 +386,21 @@ class Deck:
             Path to the .txt file
         """
 
-        try:
-            with open(textfile, "r") as f:
-                # Read deck name
-                line = f.readline()
-                deck_name = " ".join(line.split()[1:])
-
-                # Read class name
-                line = f.readline()
-                class_name = " ".join(line.split()[1:])
-
-                # Read hero name
-                line = f.readline()
-                hero_name = " ".join(line.split()[1:])
-
-                if self.db.check_hero(hero_name) == False:
-                    print("Invalid hero:", hero_name)
-                    return False
-
-                hero_class = self.db.get_hero_class(hero_name)
-                if hero_class.lower() != class_name.lower():
-                    print("Invalid class:", class_name)
-                    return False
-
-                # Read cards
-                card_names = []
-                for line in f:
-                    card_name = line.strip()
-                    if self.db.check_card(card_name) == False:
-                        print("Invalid card:", card_name)
-                        return False
-                    elif self.db.check_neutral(card_name) == False and self.db.check_card_class(card_name, hero_class) == False:
-                        print("Invalid card (wrong class):", card_name)
-                        return False
-                    card_names.append(card_name)
-
-                if len(card_names) > 30:
-                    print("Too many cards in deck")
-                    return False
-
-                # Everything is valid, replace deck information
-                self.name = deck_name
-                self.hero = hero_name
-                self.hero_class = hero_class
-                self.cards = card_names
-
-                return True
-        except:
-            print("Error while reading text file")
+        parsed = DecklistParser(self.db, format_name=self.format_name).parse_file(textfile)
+        for line in parsed.format_diagnostics():
+            print(line)
+        if not parsed.ok:
             return False
 
+        # Everything is valid, replace deck information
+        self.name = parsed.name
+        self.hero = parsed.hero
+        self.hero_class = parsed.class_name
+        self.cards = parsed.cards
+        self._recount_statistics()
+
+        return True
+
     def __str__(self):
         """
         Conversion to string, e.g. when the print() function is called
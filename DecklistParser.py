@@ -0,0 +1,286 @@
+"""
+Strict parser of decklist text files, see data/deck_format.txt, extended with card counts
+and comments:
+
+    # Comments start with '#' or '//', blank lines are ignored
+    Name My Deck
+    Class Mage
+    Hero Medivh
+    2x Frostbolt          # "2x Frostbolt", "2 Frostbolt" and "Frostbolt x2" are the same
+    Archmage Antonidas
+
+The header lines (Name, Class and Hero) can come in any order, before the first card.
+Lines are split with string methods only, card names are resolved with the in-memory
+card index of HSDB, and every problem is reported with its line number instead of
+stopping at the first one.
+"""
+
+from collections import namedtuple
+
+MAX_CARDS = 30
+MAX_COPIES = 2
+MAX_LEGENDARY_COPIES = 1
+HEADER_KEYS = ("name", "class", "hero")
+
+# A problem found in a decklist. Line 0 is for problems with the whole file.
+Diagnostic = namedtuple("Diagnostic", ["line", "severity", "message"])
+
+def _strip_comment(line):
+    # Remove a full line or trailing comment. A trailing comment needs a space before
+    # its marker, so that names are never cut.
+    stripped = line.strip()
+    if stripped.startswith("#") or stripped.startswith("//"):
+        return ""
+    for marker in (" #", " //"):
+        position = stripped.find(marker)
+        if position >= 0:
+            stripped = stripped[:position].rstrip()
+    return stripped
+
+def _is_count(token):
+    # "2" or "2x"/"2X"
+    if token[-1:] in ("x", "X"):
+        token = token[:-1]
+    return token.isdigit()
+
+def _split_count(text):
+    # Return (count, name), count being None if the line has no count
+    parts = text.split(None, 1)
+    if len(parts) == 2 and _is_count(parts[0]):
+        return int(parts[0].rstrip("xX")), parts[1].strip()
+    parts = text.rsplit(None, 1)
+    if len(parts) == 2 and parts[1][:1] in ("x", "X") and parts[1][1:].isdigit():
+        return int(parts[1][1:]), parts[0].strip()
+    return None, text
+
+def split_decklist(text, parsed=None):
+    """
+    Split the text of a decklist into its header and card lines, without checking anything
+    against the database. Comments and blank lines are dropped, and header lines given
+    twice are ignored (with a warning added to parsed, if not None).
+
+    Returns (header, header_lines, card_lines): lower case header key -> value, lower case
+    header key -> line number, and a list of (line number, count, card name), count being
+    None if the line has no count.
+
+    Parameters
+    ----------
+    text : str
+        The decklist
+    parsed : ParsedDeck
+        Where to report the ignored header lines, or None
+    """
+
+    header = {}
+    header_lines = {}
+    card_lines = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = _strip_comment(line)
+        if line == "":
+            continue
+
+        parts = line.split(None, 1)
+        key = parts[0].lower()
+        if len(card_lines) == 0 and key in HEADER_KEYS:
+            if key in header:
+                if parsed is not None:
+                    parsed.warning(number, "{} is given again, line {} is ignored".format(parts[0], number))
+                continue
+            header[key] = parts[1].strip() if len(parts) == 2 else ""
+            header_lines[key] = number
+            continue
+        count, name = _split_count(line)
+        card_lines.append((number, count, name))
+    return header, header_lines, card_lines
+
+class ParsedDeck:
+    """
+    The result of parsing a decklist.
+
+    Attributes
+    ----------
+    source : str
+        Where the decklist comes from, e.g. the file path
+    name : str
+        The deck name, None if missing
+    class_name : str
+        The class, as spelled in the database, None if missing or unknown
+    hero : str
+        The hero, None if missing or unknown
+    cards : list of str
+        The card names, as spelled in the database, one per copy
+    diagnostics : list of Diagnostic
+        Every error and warning, in line order
+    """
+
+    def __init__(self, source=None):
+        """
+        Constructor
+        """
+
+        self.source = source
+        self.name = None
+        self.class_name = None
+        self.hero = None
+        self.cards = []
+        self.diagnostics = []
+
+    @property
+    def ok(self):
+        """
+        True if the decklist has no error (it may have warnings).
+        """
+
+        return all(diagnostic.severity != "error" for diagnostic in self.diagnostics)
+
+    def error(self, line, message):
+        self.diagnostics.append(Diagnostic(line, "error", message))
+
+    def warning(self, line, message):
+        self.diagnostics.append(Diagnostic(line, "warning", message))
+
+    def format_diagnostics(self):
+        """
+        Return the diagnostics as lines of text: "source:line: severity: message".
+        """
+
+        source = self.source if self.source is not None else "<decklist>"
+        return ["{}:{}: {}: {}".format(source, diagnostic.line, diagnostic.severity, diagnostic.message)
+                for diagnostic in self.diagnostics]
+
+class DecklistParser:
+    """
+    A class that parses decklists and checks them against the database.
+
+    Attributes
+    ----------
+    db : HSDB
+        A reference to the Hearthstone database
+    max_cards : int
+        The maximum number of cards in a deck
+    suggest : bool
+        Add "did you mean" suggestions to unknown card errors
+    format_name : str
+        If not None, every card must be part of this format (e.g. "Standard")
+    """
+
+    def __init__(self, db, max_cards=MAX_CARDS, suggest=True, format_name=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        db : HSDB
+            A reference to the Hearthstone database
+        max_cards : int
+            The maximum number of cards in a deck
+        suggest : bool
+            Add "did you mean" suggestions to unknown card errors
+        format_name : str
+            If not None, every card must be part of this format (e.g. "Standard")
+        """
+
+        self.db = db
+        self.max_cards = max_cards
+        self.suggest = suggest
+        self.format_name = format_name
+
+    def parse_file(self, path):
+        """
+        Parse a decklist file and return a ParsedDeck.
+
+        Parameters
+        ----------
+        path : str
+            Path to the .txt file
+        """
+
+        try:
+            with open(path, "r", encoding="utf-8-sig") as f:
+                text = f.read()
+        except (OSError, UnicodeDecodeError) as e:
+            parsed = ParsedDeck(path)
+            parsed.error(0, "cannot read the file: {}".format(e))
+            return parsed
+        return self.parse_text(text, path)
+
+    def parse_text(self, text, source=None):
+        """
+        Parse the text of a decklist and return a ParsedDeck.
+
+        Parameters
+        ----------
+        text : str
+            The decklist
+        source : str
+            Where the decklist comes from, used in the diagnostics
+        """
+
+        parsed = ParsedDeck(source)
+        header, header_lines, card_lines = split_decklist(text, parsed)
+        self._check_header(parsed, header, header_lines)
+        self._check_cards(parsed, card_lines)
+        parsed.diagnostics.sort(key=lambda diagnostic: diagnostic.line)
+        return parsed
+
+    def _check_header(self, parsed, header, header_lines):
+        for key in HEADER_KEYS:
+            if header.get(key, "") == "":
+                parsed.error(header_lines.get(key, 0), "missing {} line".format(key.capitalize()))
+
+        parsed.name = header.get("name") or None
+        hero = header.get("hero")
+        if not hero:
+            return
+        hero_row = self.db.get_hero(hero)
+        if hero_row is None:
+            parsed.error(header_lines["hero"], "unknown hero '{}'".format(hero))
+            return
+
+        parsed.hero = hero
+        hero_class = hero_row.class_name
+        class_name = header.get("class")
+        if class_name and class_name.lower() != hero_class.lower():
+            parsed.error(header_lines["class"], "{} is a {} hero, not {}".format(hero, hero_class, class_name))
+            return
+        parsed.class_name = hero_class
+
+    def _check_cards(self, parsed, card_lines):
+        copies = {}
+        for number, count, name in card_lines:
+            if count is None:
+                count = 1
+            elif count == 0:
+                parsed.warning(number, "0 copies of {}, the line is ignored".format(name))
+                continue
+            elif count > self.max_cards:
+                parsed.error(number, "{} copies of {}, a deck has at most {} cards".format(count, name, self.max_cards))
+                continue
+
+            info = self.db.get_card_info(name)
+            if info is None:
+                message = "unknown card '{}'".format(name)
+                if self.suggest:
+                    suggestions = self.db.suggest_cards(name, parsed.class_name, format_name=self.format_name)
+                    if len(suggestions) > 0:
+                        message += " (did you mean: {}?)".format(", ".join(suggestions))
+                parsed.error(number, message)
+                continue
+
+            if parsed.class_name is not None and not self.db.is_legal(info.card_name, parsed.class_name):
+                parsed.error(number, "{} cannot be played by {}".format(info.card_name, parsed.class_name))
+                continue
+
+            if self.format_name is not None and not self.db.check_card(info.card_name, self.format_name):
+                parsed.error(number, "{} is not legal in {}".format(info.card_name, self.format_name))
+                continue
+
+            total = copies.get(info.card_name, 0) + count
+            limit = MAX_LEGENDARY_COPIES if info.card_rarity == "Legendary" else MAX_COPIES
+            if total > limit and copies.get(info.card_name, 0) <= limit:
+                parsed.warning(number, "{} copies of {}, the limit is {}".format(total, info.card_name, limit))
+            copies[info.card_name] = total
+            parsed.cards.extend([info.card_name] * count)
+
+        if len(parsed.cards) > self.max_cards:
+            parsed.error(card_lines[-1][0], "{} cards, a deck has at most {}".format(len(parsed.cards), self.max_cards))
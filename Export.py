@@ -0,0 +1,519 @@
+"""
+Bulk columnar export of the card catalog, the keyword mapping and decks.
+
+Two formats are supported:
+    - "hscol", a self-describing binary column format that needs nothing but the standard
+      library, and that ColumnReader maps into memory to read back without copying
+    - "parquet", through pyarrow, which is only imported when this format is used
+
+Rows are buffered and written in row groups of chunk_size rows, so an export never holds
+more than one row group in memory.
+
+    python Export.py exports --format hscol --decks decks/*.txt
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+import argparse
+from array import array
+from HSDB import HSDB
+from Deck import Deck
+
+# File layout
+# -----------
+# header    : magic (8s), version (I), byte order (I)
+# row groups: for every row group, the buffers of every column, each aligned on 8 bytes
+#             int64 / float64 columns: one array of values
+#             string columns: offsets (int64, one more than the number of rows) + utf-8 data
+# footer    : JSON with the schema and the offset and length of every buffer
+# trailer   : footer length (Q), magic (8s)
+#
+# The footer is written last, so rows can be streamed to the file without knowing how many
+# there will be. Buffers are in the native byte order of the machine that wrote them.
+MAGIC = b"HSDBCOLS"
+VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_TRAILER = struct.Struct("<Q8s")
+_BYTE_ORDER = 1 if sys.byteorder == "little" else 2
+_ALIGNMENT = 8
+
+# The value stored in integer columns for missing values (e.g. the attack of a spell)
+NO_VALUE = -1
+
+DEFAULT_CHUNK_SIZE = 65536
+TYPECODES = {"int64": "q", "float64": "d"}
+
+# Schemas of the exported tables, as (column name, type) pairs
+CARD_SCHEMA = [("card_key", "int64"), ("card_name", "string"), ("card_type", "string"), ("card_cost", "int64"),
+               ("card_rarity", "string"), ("card_attack", "int64"), ("card_health", "int64")]
+KEYWORD_CARD_SCHEMA = [("card_key", "int64"), ("card_name", "string"), ("keyword_name", "string")]
+DECK_SCHEMA = [("deck_id", "int64"), ("deck_name", "string"), ("hero_name", "string"), ("class_name", "string"),
+               ("card_name", "string"), ("copies", "int64")]
+
+class ColumnWriter:
+    """
+    A class that streams rows to a file of the hscol format.
+
+    Attributes
+    ----------
+    path : str
+        The path to the file
+    schema : list of (str, str)
+        (column name, type) pairs, the type being "int64", "float64" or "string"
+    chunk_size : int
+        The number of rows per row group
+    num_rows : int
+        The number of rows written so far
+    """
+
+    def __init__(self, path, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Constructor, create the file. It is written to a temporary file that replaces path
+        when the writer is closed, so readers never see a half written file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file
+        schema : list of (str, str)
+            (column name, type) pairs
+        chunk_size : int
+            The number of rows per row group
+        """
+
+        for name, column_type in schema:
+            if column_type != "string" and column_type not in TYPECODES:
+                raise ValueError("Unknown type {} of column {}".format(column_type, name))
+
+        self.path = path
+        self.schema = list(schema)
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+        self._rows = []
+        self._row_groups = []
+        self._temporary = path + ".tmp"
+        self._file = open(self._temporary, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, _BYTE_ORDER))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_buffer(self, data):
+        # Write one buffer on an aligned offset and return its (offset, length)
+        padding = -self._file.tell() % _ALIGNMENT
+        self._file.write(b"\0" * padding)
+        offset = self._file.tell()
+        self._file.write(data)
+        return offset, len(data)
+
+    def _flush(self):
+        # Write the buffered rows as one row group
+        if len(self._rows) == 0:
+            return
+        buffers = []
+        for i, (name, column_type) in enumerate(self.schema):
+            if column_type == "string":
+                offsets = array("q", [0])
+                data = bytearray()
+                for row in self._rows:
+                    value = row[i]
+                    if value is not None:
+                        data += value.encode("utf-8")
+                    offsets.append(len(data))
+                buffers.append([self._write_buffer(offsets.tobytes()), self._write_buffer(bytes(data))])
+            else:
+                values = array(TYPECODES[column_type], (NO_VALUE if row[i] is None else row[i] for row in self._rows))
+                buffers.append([self._write_buffer(values.tobytes())])
+        self._row_groups.append({"rows": len(self._rows), "buffers": buffers})
+        self._rows = []
+
+    def write(self, row):
+        """
+        Write one row.
+
+        Parameters
+        ----------
+        row : tuple
+            The values, in the order of the schema, None for a missing value
+        """
+
+        self._rows.append(row)
+        self.num_rows += 1
+        if len(self._rows) >= self.chunk_size:
+            self._flush()
+
+    def write_rows(self, rows):
+        """
+        Write every row of an iterable.
+
+        Parameters
+        ----------
+        rows : iterable of tuple
+            The rows
+        """
+
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        """
+        Write the last row group and the footer, and move the file into place.
+        """
+
+        if self._file is None:
+            return
+        self._flush()
+        footer = json.dumps({
+            "schema": [{"name": name, "type": column_type} for name, column_type in self.schema],
+            "null_value": NO_VALUE,
+            "rows": self.num_rows,
+            "row_groups": self._row_groups,
+        }).encode("utf-8")
+        self._file.write(footer)
+        self._file.write(_TRAILER.pack(len(footer), MAGIC))
+        self._file.close()
+        self._file = None
+        os.replace(self._temporary, self.path)
+
+    def abort(self):
+        """
+        Stop writing and delete the temporary file.
+        """
+
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        os.remove(self._temporary)
+
+class ParquetWriter:
+    """
+    A class that streams rows to a Parquet file with pyarrow, with the same interface as
+    ColumnWriter. Every chunk of rows is written as one row group.
+    """
+
+    def __init__(self, path, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        path : str
+            The path to the file
+        schema : list of (str, str)
+            (column name, type) pairs
+        chunk_size : int
+            The number of rows per row group
+        """
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet format needs pyarrow (pip install pyarrow)")
+
+        types = {"int64": pyarrow.int64(), "float64": pyarrow.float64(), "string": pyarrow.string()}
+        self._pyarrow = pyarrow
+        self.path = path
+        self.schema = list(schema)
+        self.chunk_size = chunk_size
+        self.num_rows = 0
+        self._rows = []
+        self._arrow_schema = pyarrow.schema([(name, types[column_type]) for name, column_type in schema])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._arrow_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _flush(self):
+        if len(self._rows) == 0:
+            return
+        columns = [self._pyarrow.array([row[i] for row in self._rows], type=field.type)
+                   for i, field in enumerate(self._arrow_schema)]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(columns, schema=self._arrow_schema))
+        self._rows = []
+
+    def write(self, row):
+        self._rows.append(row)
+        self.num_rows += 1
+        if len(self._rows) >= self.chunk_size:
+            self._flush()
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def close(self):
+        if self._writer is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+
+class StringColumn:
+    """
+    A string column of one row group, read from the memory mapping. The strings are only
+    decoded when they are accessed.
+    """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return str(self.data[self.offsets[index]:self.offsets[index + 1]], "utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+class ColumnReader:
+    """
+    A memory-mapped reader of the hscol format. Numeric columns are memoryviews over the
+    mapping, so nothing is copied until the values are used.
+
+    Attributes
+    ----------
+    path : str
+        The path to the file
+    schema : list of (str, str)
+        (column name, type) pairs
+    num_rows : int
+        The number of rows
+    num_row_groups : int
+        The number of row groups
+    """
+
+    def __init__(self, path):
+        """
+        Constructor, map the given file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the file
+        """
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._views = []
+
+        magic, version, byte_order = _HEADER.unpack_from(self._buffer, 0)
+        footer_length, trailer_magic = _TRAILER.unpack_from(self._buffer, len(self._buffer) - _TRAILER.size)
+        if magic != MAGIC or trailer_magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a column file".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("{} has column file version {}, expected {}".format(path, version, VERSION))
+        if byte_order != _BYTE_ORDER:
+            self.close()
+            raise ValueError("{} was written on a machine with a different byte order".format(path))
+
+        footer_end = len(self._buffer) - _TRAILER.size
+        footer = json.loads(bytes(self._buffer[footer_end - footer_length:footer_end]))
+        self.schema = [(column["name"], column["type"]) for column in footer["schema"]]
+        self.null_value = footer["null_value"]
+        self.num_rows = footer["rows"]
+        self._row_groups = footer["row_groups"]
+        self.num_row_groups = len(self._row_groups)
+        self._index = {name: i for i, (name, _) in enumerate(self.schema)}
+
+    def close(self):
+        """
+        Release the memory mapping.
+        """
+
+        for view in self._views:
+            view.release()
+        self._views = []
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _view(self, buffer, typecode):
+        offset, length = buffer
+        view = self._buffer[offset:offset + length].cast(typecode)
+        self._views.append(view)
+        return view
+
+    def column(self, name, row_group=0):
+        """
+        Return one column of one row group: a memoryview (no copy) for numeric columns, a
+        StringColumn for string columns.
+
+        Parameters
+        ----------
+        name : str
+            The name of the column
+        row_group : int
+            The index of the row group
+        """
+
+        i = self._index[name]
+        buffers = self._row_groups[row_group]["buffers"][i]
+        column_type = self.schema[i][1]
+        if column_type == "string":
+            return StringColumn(self._view(buffers[0], "q"), self._view(buffers[1], "B"))
+        return self._view(buffers[0], TYPECODES[column_type])
+
+    def iter_rows(self):
+        """
+        Iterate over the rows as tuples, row group by row group. Missing integer values
+        are None.
+        """
+
+        for row_group in range(self.num_row_groups):
+            columns = []
+            for name, column_type in self.schema:
+                column = self.column(name, row_group)
+                if column_type == "int64":
+                    column = [None if value == self.null_value else value for value in column]
+                columns.append(column)
+            yield from zip(*columns)
+
+def open_writer(path, schema, file_format="hscol", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Return a ColumnWriter or a ParquetWriter for the given format.
+
+    Parameters
+    ----------
+    path : str
+        The path to the file
+    schema : list of (str, str)
+        (column name, type) pairs
+    file_format : str
+        "hscol" or "parquet"
+    chunk_size : int
+        The number of rows per row group
+    """
+
+    if file_format == "hscol":
+        return ColumnWriter(path, schema, chunk_size)
+    if file_format == "parquet":
+        return ParquetWriter(path, schema, chunk_size)
+    raise ValueError("Unknown format {}, must be hscol or parquet".format(file_format))
+
+def export_cards(db, path, file_format="hscol", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export the card catalog, streamed from the database, and return the number of rows.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    path : str
+        The path to the file
+    file_format : str
+        "hscol" or "parquet"
+    chunk_size : int
+        The number of rows per row group
+    """
+
+    with open_writer(path, CARD_SCHEMA, file_format, chunk_size) as writer:
+        writer.write_rows(db.iter_card_info())
+    return writer.num_rows
+
+def export_keyword_cards(db, path, file_format="hscol", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export the (card, keyword) pairs, streamed from the database, and return the number of
+    rows.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    path : str
+        The path to the file
+    file_format : str
+        "hscol" or "parquet"
+    chunk_size : int
+        The number of rows per row group
+    """
+
+    with open_writer(path, KEYWORD_CARD_SCHEMA, file_format, chunk_size) as writer:
+        for row in db.iter_cards_by_keyword(db.get_keywords()):
+            writer.write((row.card_key, row.card_name, row.keyword_name))
+    return writer.num_rows
+
+def export_decks(decks, path, file_format="hscol", chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Export decks with one row per (deck, card) and the number of copies, and return the
+    number of rows. The decks are consumed one at a time, so they can come from a
+    generator.
+
+    Parameters
+    ----------
+    decks : iterable of Deck
+        The decks, e.g. App.decks
+    path : str
+        The path to the file
+    file_format : str
+        "hscol" or "parquet"
+    chunk_size : int
+        The number of rows per row group
+    """
+
+    with open_writer(path, DECK_SCHEMA, file_format, chunk_size) as writer:
+        for deck_id, deck in enumerate(decks):
+            for card_name, copies in deck.card_counts.items():
+                writer.write((deck_id, deck.name, deck.hero, deck.hero_class, card_name, copies))
+    return writer.num_rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the catalog and decks to columnar files")
+    parser.add_argument("directory", help="where to write cards, keyword_cards and decks files")
+    parser.add_argument("--db", default="data/hs.sqlite", help="the database file")
+    parser.add_argument("--format", choices=["hscol", "parquet"], default="hscol")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per row group")
+    parser.add_argument("--decks", nargs="*", default=[], help="deck text files to export")
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db, read_only=True)
+    os.makedirs(args.directory, exist_ok=True)
+
+    def decks():
+        for path in args.decks:
+            deck = Deck(db)
+            if deck.generate_deck_from_text_file(path):
+                yield deck
+
+    for table, export, source in (("cards", export_cards, db), ("keyword_cards", export_keyword_cards, db),
+                                  ("decks", export_decks, decks())):
+        path = os.path.join(args.directory, "{}.{}".format(table, args.format))
+        try:
+            rows = export(source, path, args.format, args.chunk_size)
+        except ImportError as e:
+            print("Error in export:", e)
+            return 1
+        print("{:<15} {} rows -> {}".format(table, rows, path))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
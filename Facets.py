@@ -0,0 +1,224 @@
+RARITY_ORDER = {"free": 0, "common": 1, "rare": 2, "epic": 3, "legendary": 4}
+
+# Position of every set bit in a byte, used to list the cards of a bitmap
+_BYTE_POSITIONS = [[bit for bit in range(8) if byte >> bit & 1] for byte in range(256)]
+
+# Attributes that can be filtered on and counted. Numeric ones accept ranges.
+NUMERIC_FACETS = ("cost", "attack", "health")
+TEXT_FACETS = ("rarity", "type", "class", "keyword")
+SORT_KEYS = ("name", "cost", "attack", "health", "rarity", "type", "card_key")
+
+def positions(bitmap):
+    """
+    Return the positions of the set bits of a bitmap, in increasing order.
+
+    Parameters
+    ----------
+    bitmap : int
+        The bitmap
+    """
+
+    result = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for offset, byte in enumerate(data):
+        if byte:
+            base = offset * 8
+            for bit in _BYTE_POSITIONS[byte]:
+                result.append(base + bit)
+    return result
+
+class FacetIndex:
+    """
+    An in-memory index of the card catalog with one bitmap per attribute value.
+
+    Bit i of a bitmap is set if the card at row i has that value, so a filter is a few
+    AND/OR operations on Python integers, and the count of a facet value within the
+    result is the number of bits of (result & bitmap).
+
+    Attributes
+    ----------
+    cards : list of dict
+        The cards, by row: card_key, name, cost, rarity, type, attack, health, classes
+        and keywords
+    bitmaps : dict
+        Value -> bitmap, by attribute. Text values are lower case.
+    labels : dict
+        Lower case value -> value as spelled in the catalog, by text attribute
+    all : int
+        The bitmap with every card
+    """
+
+    def __init__(self, cards):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        cards : list of dict
+            The cards, with the keys card_key, name, cost, rarity, type, attack, health,
+            classes (list of str) and keywords (list of str)
+        """
+
+        self.cards = cards
+        self.bitmaps = {facet: {} for facet in NUMERIC_FACETS + TEXT_FACETS}
+        self.labels = {facet: {} for facet in TEXT_FACETS}
+        self.all = (1 << len(cards)) - 1
+        self._lower_names = [card["name"].lower() for card in cards]
+
+        for row, card in enumerate(cards):
+            bit = 1 << row
+            for facet in NUMERIC_FACETS:
+                value = card[facet]
+                if value is not None:
+                    self.bitmaps[facet][value] = self.bitmaps[facet].get(value, 0) | bit
+            for facet, values in (("rarity", [card["rarity"]]), ("type", [card["type"]]),
+                                  ("class", card["classes"]), ("keyword", card["keywords"])):
+                for value in values:
+                    key = value.lower()
+                    self.labels[facet].setdefault(key, value)
+                    self.bitmaps[facet][key] = self.bitmaps[facet].get(key, 0) | bit
+
+    def __len__(self):
+        return len(self.cards)
+
+    def _numeric(self, facet, predicate):
+        # int: equality, (low, high): inclusive range with None for an open end,
+        # list/set: any of the values
+        bitmaps = self.bitmaps[facet]
+        if isinstance(predicate, tuple):
+            low, high = predicate
+            result = 0
+            for value, bitmap in bitmaps.items():
+                if (low is None or value >= low) and (high is None or value <= high):
+                    result |= bitmap
+            return result
+        if isinstance(predicate, (list, set, frozenset)):
+            result = 0
+            for value in predicate:
+                result |= bitmaps.get(value, 0)
+            return result
+        return bitmaps.get(predicate, 0)
+
+    def _text(self, facet, predicate):
+        # str: equality (case insensitive), list/set: any of the values
+        bitmaps = self.bitmaps[facet]
+        if isinstance(predicate, str):
+            return bitmaps.get(predicate.lower(), 0)
+        result = 0
+        for value in predicate:
+            result |= bitmaps.get(value.lower(), 0)
+        return result
+
+    def filter(self, name=None, cost=None, attack=None, health=None, rarity=None, card_type=None,
+               class_name=None, keywords=None, keywords_any=None):
+        """
+        Return the bitmap of the cards that match every given predicate.
+
+        Parameters
+        ----------
+        name : str
+            Full or partial card name (case insensitive)
+        cost, attack, health : int, (int, int) or list of int
+            A value, an inclusive (low, high) range where None is an open end, or a set
+            of values
+        rarity, card_type, class_name : str or list of str
+            A value or a set of values
+        keywords : str or list of str
+            The cards must have all of these keywords
+        keywords_any : list of str
+            The cards must have at least one of these keywords
+        """
+
+        result = self.all
+        for facet, predicate in (("cost", cost), ("attack", attack), ("health", health)):
+            if predicate is not None:
+                result &= self._numeric(facet, predicate)
+        for facet, predicate in (("rarity", rarity), ("type", card_type), ("class", class_name)):
+            if predicate is not None:
+                result &= self._text(facet, predicate)
+        if keywords is not None:
+            for keyword in ([keywords] if isinstance(keywords, str) else keywords):
+                result &= self.bitmaps["keyword"].get(keyword.lower(), 0)
+        if keywords_any is not None:
+            result &= self._text("keyword", keywords_any)
+        if name is not None and result:
+            # Substring match, only over the cards that are still in the result
+            name = name.lower()
+            matches = 0
+            for row in positions(result):
+                if name in self._lower_names[row]:
+                    matches |= 1 << row
+            result = matches
+        return result
+
+    def facet_counts(self, bitmap, facets=NUMERIC_FACETS + TEXT_FACETS):
+        """
+        Return, for every facet, the number of cards of the bitmap with each value.
+        Values with no card are left out.
+
+        Parameters
+        ----------
+        bitmap : int
+            The cards to count, usually the result of filter
+        facets : tuple of str
+            The facets to count
+        """
+
+        counts = {}
+        for facet in facets:
+            counts[facet] = {}
+            for value, values_bitmap in self.bitmaps[facet].items():
+                count = (bitmap & values_bitmap).bit_count()
+                if count > 0:
+                    label = self.labels[facet][value] if facet in self.labels else value
+                    counts[facet][label] = count
+        return counts
+
+    def _sort_key(self, sort_by):
+        if sort_by == "rarity":
+            return lambda row: (RARITY_ORDER.get(self.cards[row]["rarity"].lower(), len(RARITY_ORDER)), self._lower_names[row])
+        if sort_by == "name":
+            return lambda row: self._lower_names[row]
+        if sort_by == "type":
+            return lambda row: (self.cards[row]["type"], self._lower_names[row])
+        if sort_by == "card_key":
+            return lambda row: self.cards[row]["card_key"]
+        # Numeric attributes, cards without a value (e.g. the attack of a spell) go last
+        return lambda row: (self.cards[row][sort_by] is None, self.cards[row][sort_by] or 0, self._lower_names[row])
+
+    def query(self, sort_by="name", descending=False, offset=0, limit=None, facets=NUMERIC_FACETS + TEXT_FACETS, **predicates):
+        """
+        Filter, count facets, sort and paginate in one call. Return a dictionary with:
+            - total (int): the number of matching cards
+            - cards (list of dict): the requested page of matching cards
+            - facets (dict): the facet counts of all the matching cards
+
+        Parameters
+        ----------
+        sort_by : str
+            One of "name", "cost", "attack", "health", "rarity", "type" or "card_key"
+        descending : bool
+            Sort in descending order
+        offset : int
+            The number of matching cards to skip
+        limit : int
+            The maximum number of cards returned, None for all of them
+        facets : tuple of str
+            The facets to count, empty for none
+        predicates
+            The predicates of filter
+        """
+
+        if sort_by not in SORT_KEYS:
+            raise ValueError("Cannot sort by {}, must be one of {}".format(sort_by, ", ".join(SORT_KEYS)))
+
+        bitmap = self.filter(**predicates)
+        rows = positions(bitmap)
+        rows.sort(key=self._sort_key(sort_by), reverse=descending)
+        end = None if limit is None else offset + limit
+
+        return {
+            "total": len(rows),
+            "cards": [self.cards[row] for row in rows[offset:end]],
+            "facets": self.facet_counts(bitmap, facets),
+        }
@@ -0,0 +1,404 @@
+"""
+Memory footprint of the catalog caches and of decks.
+
+Two measures are reported side by side:
+    - bytes: a sys.getsizeof walk of the object and of everything it references, each
+      object counted once. It is what the object holds, including strings shared with
+      other caches.
+    - allocated: what tracemalloc saw being allocated (and kept) while the object was
+      built. It is what the object actually added to the process, shared strings and
+      small integers excluded.
+
+The representations of a deck (a list of name strings as parsed from a file, a list of
+the catalog's own name strings, a list of card keys or an array of card keys) are
+compared the same way. Every run can be appended to a JSON lines file to follow the
+footprint over time:
+
+    python Footprint.py data/hs.sqlite --decks 1000 --history footprint.jsonl
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+import types
+from array import array
+from HSDB import HSDB
+from Deck import Deck
+
+DEFAULT_NUM_DECKS = 100
+DECK_SIZE = 30
+
+# (name, attribute of HSDB, function that fills the cache) of the catalog caches, in the
+# order they are built
+CACHES = (
+    ("card_keys", "_card_keys", lambda db: db.get_card_key("")),
+    ("card_info", "_card_info", lambda db: db.get_card_info("")),
+    ("pools", "_pools", lambda db: db.get_pool_ids("")),
+    ("heroes", "_heroes", lambda db: db.get_hero_registry()),
+    ("facets", "_facets", lambda db: db.get_facet_index()),
+    ("name_index", "_name_indexes", lambda db: db.autocomplete("")),
+    ("bk_tree", "_bk_trees", lambda db: db.suggest_cards("a")),
+    ("result_cache", "result_cache", lambda db: [db.get_cards(card_cost=cost) for cost in range(11)]),
+)
+
+# Objects that are part of the program rather than of the data, never counted
+_CODE_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+def deep_size(obj, seen=None, skip=()):
+    """
+    Return the size in bytes of an object and of everything it references (containers,
+    instance attributes and slots), each object counted once. Classes, functions and
+    modules are not counted, neither are None and booleans.
+
+    Parameters
+    ----------
+    obj : object
+        The object
+    seen : set of int
+        The ids of the objects already counted, shared between calls to count objects
+        referenced from several places only once. Updated in place.
+    skip : tuple of object
+        Objects that are not counted nor walked, e.g. the HSDB referenced by a Deck
+    """
+
+    if seen is None:
+        seen = set()
+    seen.update(id(skipped) for skipped in skip)
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        obj = stack.pop()
+        if id(obj) in seen or obj is None or isinstance(obj, (bool, _CODE_TYPES)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, (str, bytes, int, float, array)):
+            continue
+        else:
+            if hasattr(obj, "__dict__"):
+                stack.append(obj.__dict__)
+            for cls in type(obj).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(obj, slot):
+                        stack.append(getattr(obj, slot))
+    return size
+
+def _traced():
+    # Current traced memory, tracemalloc must be running
+    return tracemalloc.get_traced_memory()[0]
+
+def _entries(cache):
+    try:
+        return len(cache)
+    except TypeError:
+        return 1
+
+def catalog_footprint(db):
+    """
+    Rebuild every in-memory cache of the catalog (see CACHES) and return what each one
+    costs, as a dictionary with:
+        - cards (int): the number of cards of the catalog
+        - caches (dict): cache name -> {"bytes", "allocated", "entries", "per_card"}
+        - bytes, allocated and per_card: the totals, shared objects counted once in bytes
+
+    The caches are dropped first (invalidate_caches, and the memory tier of the result
+    cache, its disk tier is kept), so the generation of the database changes. tracemalloc is started if it is not running, and stopped afterwards.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    """
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        db.invalidate_caches()
+        if db.result_cache is not None:
+            db.result_cache.clear(disk=False)
+        cards = db._fetchone("SELECT COUNT(*) FROM cards")[0]
+        caches = {}
+        total = _traced()
+        for name, attribute, fill in CACHES:
+            before = _traced()
+            fill(db)
+            allocated = _traced() - before
+            cache = getattr(db, attribute)
+            size = deep_size(cache)
+            caches[name] = {
+                "bytes": size,
+                "allocated": allocated,
+                "entries": _entries(cache),
+                "per_card": size / cards if cards > 0 else 0.0,
+            }
+        total = _traced() - total
+    finally:
+        if started:
+            tracemalloc.stop()
+
+    seen = set()
+    shared_bytes = sum(deep_size(getattr(db, attribute), seen) for _, attribute, _ in CACHES)
+    return {
+        "cards": cards,
+        "caches": caches,
+        "bytes": shared_bytes,
+        "allocated": total,
+        "per_card": shared_bytes / cards if cards > 0 else 0.0,
+    }
+
+def deck_footprint(deck):
+    """
+    Return what a deck costs, without the HSDB it references (shared by every deck, the
+    reference itself is one pointer), as a dictionary with:
+        - bytes (int) and per_card (float)
+        - parts (dict): bytes of the card list, of the card counts and of everything else
+          (the statistics kept up to date by the deck, its name, hero and class)
+
+    Parameters
+    ----------
+    deck : Deck
+        The deck
+    """
+
+    seen = set()
+    parts = {
+        "cards": deep_size(deck.cards, seen),
+        "card_counts": deep_size(deck.card_counts, seen),
+    }
+    parts["other"] = deep_size(deck, seen, skip=(deck.db,))
+    total = sum(parts.values())
+    return {
+        "bytes": total,
+        "per_card": total / len(deck.cards) if len(deck.cards) > 0 else 0.0,
+        "parts": parts,
+    }
+
+def _key_typecode(max_key):
+    # The smallest array type that holds every card key
+    for typecode in ("B", "H", "I", "L", "Q"):
+        if max_key < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    return "Q"
+
+def compare_representations(db, num_decks=DEFAULT_NUM_DECKS, deck_size=DECK_SIZE, seed=0):
+    """
+    Build the same random decks in several representations and return, for each one,
+    {"bytes_per_deck": float, "allocated_per_deck": float}. The representations are:
+        - names: a list of new name strings, like the cards of a parsed decklist
+        - interned_names: a list of the catalog's own name strings
+        - card_keys: a list of card keys (interned ids)
+        - key_array: an array of card keys, of the smallest integer type that fits
+
+    bytes_per_deck counts the strings and integers the decks share once over all decks,
+    allocated_per_deck is what building the decks added to the process.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    num_decks : int
+        The number of decks
+    deck_size : int
+        The number of cards per deck
+    seed : int
+        Seed of the random generator
+    """
+
+    infos = list(db.iter_card_info())
+    rng = random.Random(seed)
+    decks = [[rng.choice(infos) for _ in range(deck_size)] for _ in range(num_decks)]
+    typecode = _key_typecode(max([info.card_key for info in infos] + [0]))
+    builders = (
+        ("names", lambda deck: [info.card_name.encode().decode() for info in deck]),
+        ("interned_names", lambda deck: [info.card_name for info in deck]),
+        ("card_keys", lambda deck: [info.card_key for info in deck]),
+        ("key_array", lambda deck: array(typecode, [info.card_key for info in deck])),
+    )
+
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    results = {}
+    try:
+        for name, build in builders:
+            before = _traced()
+            built = [build(deck) for deck in decks]
+            allocated = _traced() - before - sys.getsizeof(built)
+            seen = set()
+            results[name] = {
+                "bytes_per_deck": sum(deep_size(deck, seen) for deck in built) / max(num_decks, 1),
+                "allocated_per_deck": allocated / max(num_decks, 1),
+            }
+            del built
+    finally:
+        if started:
+            tracemalloc.stop()
+    return results
+
+def random_decks(db, num_decks, seed=0):
+    """
+    Return num_decks random decks, see Deck.randomize.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    num_decks : int
+        The number of decks
+    seed : int
+        Seed of the random generator
+    """
+
+    random.seed(seed)
+    decks = []
+    for _ in range(num_decks):
+        deck = Deck(db)
+        deck.randomize()
+        decks.append(deck)
+    return decks
+
+def footprint_report(db, num_decks=DEFAULT_NUM_DECKS, seed=0):
+    """
+    Return the footprint of the catalog caches, of num_decks random decks and of the
+    deck representations, as a dictionary with time (float, seconds since the epoch),
+    catalog (see catalog_footprint), decks ({"decks", "bytes", "per_deck", "per_card"}) and
+    representations (see compare_representations).
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    num_decks : int
+        The number of random decks measured
+    seed : int
+        Seed of the random generators
+    """
+
+    catalog = catalog_footprint(db)
+    decks = random_decks(db, num_decks, seed)
+    deck_bytes = sum(deck_footprint(deck)["bytes"] for deck in decks)
+    deck_cards = sum(len(deck.cards) for deck in decks)
+    return {
+        "time": time.time(),
+        "catalog": catalog,
+        "decks": {
+            "decks": len(decks),
+            "bytes": deck_bytes,
+            "per_deck": deck_bytes / len(decks) if len(decks) > 0 else 0.0,
+            "per_card": deck_bytes / deck_cards if deck_cards > 0 else 0.0,
+        },
+        "representations": compare_representations(db, max(num_decks, 1), DECK_SIZE, seed),
+    }
+
+def append_history(path, report):
+    """
+    Append a report to a JSON lines history file.
+
+    Parameters
+    ----------
+    path : str
+        The history file
+    report : dict
+        The result of footprint_report
+    """
+
+    with open(path, "a") as f:
+        f.write(json.dumps(report, sort_keys=True) + "\n")
+
+def read_history(path):
+    """
+    Return the reports of a JSON lines history file, oldest first. Lines that cannot be
+    read are skipped.
+
+    Parameters
+    ----------
+    path : str
+        The history file
+    """
+
+    reports = []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                try:
+                    reports.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError as e:
+        print("Error while reading {}: {}".format(path, e))
+    return reports
+
+def print_report(report):
+    """
+    Print the result of footprint_report.
+
+    Parameters
+    ----------
+    report : dict
+        The result of footprint_report
+    """
+
+    catalog = report["catalog"]
+    print("Catalog: {} cards".format(catalog["cards"]))
+    print("{:<14} {:>12} {:>12} {:>10} {:>10}".format("Cache", "Bytes", "Allocated", "Entries", "Per card"))
+    for name, cache in catalog["caches"].items():
+        print("{:<14} {:>12,} {:>12,} {:>10,} {:>10.1f}".format(name, cache["bytes"], cache["allocated"], cache["entries"],
+                                                               cache["per_card"]))
+    print("{:<14} {:>12,} {:>12,} {:>10} {:>10.1f}".format("Total", catalog["bytes"], catalog["allocated"], "",
+                                                           catalog["per_card"]))
+    print("")
+    decks = report["decks"]
+    print("Decks: {} decks, {:,} bytes, {:.1f} per deck, {:.1f} per card".format(
+        decks["decks"], decks["bytes"], decks["per_deck"], decks["per_card"]))
+    print("")
+    print("{:<16} {:>16} {:>20}".format("Representation", "Bytes per deck", "Allocated per deck"))
+    for name, representation in report["representations"].items():
+        print("{:<16} {:>16.1f} {:>20.1f}".format(name, representation["bytes_per_deck"], representation["allocated_per_deck"]))
+
+def print_history(reports):
+    """
+    Print one line per report of a history: the totals of the catalog and of the decks.
+
+    Parameters
+    ----------
+    reports : list of dict
+        The results of footprint_report, oldest first
+    """
+
+    print("{:<20} {:>8} {:>14} {:>14} {:>10} {:>10}".format("Time", "Cards", "Catalog bytes", "Allocated", "Per card",
+                                                            "Per deck"))
+    for report in reports:
+        print("{:<20} {:>8} {:>14,} {:>14,} {:>10.1f} {:>10.1f}".format(
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(report["time"])), report["catalog"]["cards"],
+            report["catalog"]["bytes"], report["catalog"]["allocated"], report["catalog"]["per_card"],
+            report["decks"]["per_deck"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory footprint of the catalog caches and of decks")
+    parser.add_argument("db_file", help="the .sqlite database, built by main.py")
+    parser.add_argument("--decks", type=int, default=DEFAULT_NUM_DECKS, help="number of random decks measured")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", metavar="PATH", help="append the report to this JSON lines file, then print it")
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db_file, read_only=True)
+    report = footprint_report(db, args.decks, args.seed)
+    print_report(report)
+    if args.history is not None:
+        append_history(args.history, report)
+        print("")
+        print_history(read_history(args.history))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Card sets and formats. Every card belongs to one set, and a format (e.g. Standard or
+# Wild) is a list of sets. format_cards materializes the cards of every format, clustered
+# by format, so that a query on one format only reads the rows of that format. Rotating a
+# format (HSDB.rotate_format) rewrites its sets, and the triggers of Triggers.py keep
+# format_cards up to date.
+#
+# The set of a card is the optional "Set" column of cards.csv (DEFAULT_SET if missing),
+# and the formats come from the optional formats.csv file (format name, "|" separated set
+# names). The Wild format always exists and holds every set.
+
+DEFAULT_SET = "Legacy"
+WILD_FORMAT = "Wild"
+
+FORMAT_TABLES = (
+    """CREATE TABLE IF NOT EXISTS sets (
+        set_key integer primary key autoincrement,
+        set_name varchar(30) unique not null)""",
+    """CREATE TABLE IF NOT EXISTS card_sets (
+        cs_cardkey integer primary key,
+        cs_setkey integer not null)""",
+    """CREATE TABLE IF NOT EXISTS formats (
+        format_key integer primary key autoincrement,
+        format_name varchar(15) unique not null)""",
+    """CREATE TABLE IF NOT EXISTS format_sets (
+        fs_formatkey integer,
+        fs_setkey integer,
+        primary key (fs_formatkey, fs_setkey))""",
+    """CREATE TABLE IF NOT EXISTS format_cards (
+        fc_formatkey integer,
+        fc_cardkey integer,
+        primary key (fc_formatkey, fc_cardkey)) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS card_sets_set_index ON card_sets (cs_setkey)",
+    "CREATE INDEX IF NOT EXISTS format_sets_set_index ON format_sets (fs_setkey)",
+)
+
+# Give a set to the cards that have none, make Wild hold every set, and rebuild
+# format_cards
+FORMAT_BACKFILL = (
+    "INSERT OR IGNORE INTO sets (set_name) VALUES ('{}')".format(DEFAULT_SET),
+    """INSERT OR IGNORE INTO card_sets (cs_cardkey, cs_setkey)
+       SELECT card_key, (SELECT set_key FROM sets WHERE set_name = '{}') FROM cards""".format(DEFAULT_SET),
+    "DELETE FROM card_sets WHERE cs_cardkey NOT IN (SELECT card_key FROM cards)",
+    "INSERT OR IGNORE INTO formats (format_name) VALUES ('{}')".format(WILD_FORMAT),
+    """INSERT OR IGNORE INTO format_sets (fs_formatkey, fs_setkey)
+       SELECT format_key, set_key FROM formats, sets WHERE format_name = '{}'""".format(WILD_FORMAT),
+    "DELETE FROM format_cards",
+    """INSERT INTO format_cards (fc_formatkey, fc_cardkey)
+       SELECT DISTINCT fs_formatkey, cs_cardkey FROM format_sets INNER JOIN card_sets ON cs_setkey = fs_setkey""",
+)
+
+# (name, event, body) of the triggers that maintain format_cards, see Triggers.py
+FORMAT_TRIGGERS = (
+    ("card_sets_insert", "AFTER INSERT ON card_sets",
+     """INSERT OR IGNORE INTO format_cards (fc_formatkey, fc_cardkey)
+            SELECT fs_formatkey, NEW.cs_cardkey FROM format_sets WHERE fs_setkey = NEW.cs_setkey;"""),
+    ("card_sets_update", "AFTER UPDATE ON card_sets",
+     """DELETE FROM format_cards WHERE fc_cardkey = OLD.cs_cardkey;
+    INSERT OR IGNORE INTO format_cards (fc_formatkey, fc_cardkey)
+            SELECT fs_formatkey, NEW.cs_cardkey FROM format_sets WHERE fs_setkey = NEW.cs_setkey;"""),
+    ("card_sets_delete", "AFTER DELETE ON card_sets",
+     """DELETE FROM format_cards WHERE fc_cardkey = OLD.cs_cardkey;"""),
+    ("format_sets_insert", "AFTER INSERT ON format_sets",
+     """INSERT OR IGNORE INTO format_cards (fc_formatkey, fc_cardkey)
+            SELECT NEW.fs_formatkey, cs_cardkey FROM card_sets WHERE cs_setkey = NEW.fs_setkey;"""),
+    ("format_sets_delete", "AFTER DELETE ON format_sets",
+     """DELETE FROM format_cards WHERE fc_formatkey = OLD.fs_formatkey
+            AND fc_cardkey IN (SELECT cs_cardkey FROM card_sets WHERE cs_setkey = OLD.fs_setkey);"""),
+    ("sets_insert", "AFTER INSERT ON sets",
+     """INSERT OR IGNORE INTO format_sets (fs_formatkey, fs_setkey)
+            SELECT format_key, NEW.set_key FROM formats WHERE format_name = '""" + WILD_FORMAT + """';"""),
+    ("sets_delete", "AFTER DELETE ON sets",
+     """DELETE FROM format_sets WHERE fs_setkey = OLD.set_key;
+    DELETE FROM card_sets WHERE cs_setkey = OLD.set_key;"""),
+    ("formats_delete", "AFTER DELETE ON formats",
+     """DELETE FROM format_sets WHERE fs_formatkey = OLD.format_key;
+    DELETE FROM format_cards WHERE fc_formatkey = OLD.format_key;"""),
+)
+
+def card_set(row):
+    """
+    Return the set of a cards.csv row, DEFAULT_SET if the row has no Set column.
+
+    Parameters
+    ----------
+    row : list of str
+        The row: Name, Type, Rarity, Cost, Attack, Health, Text, Classes and, optionally,
+        Set
+    """
+
+    if len(row) > 8 and row[8].strip() != "":
+        return row[8].strip()
+    return DEFAULT_SET
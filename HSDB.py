@@ -1,6 +1,87 @@
+import os
 import sqlite3
 from sqlite3 import Error
 import csv
+from collections import namedtuple
+from urllib.parse import quote
+from Snapshot import CatalogSnapshot, write_snapshot
+from Query import QueryRunner, select_template, canonicalize, STATEMENT_CACHE_SIZE
+from Instrumentation import Instrumentation, instrumented
+from Reporter import IngestReporter
+from Autocomplete import NameIndex, BKTree
+from Facets import FacetIndex, NUMERIC_FACETS, TEXT_FACETS
+from ResultCache import ResultCache
+from Heroes import HeroRegistry
+from Formats import FORMAT_TABLES, FORMAT_BACKFILL, WILD_FORMAT, card_set
+from Triggers import (CARD_DETAILS_TABLE, CARD_SEARCH_TABLE, CLASS_POOLS_TABLE, INDEXES, BACKFILL, SEARCH_BACKFILL,
+                      TRIGGERS, SEARCH_TRIGGERS, trigger_statements)
+
+# The cards of a format, read from the partition of that format in format_cards
+FORMAT_FILTER = """card_key IN (SELECT fc_cardkey FROM format_cards
+                                WHERE fc_formatkey = (SELECT format_key FROM formats WHERE format_name like ?))"""
+
+# Filters of get_cards and get_heroes, in the canonical order of their SQL templates
+CARD_FILTERS = (
+    ("card_name", "card_name like ?"),
+    ("card_cost", "card_cost = ?"),
+    ("card_rarity", "card_rarity like ?"),
+    ("card_type", "card_type like ?"),
+    ("class_name", "class_name like ?"),
+    ("format_name", FORMAT_FILTER),
+)
+HERO_FILTERS = (
+    ("hero_name", "hero_name like ?"),
+    ("class_name", "class_name like ?"),
+)
+
+# Filters of iter_cards. The class filter is a subquery so that every card appears once,
+# in card_key order.
+ITER_CARD_FILTERS = (
+    ("card_name", "card_name like ?"),
+    ("card_cost", "card_cost = ?"),
+    ("card_rarity", "card_rarity like ?"),
+    ("card_type", "card_type like ?"),
+    ("class_name", "card_key IN (SELECT cc_cardkey FROM class_cards INNER JOIN classes ON cc_classkey = class_key WHERE class_name like ?)"),
+    ("format_name", FORMAT_FILTER),
+)
+
+# Rows returned by the streaming iterators
+CardRow = namedtuple("CardRow", ["card_key", "card_name", "card_cost", "card_rarity", "card_type"])
+HeroRow = namedtuple("HeroRow", ["hero_key", "hero_name", "class_name", "hero_power_name", "hero_power_cost", "hero_power_text"])
+CardInfo = namedtuple("CardInfo", ["card_key", "card_name", "card_type", "card_cost", "card_rarity", "card_attack", "card_health"])
+CardDetails = namedtuple("CardDetails", ["card_key", "card_name", "card_cost", "card_rarity", "card_type", "card_attack",
+                                         "card_health", "card_text", "card_classes"])
+CatalogChange = namedtuple("CatalogChange", ["sequence", "table", "key", "name", "operation"])
+KeywordCardRow = namedtuple("KeywordCardRow", ["card_key", "card_name", "card_text", "keyword_name", "keyword_description"])
+
+# Rows per keyset page of the streaming iterators, and rows per fetchmany call
+STREAM_PAGE_SIZE = 1000
+STREAM_FETCH_SIZE = 100
+
+# Every (class, card) pair of the legal card pools: the cards of the class plus the
+# neutral cards. The only parameter is the name of the neutral class.
+POOL_SELECT = """SELECT class_key, cc_cardkey FROM classes
+                 INNER JOIN class_cards ON cc_classkey = class_key
+                 UNION
+                 SELECT class_key, cc_cardkey FROM classes, class_cards
+                 WHERE cc_classkey IN (SELECT class_key FROM classes WHERE class_name = ?)"""
+
+# Tables added after the first version of the schema, created by upgrade_schema in an
+# older database
+UPGRADE_TABLES = ("card_details", "class_pools", "sets", "card_sets", "formats", "format_sets", "format_cards",
+                  "catalog_changes")
+
+# Settings of read-only (serving) connections
+READ_ONLY_CACHE_SIZE = -65536       # in KiB when negative, i.e. 64 MiB of page cache
+READ_ONLY_MMAP_SIZE = 268435456     # 256 MiB of the database file memory-mapped
+
+class ReadOnlyError(Exception):
+    """
+    Raised when a method that writes to the database is called on a database that was
+    opened in read-only mode.
+    """
+
+    pass
 
 class HSDB:
     """
@@ -9,7 +90,30 @@ class HSDB:
     Attributes
     ----------
     conn : sqlite3.Connection
-        A connection to the database
+        A connection to the database, opened lazily on first use
+    db_file : str
+        The path to the database (.sqlite) file
+    data_dir : str
+        The folder that holds the cards/classes/heroes/keywords csv files
+    reporter : IngestReporter
+        Receives the progress and the errors of create_tables_from_data, silent by default
+    read_only : bool
+        True if the database is opened in read-only (serving) mode
+    queries : QueryRunner
+        Runs every query and keeps per-template counts and timings
+    instrumentation : Instrumentation
+        Per-method call counts, rows, SQL time and wall time, and the slow-query log
+    generation : int
+        Incremented every time the catalog changes, which invalidates the in-memory caches
+    snapshot : CatalogSnapshot
+        A memory-mapped catalog snapshot, used by the validators and the key, pool and
+        format lookups instead of the database when it is loaded
+    result_cache : ResultCache
+        The LRU cache of the results of get_cards and viewCardsByKeyword, memory only by
+        default, None to disable it
+    catalog : StorageBackend
+        If not None, the backend that serves the catalog reads (see use_catalog) instead
+        of the database
     """
 
     def __init__(self):
@@ -17,19 +121,231 @@ class HSDB:
         Constructor
         """
 
-        self.conn = None
+        self.db_file = None
+        self.data_dir = "data"
+        self.reporter = IngestReporter()
+        self.read_only = False
+        self._conn = None
+        self.snapshot = None
+        self.instrumentation = Instrumentation()
+        self.queries = QueryRunner(observer=self.instrumentation.record_query,
+                                   context=self.instrumentation.current_method)
+        self.generation = 0
+        self._card_keys = None
+        self._card_info = None
+        self._heroes = None
+        self._pools = None
+        self._formats = None
+        self._format_pools = {}
+        self._name_indexes = {}
+        self._bk_trees = {}
+        self._facets = None
+        self._format_facets = {}
+        self.result_cache = ResultCache()
+        self._result_stamp = None
+        self.catalog = None
+
+    @property
+    def conn(self):
+        """
+        The connection to the database. The database file is only opened the first time
+        the connection is needed, so that starting the application does not pay for it.
+        """
+
+        if self._conn is None and self.db_file is not None:
+            if self.read_only:
+                self._conn = self._open_read_only(self.db_file)
+            else:
+                self._conn = sqlite3.connect(self.db_file, cached_statements=STATEMENT_CACHE_SIZE)
+            self._check_schema()
+        return self._conn
+
+    @conn.setter
+    def conn(self, value):
+        self._conn = value
 
-    def connect(self, db_file):
+    def connect(self, db_file, read_only=False):
         """
-        Establish a connection the a database.
+        Establish a connection the a database. The file is opened lazily, on the first
+        query that needs it. Opening a database built by an older version, without the
+        derived tables, formats and change log, reports it: see upgrade_schema.
 
         Parameters
         ----------
         db_file : str
             The path to the database (.sqlite) file
+        read_only : bool
+            If True, open the database as an immutable, read-only file. This is meant for
+            serving processes: there is no locking, and every method that writes to the
+            database raises a ReadOnlyError.
+        """
+
+        self.db_file = db_file
+        self.read_only = read_only
+        self._conn = None
+
+    def _open_read_only(self, db_file):
+        # immutable=1 tells SQLite the file cannot change, so it skips all locking and
+        # change detection. The file must not be modified while it is being served.
+        uri = "file:{}?mode=ro&immutable=1".format(quote(os.path.abspath(db_file)))
+        conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute("PRAGMA cache_size = {}".format(READ_ONLY_CACHE_SIZE))
+        conn.execute("PRAGMA mmap_size = {}".format(READ_ONLY_MMAP_SIZE))
+        return conn
+
+    def _schema_outdated(self):
+        # True if the database has a catalog but was built before the derived tables, the
+        # formats and the change log existed
+        tables = set(name for (name,) in self._fetchall("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        return "cards" in tables and not (tables.issuperset(UPGRADE_TABLES) and self.has_triggers())
+
+    def _check_schema(self):
+        # Opening a database never changes it, an outdated one is only reported
+        try:
+            if self._schema_outdated():
+                print("Error in connect: {} was built by an older version, run main.py --update to upgrade it".format(
+                    self.db_file))
+        except Error as e:
+            print("Error in connect:", e)
+
+    def upgrade_schema(self):
+        """
+        Create and fill the tables that a database built by an older version does not
+        have (the derived tables, the formats and the change log) and install the
+        triggers, in one transaction, so that legality, search and the change log work
+        without a rebuild. Every card gets the default set, which is in Wild. Return True
+        if the database was upgraded. update_tables_from_data does this too.
+        """
+
+        self._check_writable("upgrade_schema")
+        try:
+            if not self._schema_outdated():
+                return False
+            self._install_triggers()
+            self._create_change_log()
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Error in upgrade_schema:", e)
+            return False
+        self.invalidate_caches()
+        return True
+
+    def _execute(self, sql, parameters=()):
+        # Every query goes through the query runner, which keeps the per-template statistics
+        return self.queries.execute(self.conn, sql, parameters)
+
+    def _fetchone(self, sql, parameters=()):
+        return self.queries.execute(self.conn, sql, parameters, fetch="one")
+
+    def _fetchall(self, sql, parameters=()):
+        return self.queries.execute(self.conn, sql, parameters, fetch="all")
+
+    def _cached(self, key, compute):
+        # Return the result of compute() through the result cache. The result must be a
+        # tuple, so that it cannot be modified once cached.
+        if self.result_cache is None:
+            return compute()
+        if self._result_stamp is None and self.result_cache.path is not None:
+            # Entries on disk outlive the generation, they are stamped with the database
+            # and the last change of its catalog instead
+            self._result_stamp = "{}:{}".format(os.path.abspath(self.db_file), self.catalog_sequence())
+        hit, value = self.result_cache.get(key, self.generation, self._result_stamp)
+        if not hit:
+            value = compute()
+            self.result_cache.put(key, value, self.generation, self._result_stamp)
+        return value
+
+    def _iter_keyset(self, sql, parameters, row_type, page_size):
+        # Keyset pagination: sql must end with "key > ? ORDER BY key LIMIT ?", the key
+        # being the first column. Every page is a short query that resumes after the last
+        # key seen, so no cursor stays open between pages and memory does not grow with
+        # the size of the result.
+        last_key = -1
+        while True:
+            cursor = self._execute(sql, parameters + (last_key, page_size))
+            count = 0
+            while True:
+                rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+                if len(rows) == 0:
+                    break
+                count += len(rows)
+                last_key = rows[-1][0]
+                for row in rows:
+                    yield row_type._make(row)
+            if count < page_size:
+                return
+
+    def query_stats(self):
+        """
+        Return the number of calls and the time spent in each SQL template, slowest first.
+        """
+
+        return self.queries.report()
+
+    def _check_writable(self, method):
+        # Every method that writes to the database calls this first
+        if self.read_only:
+            raise ReadOnlyError("{} is not allowed, {} is opened in read-only mode".format(method, self.db_file))
+
+    def is_connected(self):
+        """
+        Return True if the database file has actually been opened.
+        """
+
+        return self._conn is not None
+
+    def export_snapshot(self, path):
+        """
+        Export the catalog to a snapshot file that can later be loaded with load_snapshot.
+
+        Parameters
+        ----------
+        path : str
+            The path to the snapshot file
         """
 
-        self.conn = sqlite3.connect(db_file)
+        write_snapshot(self.conn, path)
+
+    def load_snapshot(self, path):
+        """
+        Memory-map a catalog snapshot. Once loaded, the card/class/hero validators, the
+        card keys and information, the heroes, the class pools and the format memberships
+        are read from the snapshot and do not touch the database.
+
+        Parameters
+        ----------
+        path : str
+            The path to the snapshot file
+        """
+
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = CatalogSnapshot(path)
+        self.invalidate_caches()
+
+    def use_catalog(self, backend):
+        """
+        Serve the catalog reads from a storage backend (see Storage.py), e.g. a
+        MemoryBackend loaded from the database: the card, class and hero lookups and
+        validators, get_cards, the class pools, legality and keyword search then go
+        through the backend, and so do Deck, DecklistParser and App, which use them. The
+        other methods (full-text search, facets, autocomplete, the iterators, the
+        statistics and the writes) still use the database. A backend that holds a copy of
+        the catalog must be loaded again after the catalog changes.
+
+        Parameters
+        ----------
+        backend : StorageBackend
+            The backend, None (or a SQLiteBackend of this HSDB) to read the database
+        """
+
+        if backend is not None and getattr(backend, "db", None) is self:
+            # The SQLiteBackend of this HSDB reads through it
+            backend = None
+        self.catalog = backend
+        self.invalidate_caches()
 
     def create_table(self, name, fields):
         """
@@ -43,42 +359,55 @@ class HSDB:
             The columns of the table, which include name, type, and other optional arguments
         """
 
+        self._check_writable("create_table")
+
         try:
             sql_statement = "CREATE TABLE IF NOT EXISTS " + name + " (" + ", ".join(fields) + ");"
-            print("sql = {}".format(sql_statement))
-            self.conn.execute(sql_statement)
+            self.reporter.message("sql = {}".format(sql_statement))
+            self._execute(sql_statement)
         except Error as e:
             print("Error in create_table:", e)
 
-    def create_tables_from_data(self, cards, heroes):
+    def _count_rows(self, file_name):
+        # Number of data rows of a csv file of the data folder, used for the progress ETA
+        try:
+            with open(os.path.join(self.data_dir, file_name), 'r') as f:
+                return max(0, sum(1 for _ in csv.reader(f)) - 1)
+        except OSError:
+            return None
+
+    def _scan_cards_csv(self, num_cards=None):
+        # The data rows of cards.csv, whose scans are counted under one "cards.csv"
+        # progress entry: the tables built from it count the rows they insert
+        self.reporter.start_table("cards.csv", num_cards)
+        with open(os.path.join(self.data_dir, 'cards.csv'), 'r') as cardData:
+            cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
+            header = next(cardReader)
+            #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
+            for card in cardReader:
+                self.reporter.row("cards.csv")
+                yield card
+        self.reporter.end_table("cards.csv")
+
+    @instrumented
+    def create_tables_from_data(self, cards=None, heroes=None):
         """
-        Create tables from a given data.
+        Create tables from the cards/classes/heroes/keywords csv files in the data folder
+        (data_dir). Progress and errors go to the reporter, and the summary of the ingest
+        (rows and errors by table) is returned.
 
         Parameters
         ----------
         cards : Pandas.DataFrame
-            A Pandas DataFrame object consisting of Hearthstone cards. The DataFrame must have
-            the following columns:
-                - Name (str)
-                - Type (str)
-                - Rarity (str)
-                - Cost (int)
-                - Attack (int or NaN)
-                - Health (int or NaN)
-                - Text (str)
-                - Classes (str)
-
+            Unused, the cards are read from cards.csv. Kept for backwards compatibility.
         heroes : Pandas.DataFrame
-            A Pandas DataFrame object consisting of Hearthstone heroes. The DataFrame must have
-            the following columns:
-                - Name (str)
-                - Hero Power Name (str)
-                - Hero Power Cost (int)
-                - Hero Power Text (str)
-                - Class (str)
+            Unused, the heroes are read from heroes.csv. Kept for backwards compatibility.
         """
-        
-        print("Creating Cards Table\n")
+
+        self._check_writable("create_tables_from_data")
+        self.reporter.start()
+        num_cards = self._count_rows('cards.csv')
+
         try:
             sql = """CREATE TABLE cards (
                 card_key INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -86,49 +415,36 @@ class HSDB:
                 card_cost integer,
                 card_rarity varchar(10) not null,
                 card_type varchar(10) not null)"""
-            self.conn.execute(sql)
+            self._execute(sql)
+            self._execute("CREATE INDEX IF NOT EXISTS cards_name_index ON cards (card_name)")
             self.conn.commit()
-            print("Success!")
         except Error as e:
             self.conn.rollback()
-            print(e)
+            self.reporter.error("cards", "create table", e)
 
-        print("Creating class Table")
         try:
             args = ["class_key integer primary key autoincrement","class_name varchar(15) not null"]
-            #self.create_table("Classes", "class_key primary key autoincrement, class_name varchar(15) not null")
             self.create_table("classes", args)
-            print("Populating classes Table")
+            self.reporter.start_table("classes", self._count_rows('classes.csv'))
             try:
-                with open('data/classes.csv', 'r') as classData:
+                with open(os.path.join(self.data_dir, 'classes.csv'), 'r') as classData:
                     classReader = csv.reader(classData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
                     header = next(classReader)
-                    print("Header Format: {}".format(header))
-                    #sql = """INSERT INTO {} (class_name) VALUES (?)""".format("Classes")
-                    #print(sql)
                     #note: classes csv format: class_name
                     for row in classReader:
-                        sql = """INSERT INTO {} (class_name) VALUES(?)""".format("classes")
-                        #print(sql)
-                        args = [row[0]]
-                        #print("before execute")
-                        self.conn.execute(sql, args)
-                        #print("after execute")
+                        sql = """INSERT INTO classes (class_name) VALUES(?)"""
+                        args = (row[0],)
+                        self._execute(sql, args)
                         self.conn.commit()
-                    #print("after commit")
-                classData.close()
+                        self.reporter.row("classes")
             except Error as e:
-                print("Error Opening classes.csv or inserting class to table")
                 self.conn.rollback()
-                print(e)
+                self.reporter.error("classes", "classes.csv", e)
+            self.reporter.end_table("classes")
 
         except Error as e:
-            print("Error Creating/Populating class Table")
-            print(e)
+            self.reporter.error("classes", "create table", e)
 
-
-
-        print ("Creating heroes Table")
         try:
             sql = """CREATE TABLE heroes (
                 hero_classkey integer,
@@ -138,14 +454,12 @@ class HSDB:
                 hero_power_text varchar(50)
             )
             """
-            self.conn.execute(sql)
+            self._execute(sql)
             self.conn.commit()
-            print("Success!")
         except Error as e:
             self.conn.rollback()
-            print(e)
-        
-        print ("Creating keywords Table")
+            self.reporter.error("heroes", "create table", e)
+
         try:
             sql = """CREATE TABLE keywords (
                 keyword_key INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -153,337 +467,800 @@ class HSDB:
                 keyword_description varchar(25) not null
             )
             """
-            self.conn.execute(sql)
+            self._execute(sql)
             self.conn.commit()
-            #print("Success!")
         except Error as e:
             self.conn.rollback()
-            print(e)
+            self.reporter.error("keywords", "create table", e)
         try:
-            with open('data/keywords.csv', 'r') as keyword_data:
+            self.reporter.start_table("keywords", self._count_rows('keywords.csv'))
+            with open(os.path.join(self.data_dir, 'keywords.csv'), 'r') as keyword_data:
                 keyword_reader = csv.reader(keyword_data, quoting=csv.QUOTE_ALL, skipinitialspace=True)
                 header = next(keyword_reader)
-                print("Header Format: {}".format(header))
                 for row in keyword_reader:
                     try:
-                        cur = self.conn.cursor()
                         sql = '''insert into keywords (keyword_name, keyword_description) values (?,?)'''
-                        args = [row[0], row[1]]
-                        cur.execute(sql, args)
+                        args = (row[0], row[1])
+                        self._execute(sql, args)
+                        self.reporter.row("keywords")
                     except Error as e:
-                        print("Error inserting keyword {} into keywords table.".format(row[0]))
-                        print(e)
+                        self.reporter.error("keywords", row[0], e)
                         self.conn.rollback()
-            keyword_data.close()
+            self.reporter.end_table("keywords")
         except Error as e:
             self.conn.rollback()
-            print("Error with keyword table creation.")
-            print(e)
-        
-        
-        print("Starting to import data...")
-        print("Importing cards data...")
+            self.reporter.error("keywords", "keywords.csv", e)
+
         try:
-            with open('data/cards.csv', 'r') as cardData:
+            self.reporter.start_table("cards", num_cards)
+            with open(os.path.join(self.data_dir, 'cards.csv'), 'r') as cardData:
                 cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
                 header = next(cardReader)
-                print("Header Format: {}".format(header))
                 #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
                 for row in cardReader:
-                    #print(row)
                     self.insertCardToTable("cards", row[0], row[3], row[2], row[1])
-            cardData.close()
-            print("Done Reading In cards Data\n")
+                    self.reporter.row("cards")
+            self.reporter.end_table("cards")
         except Error as e:
             self.conn.rollback()
-            print(e)
-        
-        print("Importing heroes Data...")
+            self.reporter.error("cards", "cards.csv", e)
+
         try:
-            with open('data/heroes.csv', 'r') as heroData:
+            self.reporter.start_table("heroes", self._count_rows('heroes.csv'))
+            with open(os.path.join(self.data_dir, 'heroes.csv'), 'r') as heroData:
                 heroReader = csv.reader(heroData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
                 header = next(heroReader)
-                print("Header Format: {}".format(header))
                 #heroes csv format ['Name', 'Hero Power Name', 'Hero Power Cost', 'Hero Power Text', 'Class']
                 for row in heroReader:
-                    #print(row)
                     self.insertHeroToTable("heroes", row[0], row[1], row[2], row[3], row[4])
-            heroData.close()
-            print("Done reading/inserting hero data...\n")
+                    self.reporter.row("heroes")
+            self.reporter.end_table("heroes")
         except Error as e:
-            print(e)
+            self.reporter.error("heroes", "heroes.csv", e)
 
-        print("Creating all relational tables for cards/heroes...\n")
+        # Relational tables for cards/heroes
         try:
-            print("Creating keyword_cards table")
             self.create_table('keyword_cards', ['keyword_key integer', 'card_key integer'])
         except Error as e:
-            print("Error creating keyword_cards table")
-            print(e)
+            self.reporter.error("keyword_cards", "create table", e)
         try:
-            print("Generating class_cards Table")
-            self.generateClassCardsTable()
+            self.generateClassCardsTable(num_cards)
         except Error as e:
-            print("ERROR in generating class_cards Table!")
-            print(e)
+            self.reporter.error("class_cards", "generate table", e)
         try:
-            self.generateMinions()
+            self.generateMinions(num_cards)
         except Error as e:
-            print("error generating minions Table")
-            print(e)
+            self.reporter.error("minions", "generate table", e)
         try:
-            self.generateSpells()
+            self.generateSpells(num_cards)
         except Error as e:
-            print("Error generating spells table")
-            print(e)
+            self.reporter.error("spells", "generate table", e)
         try:
-            self.generateWeapons()
+            self.generateWeapons(num_cards)
         except Error as e:
-            print("Error generating weapons table")
-            print(e)
-        print("*** Finished generating all tables using data from the cards/classes/heroes csv files***\n")
-        
-    def generateWeapons(self):
-        print("Begin generating weapons table...")
+            self.reporter.error("weapons", "generate table", e)
+        try:
+            self.generateFormats()
+        except Error as e:
+            self.reporter.error("format_cards", "generate table", e)
+        try:
+            self.install_triggers()
+        except Error as e:
+            self.reporter.error("card_details", "install triggers", e)
+
+        try:
+            self._create_change_log()
+            self._log_change("*", None, None, "reset")
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            self.reporter.error("catalog_changes", "reset", e)
+
+        self.invalidate_caches()
+        return self.reporter.finish()
+
+    def _create_change_log(self):
+        # Append-only log of the catalog changes, tailed with changes_since
+        self.create_table("catalog_changes", ["change_seq INTEGER PRIMARY KEY AUTOINCREMENT", "change_table varchar(15) not null",
+                                              "change_key integer", "change_name varchar(25)", "change_op varchar(6) not null"])
+
+    def _log_change(self, table, key, name, operation):
+        self._execute("""INSERT INTO catalog_changes (change_table, change_key, change_name, change_op) VALUES (?,?,?,?)""",
+                      (table, key, name, operation))
+
+    def _read_csv(self, file_name):
+        # Data rows of a csv file of the data folder
+        with open(os.path.join(self.data_dir, file_name), 'r') as f:
+            reader = csv.reader(f, quoting=csv.QUOTE_ALL, skipinitialspace=True)
+            next(reader)
+            return [row for row in reader if len(row) > 0]
+
+    @staticmethod
+    def _csv_value(value):
+        # A csv field as it compares to the value stored in the database
+        value = value.strip()
+        if value == "":
+            return None
+        if value.lstrip("-").isdigit():
+            return int(value)
+        return value
+
+    @staticmethod
+    def _match_rows(existing, incoming):
+        # Match incoming (name, value) rows to existing (key, name, value) rows by name,
+        # the n-th row of a name matching the n-th one (names are not unique). Return the
+        # rows to insert, update and delete.
+        by_name = {}
+        for key, name, value in existing:
+            by_name.setdefault(name, []).append((key, value))
+        inserts, updates = [], []
+        for name, value in incoming:
+            matches = by_name.get(name)
+            if not matches:
+                inserts.append((name, value))
+                continue
+            key, old_value = matches.pop(0)
+            if old_value != value:
+                updates.append((key, name, value))
+        deletes = [(key, name) for name, matches in by_name.items() for key, _ in matches]
+        return inserts, updates, deletes
+
+    def _write_card_rows(self, card_key, card_name, value, class_keys):
+        # (Re)write the type, class and set rows of a card, the triggers maintaining the rest
+        card_type, card_rarity, card_cost, attack, health, text, classes, set_name = value
+        for table, column in (("minions", "minion_cardkey"), ("spells", "spell_cardkey"), ("weapons", "weapon_cardkey")):
+            self._execute("DELETE FROM {} WHERE {} = ?".format(table, column), (card_key,))
+        if card_type == "Minion":
+            self._execute("INSERT INTO minions (minion_cardkey, minion_attack, minion_health, minion_text) VALUES (?,?,?,?)",
+                          (card_key, attack, health, text or ""))
+        elif card_type == "Spell":
+            self._execute("INSERT INTO spells (spell_cardkey, spell_text) VALUES (?,?)", (card_key, text or ""))
+        elif card_type == "Weapon":
+            self._execute("INSERT INTO weapons (weapon_cardkey, weapon_attack, weapon_durability, weapon_text) VALUES (?,?,?,?)",
+                          (card_key, attack, health, text or ""))
+
+        self._execute("DELETE FROM class_cards WHERE cc_cardkey = ?", (card_key,))
+        for class_name in sorted(classes):
+            if class_name in class_keys:
+                self._execute("INSERT INTO class_cards (cc_cardkey, cc_classkey) VALUES (?,?)", (card_key, class_keys[class_name]))
+            else:
+                self.reporter.error("class_cards", card_name, "unknown class {}".format(class_name))
+
+        # The card got the default set when it was inserted
+        self._execute("INSERT OR IGNORE INTO sets (set_name) VALUES (?)", (set_name,))
+        self._execute("UPDATE card_sets SET cs_setkey = (SELECT set_key FROM sets WHERE set_name = ?) WHERE cs_cardkey = ?",
+                      (set_name, card_key))
+
+    def _keyword_links(self):
+        # Card key -> set of keyword keys
+        linked = {}
+        for keyword_key, card_key in self._fetchall("SELECT keyword_key, card_key FROM keyword_cards"):
+            linked.setdefault(card_key, set()).add(keyword_key)
+        return linked
+
+    @instrumented
+    def update_tables_from_data(self):
+        """
+        Apply the csv files of the data folder (data_dir) to the existing tables as a delta:
+        only the classes, keywords, cards and heroes that were added, changed or removed
+        are written, in one transaction, and every change is appended to the
+        catalog_changes table (see changes_since). Cards and heroes are matched by name.
+        The keyword links, class pools and other derived rows are maintained by the
+        triggers (see install_triggers), which are installed first if needed.
+
+        Return a dictionary with:
+            - sequence (int): the sequence number of the last change
+            - changes (dict): table -> {"insert": int, "update": int, "delete": int}
+            - errors (list of dict): the errors reported during the update
+        """
+
+        self._check_writable("update_tables_from_data")
+        self.reporter.start()
+        counts = {}
+
+        def log(table, key, name, operation):
+            self._log_change(table, key, name, operation)
+            counts.setdefault(table, {"insert": 0, "update": 0, "delete": 0})[operation] += 1
+            self.reporter.row(table)
+
+        try:
+            self._create_change_log()
+            if not self.has_triggers():
+                self._install_triggers()
+
+            # Classes: only insertions are applied before the cards, deletions after them
+            self.reporter.start_table("classes")
+            class_rows = self._fetchall("SELECT class_key, class_name, NULL FROM classes ORDER BY class_key")
+            class_inserts, _, class_deletes = self._match_rows(class_rows, [(row[0], None) for row in self._read_csv('classes.csv')])
+            for class_name, _ in class_inserts:
+                cursor = self._execute("INSERT INTO classes (class_name) VALUES (?)", (class_name,))
+                log("classes", cursor.lastrowid, class_name, "insert")
+            self.reporter.end_table("classes")
+            class_keys = {name: key for key, name in self._fetchall("SELECT class_key, class_name FROM classes")}
+
+            # Keywords
+            self.reporter.start_table("keywords")
+            keyword_rows = self._fetchall("SELECT keyword_key, keyword_name, keyword_description FROM keywords ORDER BY keyword_key")
+            # Keyword names are unique, the first row of a name wins like in the ingest
+            incoming = {}
+            for row in self._read_csv('keywords.csv'):
+                incoming.setdefault(row[0], row[1])
+            keyword_inserts, keyword_updates, keyword_deletes = self._match_rows(keyword_rows, list(incoming.items()))
+            keywords_changed = len(keyword_inserts) + len(keyword_deletes) > 0
+            linked = self._keyword_links() if keywords_changed else None
+            for keyword_name, description in keyword_inserts:
+                cursor = self._execute("INSERT INTO keywords (keyword_name, keyword_description) VALUES (?,?)", (keyword_name, description))
+                log("keywords", cursor.lastrowid, keyword_name, "insert")
+            for keyword_key, keyword_name, description in keyword_updates:
+                self._execute("UPDATE keywords SET keyword_description = ? WHERE keyword_key = ?", (description, keyword_key))
+                log("keywords", keyword_key, keyword_name, "update")
+            for keyword_key, keyword_name in keyword_deletes:
+                self._execute("DELETE FROM keywords WHERE keyword_key = ?", (keyword_key,))
+                log("keywords", keyword_key, keyword_name, "delete")
+            self.reporter.end_table("keywords")
+
+            # Cards, compared on everything the ingest stores about them
+            self.reporter.start_table("cards")
+            card_rows = []
+            for row in self._fetchall("""SELECT card_key, card_name, card_type, card_rarity, card_cost, card_attack, card_health,
+                                                card_text, card_classes, set_name
+                                         FROM card_details
+                                         LEFT JOIN card_sets ON cs_cardkey = card_key
+                                         LEFT JOIN sets ON cs_setkey = set_key
+                                         ORDER BY card_key"""):
+                card_rows.append((row[0], row[1], row[2:8] + (frozenset(row[8].split("|") if row[8] else ()), row[9])))
+            incoming = []
+            #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes', optional 'Set']
+            for row in self._read_csv('cards.csv'):
+                attack, health = self._csv_value(row[4]), self._csv_value(row[5])
+                if row[1] == "Spell":
+                    attack, health = None, None
+                incoming.append((row[0], (row[1], row[2], self._csv_value(row[3]), attack, health, row[6],
+                                          frozenset(row[7].split("|")), card_set(row))))
+            card_inserts, card_updates, card_deletes = self._match_rows(card_rows, incoming)
+
+            changed_cards = []
+            for card_name, value in card_inserts:
+                cursor = self._execute("INSERT INTO cards (card_name, card_cost, card_rarity, card_type) VALUES (?,?,?,?)",
+                                       (card_name, value[2], value[1], value[0]))
+                self._write_card_rows(cursor.lastrowid, card_name, value, class_keys)
+                changed_cards.append(cursor.lastrowid)
+                log("cards", cursor.lastrowid, card_name, "insert")
+            for card_key, card_name, value in card_updates:
+                self._execute("UPDATE cards SET card_cost = ?, card_rarity = ?, card_type = ? WHERE card_key = ?",
+                              (value[2], value[1], value[0], card_key))
+                self._write_card_rows(card_key, card_name, value, class_keys)
+                changed_cards.append(card_key)
+                log("cards", card_key, card_name, "update")
+            for card_key, card_name in card_deletes:
+                self._execute("DELETE FROM cards WHERE card_key = ?", (card_key,))
+                log("cards", card_key, card_name, "delete")
+
+            # New or removed keywords change the keyword links of the cards that were kept
+            if keywords_changed:
+                skipped = set(changed_cards).union(key for key, _ in card_deletes)
+                relinked = self._keyword_links()
+                for card_key, card_name, value in card_rows:
+                    if card_key not in skipped and relinked.get(card_key, set()) != linked.get(card_key, set()):
+                        log("cards", card_key, card_name, "update")
+            self.reporter.end_table("cards")
+
+            # Heroes, matched by name, their key being the rowid
+            self.reporter.start_table("heroes")
+            hero_rows = [(row[0], row[1], row[2:]) for row in self._fetchall(
+                """SELECT heroes.rowid, hero_name, hero_power_name, hero_power_cost, hero_power_text, class_name
+                   FROM heroes LEFT JOIN classes ON hero_classkey = class_key ORDER BY heroes.rowid""")]
+            #heroes csv format ['Name', 'Hero Power Name', 'Hero Power Cost', 'Hero Power Text', 'Class']
+            hero_inserts, hero_updates, hero_deletes = self._match_rows(
+                hero_rows, [(row[0], (row[1], self._csv_value(row[2]), row[3], row[4])) for row in self._read_csv('heroes.csv')])
+            for hero_name, (power_name, power_cost, power_text, class_name) in hero_inserts:
+                cursor = self._execute("""INSERT INTO heroes (hero_classkey, hero_name, hero_power_name, hero_power_cost, hero_power_text)
+                                          VALUES (?,?,?,?,?)""", (class_keys.get(class_name), hero_name, power_name, power_cost, power_text))
+                log("heroes", cursor.lastrowid, hero_name, "insert")
+            for hero_key, hero_name, (power_name, power_cost, power_text, class_name) in hero_updates:
+                self._execute("""UPDATE heroes SET hero_classkey = ?, hero_power_name = ?, hero_power_cost = ?, hero_power_text = ?
+                                 WHERE rowid = ?""", (class_keys.get(class_name), power_name, power_cost, power_text, hero_key))
+                log("heroes", hero_key, hero_name, "update")
+            for hero_key, hero_name in hero_deletes:
+                self._execute("DELETE FROM heroes WHERE rowid = ?", (hero_key,))
+                log("heroes", hero_key, hero_name, "delete")
+            self.reporter.end_table("heroes")
+
+            # Formats, if the data folder has a formats.csv file
+            formats = self._read_formats()
+            if formats is not None:
+                self.reporter.start_table("formats")
+                for format_name, set_names in formats.items():
+                    for set_name in set_names:
+                        self._execute("INSERT OR IGNORE INTO sets (set_name) VALUES (?)", (set_name,))
+                    format_key, operation = self._set_format_sets(format_name, set_names)
+                    if operation is not None:
+                        log("formats", format_key, format_name, operation)
+                for format_key, format_name in self._fetchall("SELECT format_key, format_name FROM formats"):
+                    if format_name not in formats and format_name != WILD_FORMAT:
+                        self._execute("DELETE FROM formats WHERE format_key = ?", (format_key,))
+                        log("formats", format_key, format_name, "delete")
+                self.reporter.end_table("formats")
+
+            # Removed classes, once no card uses them
+            for class_key, class_name in class_deletes:
+                self._execute("DELETE FROM classes WHERE class_key = ?", (class_key,))
+                log("classes", class_key, class_name, "delete")
+
+            self.conn.commit()
+        except (Error, OSError, IndexError) as e:
+            self.conn.rollback()
+            self.reporter.error("catalog_changes", "update", e)
+            counts = {}
+
+        if len(counts) > 0:
+            self.invalidate_caches()
+        summary = self.reporter.finish()
+        return {"sequence": self.catalog_sequence(), "changes": counts, "errors": summary["errors"]}
+
+    def catalog_sequence(self):
+        """
+        Return the sequence number of the last catalog change, 0 if there is none.
+        """
+
+        try:
+            row = self._fetchone("SELECT MAX(change_seq) FROM catalog_changes")
+        except Error:
+            return 0
+        return row[0] or 0
+
+    @instrumented
+    def changes_since(self, sequence=0, limit=None):
+        """
+        Return the catalog changes made after the given sequence number, oldest first, as
+        CatalogChange namedtuples (sequence, table, key, name, operation). The operation is
+        "insert", "update" or "delete", or "reset" (table "*") after a full rebuild, which
+        invalidates everything. Consumers keep the sequence of the last change they saw
+        and call this again to tail the log.
+
+        Parameters
+        ----------
+        sequence : int
+            The sequence number of the last change already seen
+        limit : int
+            The maximum number of changes returned, None for all of them
+        """
+
+        try:
+            return [CatalogChange._make(row) for row in self._fetchall(
+                """SELECT change_seq, change_table, change_key, change_name, change_op FROM catalog_changes
+                   WHERE change_seq > ? ORDER BY change_seq LIMIT ?""", (sequence, -1 if limit is None else limit))]
+        except Error as e:
+            print("Error in changes_since:", e)
+            return []
+
+    def _install_triggers(self):
+        # Create the derived tables, rebuild them from the catalog and (re)install the
+        # triggers, without committing. Return False if the full-text index is not available.
+        for sql in (CARD_DETAILS_TABLE, CLASS_POOLS_TABLE) + INDEXES + BACKFILL + FORMAT_TABLES + FORMAT_BACKFILL \
+                   + tuple(trigger_statements(TRIGGERS)):
+            self._execute(sql)
+        try:
+            self._execute(CARD_SEARCH_TABLE)
+        except Error as e:
+            self.reporter.error("card_search", "create table", e)
+            return False
+        for sql in SEARCH_BACKFILL + tuple(trigger_statements(SEARCH_TRIGGERS)):
+            self._execute(sql)
+        return True
+
+    def install_triggers(self):
+        """
+        Create the tables derived from the catalog (keyword_cards, class_pools, card_details,
+        format_cards and the card_search full-text index), rebuild them once, and install
+        the triggers that keep them consistent on every insert, update or delete of cards,
+        the type tables, class_cards, classes, keywords, sets and formats (see Triggers.py
+        and Formats.py). After that, a patch of the catalog costs O(changed rows) instead of
+        a rebuild of the derived tables.
+        """
+
+        self._check_writable("install_triggers")
+        try:
+            self.reporter.start_table("card_details")
+            self._install_triggers()
+            self.conn.commit()
+            self.reporter.row("card_details", self._fetchone("SELECT COUNT(*) FROM card_details")[0])
+            self.reporter.end_table("card_details")
+        except Error as e:
+            self.conn.rollback()
+            self.reporter.error("card_details", "install triggers", e)
+        self.invalidate_caches()
+
+    def has_triggers(self):
+        """
+        Return True if the triggers of install_triggers are installed.
+        """
+
+        names = [name for name, _, _ in TRIGGERS]
+        try:
+            row = self._fetchone("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({})".format(
+                ", ".join("?" * len(names))), tuple(names))
+        except Error:
+            return False
+        return row[0] == len(names)
+
+    @instrumented
+    def search_card_text(self, query, limit=20, format_name=None):
+        """
+        Return the cards whose name or text match a full-text query (FTS5 syntax, e.g.
+        "deal damage" or "freeze OR silence"), best match first, as CardDetails
+        namedtuples. Needs the card_search index of install_triggers.
+
+        Parameters
+        ----------
+        query : str
+            The full-text query
+        limit : int
+            The maximum number of cards returned
+        format_name : str
+            If not None, only the cards of this format
+        """
+
+        sql = """SELECT card_key, card_details.card_name, card_cost, card_rarity, card_type, card_attack, card_health,
+                        card_details.card_text, card_classes
+                 FROM card_search INNER JOIN card_details ON card_key = card_search.rowid
+                 WHERE card_search MATCH ?"""
+        parameters = (query,)
+        if format_name is not None:
+            sql += " AND " + FORMAT_FILTER
+            parameters += (format_name,)
+        try:
+            return [CardDetails._make(row) for row in self._fetchall(sql + " ORDER BY rank LIMIT ?", parameters + (limit,))]
+        except Error as e:
+            print("Error in search_card_text:", e)
+            return []
+
+    def _read_formats(self):
+        # Format name -> list of set names, from formats.csv, None if there is no such file
+        if not os.path.isfile(os.path.join(self.data_dir, 'formats.csv')):
+            return None
+        formats = {}
+        #formats csv format ['Format', 'Sets']
+        for row in self._read_csv('formats.csv'):
+            formats.setdefault(row[0], [name.strip() for name in row[1].split("|") if name.strip() != ""])
+        return formats
+
+    def generateFormats(self):
+        """
+        Create the sets, card_sets, formats, format_sets and format_cards tables: the set
+        of every card is read from the optional Set column of cards.csv, and the formats
+        from the optional formats.csv file (see Formats.py).
+        """
+
+        self._check_writable("generateFormats")
+        try:
+            self.reporter.start_table("format_cards")
+            for sql in FORMAT_TABLES:
+                self._execute(sql)
+
+            # The n-th card of a name in cards.csv is the n-th one in the table
+            card_keys = {}
+            for card_key, card_name in self._fetchall("SELECT card_key, card_name FROM cards ORDER BY card_key"):
+                card_keys.setdefault(card_name, []).append(card_key)
+            for row in self._read_csv('cards.csv'):
+                keys = card_keys.get(row[0])
+                if not keys:
+                    continue
+                set_name = card_set(row)
+                self._execute("INSERT OR IGNORE INTO sets (set_name) VALUES (?)", (set_name,))
+                self._execute("""INSERT OR REPLACE INTO card_sets (cs_cardkey, cs_setkey)
+                                 SELECT ?, set_key FROM sets WHERE set_name = ?""", (keys.pop(0), set_name))
+
+            for format_name, set_names in (self._read_formats() or {}).items():
+                self._execute("INSERT OR IGNORE INTO formats (format_name) VALUES (?)", (format_name,))
+                for set_name in set_names:
+                    self._execute("INSERT OR IGNORE INTO sets (set_name) VALUES (?)", (set_name,))
+                    self._execute("""INSERT OR IGNORE INTO format_sets (fs_formatkey, fs_setkey)
+                                     SELECT format_key, set_key FROM formats, sets WHERE format_name = ? AND set_name = ?""",
+                                  (format_name, set_name))
+
+            for sql in FORMAT_BACKFILL:
+                self._execute(sql)
+            self.conn.commit()
+            self.reporter.row("format_cards", self._fetchone("SELECT COUNT(*) FROM format_cards")[0])
+            self.reporter.end_table("format_cards")
+        except (Error, OSError, IndexError) as e:
+            self.conn.rollback()
+            self.reporter.error("format_cards", "formats", e)
+
+    def _set_format_sets(self, format_name, set_names):
+        # Make the format hold exactly the given sets, without committing, the triggers
+        # updating format_cards. Return the key of the format and the change made to it:
+        # "insert", "update" or None.
+        row = self._fetchone("SELECT format_key FROM formats WHERE format_name = ?", (format_name,))
+        if row is None:
+            format_key = self._execute("INSERT INTO formats (format_name) VALUES (?)", (format_name,)).lastrowid
+            operation = "insert"
+        else:
+            format_key, operation = row[0], None
+        current = set(name for (name,) in self._fetchall("""SELECT set_name FROM format_sets INNER JOIN sets ON fs_setkey = set_key
+                                                            WHERE fs_formatkey = ?""", (format_key,)))
+        for set_name in current - set(set_names):
+            self._execute("""DELETE FROM format_sets WHERE fs_formatkey = ?
+                             AND fs_setkey = (SELECT set_key FROM sets WHERE set_name = ?)""", (format_key, set_name))
+            operation = operation or "update"
+        for set_name in set(set_names) - current:
+            self._execute("""INSERT INTO format_sets (fs_formatkey, fs_setkey)
+                             SELECT ?, set_key FROM sets WHERE set_name = ?""", (format_key, set_name))
+            operation = operation or "update"
+        return format_key, operation
+
+    @instrumented
+    def rotate_format(self, format_name, set_names):
+        """
+        Make a format hold exactly the given sets, e.g. to rotate the oldest sets out of
+        Standard, creating the format if needed. Only the rows of format_cards of the sets
+        that enter or leave the format are written, and the rotation is logged in
+        catalog_changes. Return True if the format was changed.
+
+        Parameters
+        ----------
+        format_name : str
+            The name of the format
+        set_names : list of str
+            The names of its sets, which must exist
+        """
+
+        self._check_writable("rotate_format")
+        try:
+            if not self.has_triggers():
+                self._install_triggers()
+            known = set(name for (name,) in self._fetchall("SELECT set_name FROM sets"))
+            unknown = [set_name for set_name in set_names if set_name not in known]
+            if len(unknown) > 0:
+                print("Error in rotate_format: unknown sets", ", ".join(unknown))
+                self.conn.rollback()
+                return False
+            self._create_change_log()
+            format_key, operation = self._set_format_sets(format_name, set_names)
+            if operation is not None:
+                self._log_change("formats", format_key, format_name, operation)
+            self.conn.commit()
+        except Error as e:
+            self.conn.rollback()
+            print("Error in rotate_format:", e)
+            return False
+
+        if operation is not None:
+            self.invalidate_caches()
+        return operation is not None
+
+    def get_formats(self):
+        """
+        Return the formats as a dictionary of format name -> sorted list of set names.
+        """
+
+        formats = {}
+        try:
+            for format_name, set_name in self._fetchall("""SELECT format_name, set_name FROM formats
+                                                         LEFT JOIN format_sets ON fs_formatkey = format_key
+                                                         LEFT JOIN sets ON fs_setkey = set_key
+                                                         ORDER BY format_name, set_name"""):
+                names = formats.setdefault(format_name, [])
+                if set_name is not None:
+                    names.append(set_name)
+        except Error as e:
+            print("Error in get_formats:", e)
+        return formats
+
+    def _load_formats(self):
+        # Lower case format name -> frozenset of the keys of its cards, from the snapshot if
+        # one is loaded
+        if self.snapshot is not None:
+            self._formats = {}
+            for i in range(self.snapshot.num_formats):
+                format_name = self.snapshot.string(self.snapshot.column("format_name")[i])
+                self._formats[format_name.lower()] = frozenset(self.snapshot.format_keys(format_name))
+            return
+
+        keys = {}
+        for format_name, card_key in self._fetchall("""SELECT format_name, fc_cardkey FROM format_cards
+                                                     INNER JOIN formats ON fc_formatkey = format_key"""):
+            keys.setdefault(format_name.lower(), set()).add(card_key)
+        self._formats = {format_name: frozenset(card_keys) for format_name, card_keys in keys.items()}
+
+    def get_format_ids(self, format_name):
+        """
+        Return the keys of every card of the given format, as a frozenset. The cards of
+        every format are read in one query on first use and cached.
+
+        Parameters
+        ----------
+        format_name : str
+            The format name
+        """
+
+        if self._formats is None:
+            try:
+                self._load_formats()
+            except Error as e:
+                print("Error in get_format_ids:", e)
+                return frozenset()
+        return self._formats.get(format_name.lower(), frozenset())
+
+    def generateWeapons(self, num_cards=None):
+        self._check_writable("generateWeapons")
         try:
             self.create_table('weapons', ['weapon_cardkey integer', 'weapon_attack integer', 'weapon_durability integer', 'weapon_text varchar(25) not null'])
         except Error as e:
-            print("Error creating weapons table...")
-            print(e)
+            self.reporter.error("weapons", "create table", e)
         try:
-            with open("data/cards.csv", 'r') as cardData:
-                cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
-                header = next(cardReader)
-                #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
-                print(header)
-                for card in cardReader:
-                    #minions format: cardkey, attack, health, text
-                    if card[1] != 'Weapon':
-                        continue 
-                    else:
-                        try:
-                            sql = '''select card_key from cards where card_name = "{}"'''.format(card[0])
-                            cur = self.conn.cursor()
-                            cur.execute(sql)
-                            weapon_cardkey = cur.fetchone()
-                            weapon_cardkey = weapon_cardkey[0]
-                            weapon_attack = card[4]
-                            weapon_durability = card[5]
-                            weapon_text = card[6]
-                            sql = '''Insert INTO {}(weapon_cardkey, weapon_attack, weapon_durability, weapon_text) values (?,?,?,?)'''.format("weapons")
-                            args = [weapon_cardkey, weapon_attack, weapon_durability, weapon_text]
-                            #print(sql)
-                            self.conn.execute(sql, args)
-                            self.conn.commit()
-                            self.checkForKeywords(weapon_cardkey, weapon_text)
-                        except Error as e:
-                            self.conn.rollback()
-                            print("Error inserting weapon {} into weapons table".format(card[0]))
-                            print(e)
-            cardData.close()
-            print("SUCCESS!")
-        except Error as e:
-            print("ERROR reading/inserting weapon cards into weapons table")
-        print("Completed weapons table generation...\n")
-
-    def generateSpells(self):
-        print("Begin generating spells table...")
+            self.reporter.start_table("weapons")
+            for card in self._scan_cards_csv(num_cards):
+                #weapons format: cardkey, attack, durability, text
+                if card[1] != 'Weapon':
+                    continue 
+                else:
+                    try:
+                        sql = '''select card_key from cards where card_name = ?'''
+                        weapon_cardkey = self._fetchone(sql, (card[0],))
+                        weapon_cardkey = weapon_cardkey[0]
+                        weapon_attack = card[4]
+                        weapon_durability = card[5]
+                        weapon_text = card[6]
+                        sql = '''Insert INTO weapons(weapon_cardkey, weapon_attack, weapon_durability, weapon_text) values (?,?,?,?)'''
+                        args = (weapon_cardkey, weapon_attack, weapon_durability, weapon_text)
+                        self._execute(sql, args)
+                        self.conn.commit()
+                        self.checkForKeywords(weapon_cardkey, weapon_text)
+                        self.reporter.row("weapons")
+                    except Error as e:
+                        self.conn.rollback()
+                        self.reporter.error("weapons", card[0], e)
+            self.reporter.end_table("weapons")
+        except Error as e:
+            self.reporter.error("weapons", "cards.csv", e)
+
+    def generateSpells(self, num_cards=None):
+        self._check_writable("generateSpells")
         try:
             self.create_table('spells', ['spell_cardkey integer', 'spell_text varchar(25) not null'])
         except Error as e:
-            print("Error creating spells table...")
-            print(e)
+            self.reporter.error("spells", "create table", e)
         try:
-            with open("data/cards.csv", 'r') as cardData:
-                cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
-                header = next(cardReader)
-                #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
-                print(header)
-                for card in cardReader:
-                    #minions format: cardkey, attack, health, text
-                    if card[1] != 'Spell':
-                        continue 
-                    else:
-                        try:
-                            sql = '''select card_key from cards where card_name = "{}"'''.format(card[0])
-                            cur = self.conn.cursor()
-                            cur.execute(sql)
-                            spell_cardkey = cur.fetchone()
-                            spell_cardkey = spell_cardkey[0]
-                            spell_text = card[6]
-                            sql = '''Insert INTO {}(spell_cardkey, spell_text) values (?,?)'''.format("spells")
-                            args = [spell_cardkey, spell_text]
-                            #print(sql)
-                            self.conn.execute(sql, args)
-                            self.conn.commit()
-                            self.checkForKeywords(spell_cardkey, spell_text)
-                        except Error as e:
-                            self.conn.rollback()
-                            print("Error inserting spell {} into spells table".format(card[0]))
-                            print(e)
-            cardData.close()
-            print("SUCCESS")
-        except Error as e:
-            print("ERROR reading/inserting spells into spell table")
-        
-        print("Completed spells table generation...\n")
+            self.reporter.start_table("spells")
+            for card in self._scan_cards_csv(num_cards):
+                #spells format: cardkey, text
+                if card[1] != 'Spell':
+                    continue 
+                else:
+                    try:
+                        sql = '''select card_key from cards where card_name = ?'''
+                        spell_cardkey = self._fetchone(sql, (card[0],))
+                        spell_cardkey = spell_cardkey[0]
+                        spell_text = card[6]
+                        sql = '''Insert INTO spells(spell_cardkey, spell_text) values (?,?)'''
+                        args = (spell_cardkey, spell_text)
+                        self._execute(sql, args)
+                        self.conn.commit()
+                        self.checkForKeywords(spell_cardkey, spell_text)
+                        self.reporter.row("spells")
+                    except Error as e:
+                        self.conn.rollback()
+                        self.reporter.error("spells", card[0], e)
+            self.reporter.end_table("spells")
+        except Error as e:
+            self.reporter.error("spells", "cards.csv", e)
 
-    def generateMinions(self):
-        print("Begin generating minions table...")
+    def generateMinions(self, num_cards=None):
+        self._check_writable("generateMinions")
         try:
             self.create_table('minions', ['minion_cardkey integer', 'minion_attack integer', 'minion_health integer', 'minion_text varchar(25) not null'])
         except Error as e:
-            print("Error creating minions table...")
-            print(e)
+            self.reporter.error("minions", "create table", e)
         try:
-            with open("data/cards.csv", 'r') as cardData:
-                cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
-                header = next(cardReader)
-                #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
-                print(header)
-                for card in cardReader:
-                    #minions format: cardkey, attack, health, text
-                    if card[1] != 'Minion':
-                        continue 
-                    else:
-                        print(card)
-                        try:
-                            attack = card[4]
-                            health = card[5]
-                            text = card[6]
-                            sql = '''select card_key from Cards where card_name = "{}"'''.format(card[0])
-                            cur = self.conn.cursor()
-                            cur.execute(sql)
-                            cardkey = cur.fetchone()
-                            cardkey = cardkey[0]
-                            #print("cardkey:{} | health:{} | text:{} | {}".format(cardkey, health, attack, text))
-                            sql = '''INSERT INTO {}(minion_cardkey, minion_attack, minion_health, minion_text) values (?,?,?,?)'''.format('minions')
-                            args = [cardkey, attack, health, text]
-                            self.conn.execute(sql, args)
-                            self.conn.commit()
-                            self.checkForKeywords(cardkey, text)
-                        except Error as e:
-                            print("ERROR inserting {} into minion table...".format(card[0]))
-                            self.conn.rollback()
-                            print(e)
-            cardData.close()
-            print("SUCCESS!")
+            self.reporter.start_table("minions")
+            for card in self._scan_cards_csv(num_cards):
+                #minions format: cardkey, attack, health, text
+                if card[1] != 'Minion':
+                    continue 
+                else:
+                    try:
+                        attack = card[4]
+                        health = card[5]
+                        text = card[6]
+                        sql = '''select card_key from cards where card_name = ?'''
+                        cardkey = self._fetchone(sql, (card[0],))
+                        cardkey = cardkey[0]
+                        sql = '''INSERT INTO minions(minion_cardkey, minion_attack, minion_health, minion_text) values (?,?,?,?)'''
+                        args = (cardkey, attack, health, text)
+                        self._execute(sql, args)
+                        self.conn.commit()
+                        self.checkForKeywords(cardkey, text)
+                        self.reporter.row("minions")
+                    except Error as e:
+                        self.conn.rollback()
+                        self.reporter.error("minions", card[0], e)
+            self.reporter.end_table("minions")
         except Error as e:
-            print(e)
-        print("Done generating minion table...\n")                
+            self.reporter.error("minions", "cards.csv", e)
 
-    def generateClassCardsTable(self):
+    def generateClassCardsTable(self, num_cards=None):
+        self._check_writable("generateClassCardsTable")
         #will match up cardkey to corresponding classkey
         #must open cards.csv to get class name
         #fetch card name and card class from .csv getch card key from Cards & fetch class key from Classes
         try:
             self.create_table("class_cards", ["cc_cardkey integer", "cc_classkey integer"])
         except Error as e:
-            print("ERROR in creating class_cards")
-            print(e)
+            self.reporter.error("class_cards", "create table", e)
         
         try:
-            with open('data/cards.csv', 'r') as cardData:
-                cardReader = csv.reader(cardData, quoting=csv.QUOTE_ALL, skipinitialspace=True)
-                header = next(cardReader)
-                #cards csv format ['Name', 'Type', 'Rarity', 'Cost', 'Attack', 'Health', 'Text', 'Classes']
-                for card in cardReader:
-                    card_name = card[0]
-                    card_classes = card[7].split("|")
-                    #print("got card class/name")
-                    sql = '''select card_key from cards where card_name = "{}"'''.format(card_name)
-                    cur = self.conn.cursor()
-                    cur.execute(sql) #get card_key from cards table
-                    values = cur.fetchone()
-                    card_key = values[0]
-                    #print("got card key")
-                    #print("Class Key Values:")
-                    for card_class in card_classes:
-                        sql = '''select class_key from classes where class_name = "{}"'''.format(card_class)
-                        cur = self.conn.cursor()
-                        cur.execute(sql)
-                        card_class_val = cur.fetchone()
-                        #print(card_class_val[0])
-                    #for cardclass in cardclasses:
-                    #    print(cardclass)
-                    #card_classkey = values[0]
-                        #print("got card class key")
-                        #print("card name: {} | card key: {} | class: {} | classkey: {}\n".format(card_name, card_key, card_class, card_class_val[0]))
-                        try:
-                            sql = '''Insert into {} (cc_cardkey, cc_classkey) values ({},{})'''.format('class_cards', card_key, card_class_val[0])
-                            #print(sql)
-                            self.conn.execute(sql)
-                            self.conn.commit()
-                        except Error as e:
-                            print("Failed to insert class_cards entry for {}".format(card_name))
-                            print(e)
-                            self.conn.rollback()
-            cardData.close()
-            print("SUCCESS!")
+            self.reporter.start_table("class_cards")
+            for card in self._scan_cards_csv(num_cards):
+                card_name = card[0]
+                card_classes = card[7].split("|")
+                sql = '''select card_key from cards where card_name = ?'''
+                values = self._fetchone(sql, (card_name,)) #get card_key from cards table
+                card_key = values[0]
+                for card_class in card_classes:
+                    sql = '''select class_key from classes where class_name = ?'''
+                    card_class_val = self._fetchone(sql, (card_class,))
+                    try:
+                        sql = '''Insert into class_cards (cc_cardkey, cc_classkey) values (?,?)'''
+                        self._execute(sql, (card_key, card_class_val[0]))
+                        self.conn.commit()
+                        self.reporter.row("class_cards")
+                    except Error as e:
+                        self.reporter.error("class_cards", card_name, e)
+                        self.conn.rollback()
+            self.reporter.end_table("class_cards")
         except Error as e:
-            print(e)
-        print("Finished generating class_card table!\n")
+            self.reporter.error("class_cards", "cards.csv", e)
     
     def insertHeroToTable(self, table, hero_name, hero_power_name, hero_power_cost, hero_power_text, hero_class):
-        #print("Inserting hero {} to table...".format(hero_name))
+        self._check_writable("insertHeroToTable")
         try:
             sql = """INSERT INTO {} (hero_classkey, hero_name, hero_power_name, hero_power_cost, hero_power_text) VALUES (?,?,?,?,?)""".format(table)
-            classKeyValSQL = """select class_key from classes where class_name = '{}'""".format(hero_class)
-            #print(sql)
+            classKeyValSQL = """select class_key from classes where class_name = ?"""
             try:
-                cur = self.conn.cursor()
-                cur.execute(classKeyValSQL) #extract the classkey from the classes database
-                classKeyVal = cur.fetchone()
+                classKeyVal = self._fetchone(classKeyValSQL, (hero_class,)) #extract the classkey from the classes database
                 classKeyVal = classKeyVal[0]#remove the ',' at the end
-                #print("classkey for {} who is a {} is {}".format(hero_name, hero_class, classKeyVal))
 
             except Error as e:
-                print("Error extracting class key for {}".format(hero_name))
-                print(e)
+                self.reporter.error(table, hero_name, "no class key for {}: {}".format(hero_class, e))
 
-            args = [classKeyVal, hero_name, hero_power_name, hero_power_cost, hero_power_text]
-            self.conn.execute(sql,args)
+            args = (classKeyVal, hero_name, hero_power_name, hero_power_cost, hero_power_text)
+            self._execute(sql,args)
             self.conn.commit()
 
         except Error as e:
-            print("*Error inserting {} into hero table...".format(hero_name))
-            print(e)
+            self.reporter.error(table, hero_name, e)
 
     def insertCardToTable(self, table, card_name, card_cost, card_rarity, card_type):
-        #print("Inserting card to table...")
+        self._check_writable("insertCardToTable")
         try:
             sql = """INSERT INTO {} (card_name, card_cost, card_rarity, card_type) VALUES(?,?,?,?)""".format(table)
-            args = [card_name, card_cost, card_rarity, card_type]
-            self.conn.execute(sql, args)
+            args = (card_name, card_cost, card_rarity, card_type)
+            self._execute(sql, args)
             self.conn.commit()
         except Error as e:
             self.conn.rollback()
-            print(e)
-        #print("Done inserting card data to table...")
+            self.reporter.error(table, card_name, e)
+
     def checkForKeywords(self, card_key, card_text):
+        self._check_writable("checkForKeywords")
         try:
             sql = '''select keyword_key, keyword_name from keywords'''
-            cur = self.conn.cursor()
-            cur.execute(sql)
-            keywords = cur.fetchall()
+            keywords = self._fetchall(sql)
             for keyword in keywords:
                 #0->key 1->name
                 if keyword[1] in card_text:
                     try:
-                        print("matching keyword {} - {} - with card_key {}".format(keyword[0], keyword[1], card_key))
                         sql = '''insert into keyword_cards values (?,?)'''
-                        args = [keyword[0], card_key]
-                        self.conn.execute(sql, args)
+                        args = (keyword[0], card_key)
+                        self._execute(sql, args)
                     except Error as e:
-                        print("Error inserting a keyword-card_key pair for word:{} card:{}".format(keyword[1], card_key))
-                        print(e)
-                else:
-                    pass
+                        self.reporter.error("keyword_cards", "{} / card {}".format(keyword[1], card_key), e)
             self.conn.commit()
         except Error as e:
             self.conn.rollback()
-            print("Error in keyword search/insert for card {}".format(card_key))
-            print(e)
+            self.reporter.error("keyword_cards", "card {}".format(card_key), e)
         
     def drop_table(self, name):
         """
@@ -495,13 +1272,16 @@ class HSDB:
             The name of the table
         """
 
+        self._check_writable("drop_table")
+
         try:
             sql_statement = "DROP TABLE IF EXISTS " + name + ";"
-            self.conn.execute(sql_statement)
+            self._execute(sql_statement)
         except Error as e:
             print("Error in drop_table:", e)
 
-    def check_card(self, card_name):
+    @instrumented
+    def check_card(self, card_name, format_name=None):
         """
         Return True if the given card exists in the database.
 
@@ -509,16 +1289,27 @@ class HSDB:
         ----------
         card_name : str
             The card name
+        format_name : str
+            If not None, the card must also be part of this format
         """
 
+        if self.catalog is not None:
+            return self.catalog.check_card(card_name, format_name)
+
+        if self.snapshot is not None:
+            return self.snapshot.check_card(card_name, format_name)
+
+        if format_name is not None:
+            card_key = self.get_card_key(card_name)
+            return card_key is not None and card_key in self.get_format_ids(format_name)
+
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM cards WHERE card_name like ?", (card_name,))
-            return cursor.fetchone() is not None
+            return self._fetchone("SELECT * FROM cards WHERE card_name like ?", (card_name,)) is not None
         except Error as e:
             print("Error in check_card:", e)
             return False
 
+    @instrumented
     def check_class(self, class_name):
         """
         Return True if the given class exists in the database.
@@ -529,14 +1320,19 @@ class HSDB:
             The class name
         """
 
+        if self.catalog is not None:
+            return self.catalog.check_class(class_name)
+
+        if self.snapshot is not None:
+            return self.snapshot.check_class(class_name)
+
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM classes WHERE class_name like ?", (class_name,))
-            return cursor.fetchone() is not None
+            return self._fetchone("SELECT * FROM classes WHERE class_name like ?", (class_name,)) is not None
         except Error as e:
             print("Error in check_class:", e)
             return False
 
+    @instrumented
     def check_hero(self, hero_name):
         """
         Return True if the given hero exists in the database.
@@ -547,15 +1343,17 @@ class HSDB:
             The hero name
         """
 
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("SELECT * FROM heroes WHERE hero_name like ?", (hero_name,))
-            return cursor.fetchone() is not None
-        except Error as e:
-            print("Error in check_hero:", e)
-            return False
+        if self.catalog is not None:
+            return self.catalog.get_hero(hero_name) is not None
+
+        if self.snapshot is not None:
+            return self.snapshot.check_hero(hero_name)
 
-    def check_card_class(self, card_name, class_name):
+        registry = self.get_hero_registry()
+        return registry is not None and hero_name in registry
+
+    @instrumented
+    def check_card_class(self, card_name, class_name, format_name=None):
         """
         Return True if the given class has access to the given card.
 
@@ -565,19 +1363,475 @@ class HSDB:
             The card name
         class_name : str
             The class name
+        format_name : str
+            If not None, the card must also be part of this format
         """
 
+        if self.snapshot is not None:
+            return self.snapshot.check_card_class(card_name, class_name) and \
+                (format_name is None or self.snapshot.check_card(card_name, format_name))
+
+        sql = """SELECT * FROM class_cards 
+                 INNER JOIN cards ON cc_cardkey=card_key
+                 INNER JOIN classes ON cc_classkey=class_key
+                 WHERE card_name like ? AND class_name like ?"""
+        parameters = (card_name, class_name)
+        if format_name is not None:
+            sql += " AND " + FORMAT_FILTER
+            parameters += (format_name,)
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("""SELECT * FROM class_cards 
-                              INNER JOIN cards ON cc_cardkey=card_key
-                              INNER JOIN classes ON cc_classkey=class_key
-                              WHERE card_name like ? AND class_name like ?""", (card_name, class_name,))
-            return cursor.fetchone() is not None
+            return self._fetchone(sql, parameters) is not None
         except Error as e:
             print("Error in check_card_class:", e)
             return False
 
+    def invalidate_caches(self):
+        """
+        Drop every in-memory cache built from the catalog, e.g. after the catalog changed.
+        """
+
+        self.generation += 1
+        self._result_stamp = None
+        self._card_keys = None
+        self._card_info = None
+        self._heroes = None
+        self._pools = None
+        self._formats = None
+        self._format_pools = {}
+        self._name_indexes = {}
+        self._bk_trees = {}
+        self._facets = None
+        self._format_facets = {}
+
+    def _load_card_keys(self):
+        # Lower case card name -> card key. If two cards share a name, the first one wins,
+        # like the SQL lookups by name.
+        card_keys = {}
+        for card_key, card_name in self._fetchall("SELECT card_key, card_name FROM cards ORDER BY card_key"):
+            card_keys.setdefault(card_name.lower(), card_key)
+        self._card_keys = card_keys
+
+    def _load_card_info(self):
+        # Lower case card name -> CardInfo, the first card winning like in _load_card_keys.
+        # The attack is the minion or weapon attack, the health is the minion health.
+        card_info = {}
+        for row in self._fetchall("""SELECT card_key, card_name, card_type, card_cost, card_rarity,
+                                           COALESCE(minion_attack, weapon_attack), minion_health
+                                    FROM cards
+                                    LEFT JOIN minions ON minion_cardkey = card_key
+                                    LEFT JOIN weapons ON weapon_cardkey = card_key
+                                    ORDER BY card_key"""):
+            card_info.setdefault(row[1].lower(), CardInfo._make(row))
+        self._card_info = card_info
+
+    def _load_pools(self):
+        # Read every class pool at once, from the snapshot if one is loaded. Databases
+        # built before class_pools existed compute them from class_cards instead.
+        if self.snapshot is not None:
+            self._pools = {}
+            for i in range(self.snapshot.num_classes):
+                rows = self.snapshot.pool_rows(self.snapshot.class_name(i))
+                self._pools[self.snapshot.class_name(i).lower()] = (
+                    frozenset(self.snapshot.column("card_key")[row] for row in rows),
+                    sorted(self.snapshot.card_name(row) for row in rows))
+            return
+
+        try:
+            rows = self._fetchall("""SELECT class_name, card_key, card_name FROM class_pools
+                                     INNER JOIN classes ON pool_classkey = class_key
+                                     INNER JOIN cards ON pool_cardkey = card_key""")
+        except Error:
+            rows = self._fetchall("""SELECT class_name, card_key, card_name FROM (""" + POOL_SELECT + """) AS pool
+                                     INNER JOIN classes ON pool.class_key = classes.class_key
+                                     INNER JOIN cards ON pool.cc_cardkey = card_key""", ("Neutral",))
+
+        keys = {}
+        names = {}
+        for class_name, card_key, card_name in rows:
+            class_name = class_name.lower()
+            keys.setdefault(class_name, set()).add(card_key)
+            names.setdefault(class_name, set()).add(card_name)
+        self._pools = {}
+        for class_name in keys:
+            self._pools[class_name] = (frozenset(keys[class_name]), sorted(names[class_name]))
+
+    def get_card_key(self, card_name):
+        """
+        Return the key of the given card (case insensitive), or None if it does not exist.
+        The lookup is a dictionary access once the card names are cached.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name
+        """
+
+        if self.catalog is not None:
+            info = self.catalog.get_card(card_name)
+            return None if info is None else info.card_key
+
+        if self.snapshot is not None:
+            return self.snapshot.get_card_key(card_name)
+
+        if self._card_keys is None:
+            try:
+                self._load_card_keys()
+            except Error as e:
+                print("Error in get_card_key:", e)
+                return None
+        return self._card_keys.get(card_name.lower())
+
+    def get_card_info(self, card_name):
+        """
+        Return the CardInfo (key, name, type, cost, rarity, attack and health) of the given
+        card (case insensitive), or None if it does not exist. The information of every
+        card is read in one query on first use and cached.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name
+        """
+
+        if self.catalog is not None:
+            return self.catalog.get_card(card_name)
+
+        if self.snapshot is not None:
+            info = self.snapshot.get_card_info(card_name)
+            return None if info is None else CardInfo._make(info)
+
+        if self._card_info is None:
+            try:
+                self._load_card_info()
+            except Error as e:
+                print("Error in get_card_info:", e)
+                return None
+        return self._card_info.get(card_name.lower())
+
+    def get_hero_registry(self):
+        """
+        Return the HeroRegistry of the catalog (hero -> class and hero power, class ->
+        heroes), read in one query (or from the snapshot, if one is loaded) on first use
+        and cached until the catalog changes, or None if the heroes cannot be read.
+        """
+
+        if self._heroes is None and self.snapshot is not None:
+            self._heroes = HeroRegistry(HeroRow._make(row) for row in self.snapshot.hero_rows())
+        elif self._heroes is None:
+            try:
+                self._heroes = HeroRegistry(HeroRow._make(row) for row in self._fetchall(
+                    """SELECT heroes.rowid, hero_name, class_name, hero_power_name, hero_power_cost, hero_power_text
+                       FROM heroes INNER JOIN classes ON hero_classkey=class_key
+                       ORDER BY heroes.rowid"""))
+            except Error as e:
+                print("Error in get_hero_registry:", e)
+                return None
+        return self._heroes
+
+    @instrumented
+    def get_hero(self, hero_name):
+        """
+        Return the HeroRow (key, name, class, hero power name, cost and text) of the given
+        hero (case insensitive), or None if it does not exist.
+
+        Parameters
+        ----------
+        hero_name : str
+            The hero name
+        """
+
+        if self.catalog is not None:
+            return self.catalog.get_hero(hero_name)
+
+        if self.snapshot is not None:
+            hero = self.snapshot.get_hero(hero_name)
+            return None if hero is None else HeroRow._make(hero)
+
+        registry = self.get_hero_registry()
+        return None if registry is None else registry.get(hero_name)
+
+    @instrumented
+    def resolve_heroes(self, hero_names):
+        """
+        Return the HeroRow of every given hero (case insensitive), in the same order, None
+        for the heroes that do not exist. This resolves the heroes of many decklists at
+        once, without a query per hero.
+
+        Parameters
+        ----------
+        hero_names : list of str
+            The hero names
+        """
+
+        if self.catalog is not None:
+            return [self.catalog.get_hero(hero_name) for hero_name in hero_names]
+
+        if self.snapshot is not None:
+            return [self.get_hero(hero_name) for hero_name in hero_names]
+
+        registry = self.get_hero_registry()
+        if registry is None:
+            return [None] * len(hero_names)
+        return registry.resolve(hero_names)
+
+    def _format_pool(self, class_name, format_name):
+        # The pool of a class narrowed to a format, cached like the pools
+        key = (class_name.lower(), format_name.lower())
+        pool = self._format_pools.get(key)
+        if pool is None:
+            format_ids = self.get_format_ids(format_name)
+            ids, names = self._pools.get(key[0], (frozenset(), []))
+            names = [name for name in names if self.get_card_key(name) in format_ids]
+            pool = self._format_pools[key] = (ids & format_ids, names)
+        return pool
+
+    def get_pool_ids(self, class_name, format_name=None):
+        """
+        Return the keys of every card the given class can put in a deck, as a frozenset.
+
+        Parameters
+        ----------
+        class_name : str
+            The class name
+        format_name : str
+            If not None, only the cards of this format
+        """
+
+        if self._pools is None:
+            try:
+                self._load_pools()
+            except Error as e:
+                print("Error in get_pool_ids:", e)
+                return frozenset()
+        if format_name is not None:
+            return self._format_pool(class_name, format_name)[0]
+        return self._pools.get(class_name.lower(), (frozenset(), []))[0]
+
+    def get_pool_cards(self, class_name, format_name=None):
+        """
+        Return the names of every card the given class can put in a deck, sorted. The list
+        is cached and shared, do not modify it.
+
+        Parameters
+        ----------
+        class_name : str
+            The class name
+        format_name : str
+            If not None, only the cards of this format
+        """
+
+        if self.catalog is not None:
+            return self.catalog.get_pool_cards(class_name, format_name)
+
+        if self._pools is None:
+            try:
+                self._load_pools()
+            except Error as e:
+                print("Error in get_pool_cards:", e)
+                return []
+        if format_name is not None:
+            return self._format_pool(class_name, format_name)[1]
+        return self._pools.get(class_name.lower(), (frozenset(), []))[1]
+
+    def is_legal(self, card_name, class_name, format_name=None):
+        """
+        Return True if the given card exists and the given class can put it in a deck,
+        i.e. the card belongs to the class or is neutral (and to the format, if given).
+
+        Parameters
+        ----------
+        card_name : str
+            The card name
+        class_name : str
+            The class name
+        format_name : str
+            If not None, the card must also be part of this format
+        """
+
+        if self.catalog is not None:
+            return self.catalog.is_legal(card_name, class_name, format_name)
+
+        if self.snapshot is not None:
+            return self.snapshot.is_legal(card_name, class_name, format_name)
+
+        card_key = self.get_card_key(card_name)
+        return card_key is not None and card_key in self.get_pool_ids(class_name, format_name)
+
+    def _scope_names(self, class_name, format_name=None):
+        # Every card name, or the names of the legal pool of a class, in a format or not
+        if class_name is not None:
+            return self.get_pool_cards(class_name, format_name)
+        if format_name is not None:
+            return [row[0] for row in self._fetchall("SELECT card_name FROM cards WHERE " + FORMAT_FILTER, (format_name,))]
+        return [row[0] for row in self._fetchall("SELECT card_name FROM cards")]
+
+    def autocomplete(self, prefix, class_name=None, limit=10, format_name=None):
+        """
+        Return up to limit card names that start with the given prefix (case insensitive).
+        The prefix index of every scope is built on first use and cached.
+
+        Parameters
+        ----------
+        prefix : str
+            The beginning of the card name
+        class_name : str
+            If not None, only suggest cards from the legal pool of this class
+        limit : int
+            The maximum number of names returned
+        format_name : str
+            If not None, only suggest cards of this format
+        """
+
+        scope = (class_name and class_name.lower(), format_name and format_name.lower())
+        index = self._name_indexes.get(scope)
+        if index is None:
+            try:
+                index = self._name_indexes[scope] = NameIndex(self._scope_names(class_name, format_name))
+            except Error as e:
+                print("Error in autocomplete:", e)
+                return []
+        return index.complete(prefix, limit)
+
+    def suggest_cards(self, card_name, class_name=None, max_distance=2, limit=5, format_name=None):
+        """
+        Return up to limit card names within max_distance edits of the given (probably
+        misspelled) name, closest first. Meant for "did you mean" messages.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name that was typed
+        class_name : str
+            If not None, only suggest cards from the legal pool of this class
+        max_distance : int
+            The maximum edit distance
+        limit : int
+            The maximum number of names returned
+        format_name : str
+            If not None, only suggest cards of this format
+        """
+
+        scope = (class_name and class_name.lower(), format_name and format_name.lower())
+        tree = self._bk_trees.get(scope)
+        if tree is None:
+            try:
+                tree = self._bk_trees[scope] = BKTree(self._scope_names(class_name, format_name))
+            except Error as e:
+                print("Error in suggest_cards:", e)
+                return []
+        return [name for _, name in tree.search(card_name, max_distance)[:limit]]
+
+    def _load_facets(self):
+        # One row per card with its attack and health (durability for weapons), then its
+        # classes and keywords, gathered in two more queries
+        cards = []
+        rows = {}
+        for card_key, card_name, card_cost, card_rarity, card_type, attack, health in self._fetchall(
+                """SELECT card_key, card_name, card_cost, card_rarity, card_type,
+                          COALESCE(minion_attack, weapon_attack), COALESCE(minion_health, weapon_durability)
+                   FROM cards
+                   LEFT JOIN minions ON minion_cardkey = card_key
+                   LEFT JOIN weapons ON weapon_cardkey = card_key
+                   ORDER BY card_key"""):
+            card = {"card_key": card_key, "name": card_name, "cost": card_cost, "rarity": card_rarity, "type": card_type,
+                    "attack": attack, "health": health, "classes": [], "keywords": []}
+            if card_key not in rows:
+                rows[card_key] = card
+                cards.append(card)
+        for card_key, class_name in self._fetchall("""SELECT DISTINCT cc_cardkey, class_name FROM class_cards
+                                                      INNER JOIN classes ON cc_classkey = class_key"""):
+            if card_key in rows:
+                rows[card_key]["classes"].append(class_name)
+        for card_key, keyword_name in self._fetchall("""SELECT DISTINCT card_key, keyword_name FROM keyword_cards
+                                                        INNER JOIN keywords USING (keyword_key)"""):
+            if card_key in rows:
+                rows[card_key]["keywords"].append(keyword_name)
+        self._facets = FacetIndex(cards)
+
+    def get_facet_index(self, format_name=None):
+        """
+        Return the bitmap index of the catalog used by query_cards, built on first use and
+        cached until the catalog changes.
+
+        Parameters
+        ----------
+        format_name : str
+            If not None, the index of the cards of this format only, built from the index
+            of the catalog. Its bitmaps only cover the cards of the format, so queries on a
+            small format are cheaper than on the whole catalog.
+        """
+
+        if self._facets is None:
+            self._load_facets()
+        if format_name is None:
+            return self._facets
+        key = format_name.lower()
+        index = self._format_facets.get(key)
+        if index is None:
+            format_ids = self.get_format_ids(format_name)
+            index = self._format_facets[key] = FacetIndex([card for card in self._facets.cards if card["card_key"] in format_ids])
+        return index
+
+    @instrumented
+    def query_cards(self, card_name=None, card_cost=None, card_attack=None, card_health=None, card_rarity=None,
+                    card_type=None, class_name=None, keywords=None, keywords_any=None, sort_by="name",
+                    descending=False, offset=0, limit=None, facets=NUMERIC_FACETS + TEXT_FACETS, format_name=None):
+        """
+        Faceted card search: filter the catalog, count the values of every facet among the
+        matching cards, then sort and return one page. Filters are intersections of
+        in-memory bitmaps, so no SQL is run once the index is built.
+
+        Return a dictionary with:
+            - total (int): the number of matching cards
+            - cards (list of dict): the page of cards, with the keys card_key, name,
+              cost, rarity, type, attack, health, classes and keywords
+            - facets (dict): value -> number of matching cards, by facet ("cost",
+              "attack", "health", "rarity", "type", "class" and "keyword")
+
+        Parameters
+        ----------
+        card_name : str
+            Full or partial card name
+        card_cost, card_attack, card_health : int, (int, int) or list of int
+            A value, an inclusive (low, high) range where None is an open end, or a set
+            of values. The health of a weapon is its durability.
+        card_rarity, card_type, class_name : str or list of str
+            A value or a set of values
+        keywords : str or list of str
+            The cards must have all of these keywords
+        keywords_any : list of str
+            The cards must have at least one of these keywords
+        sort_by : str
+            One of "name", "cost", "attack", "health", "rarity", "type" or "card_key"
+        descending : bool
+            Sort in descending order
+        offset : int
+            The number of matching cards to skip
+        limit : int
+            The maximum number of cards returned, None for all of them
+        facets : tuple of str
+            The facets to count, empty for none
+        format_name : str
+            If not None, only search the cards of this format (e.g. "Standard")
+        """
+
+        empty = {"total": 0, "cards": [], "facets": {}}
+        try:
+            index = self.get_facet_index(format_name)
+        except Error as e:
+            print("Error in query_cards:", e)
+            return empty
+
+        try:
+            return index.query(sort_by=sort_by, descending=descending, offset=offset, limit=limit, facets=facets,
+                               name=card_name, cost=card_cost, attack=card_attack, health=card_health,
+                               rarity=card_rarity, card_type=card_type, class_name=class_name,
+                               keywords=keywords, keywords_any=keywords_any)
+        except ValueError as e:
+            print("Error in query_cards:", e)
+            return empty
+
+    @instrumented
     def check_neutral(self, card_name):
         """
         Return True if the given card is a neutral card.
@@ -590,20 +1844,32 @@ class HSDB:
 
         return self.check_card_class(card_name, "Neutral")
 
+    @instrumented
     def check_keyword(self, keyword):
         #will return the keyword if it matches, None if no match
         result = None
         try:
-            sql = '''select keyword_name from keywords where keyword_name = "{}"'''.format(keyword)
-            cur = self.conn.cursor()
-            cur.execute(sql)
-            result = cur.fetchone()
+            sql = '''select keyword_name from keywords where keyword_name = ?'''
+            result = self._fetchone(sql, (keyword,))
         except Error as e:
             print(e)
         
         return result
 
-    def get_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None):
+    @instrumented
+    def get_keywords(self):
+        """
+        Return the name of every keyword.
+        """
+
+        try:
+            return [row[0] for row in self._fetchall("SELECT keyword_name FROM keywords ORDER BY keyword_key")]
+        except Error as e:
+            print("Error in get_keywords:", e)
+            return []
+
+    @instrumented
+    def get_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None, format_name=None):
         """
         Return the name of all cards that match the given parameters.
 
@@ -619,68 +1885,47 @@ class HSDB:
             Type of card, must be one of "Minion", "Spell", or "Weapon"
         class_name : str
             Name of the class
+        format_name : str
+            If not None, only the cards of this format (e.g. "Standard")
         """
 
+        if self.catalog is not None:
+            return self.catalog.find_cards(card_name, card_cost, card_rarity, card_type, class_name, format_name)
+
         try:
-            # Construct SQL query
-            sql_where = "WHERE"
-            sql_parameters = ()
-            
-            # card_name
+            # Canonicalize the filters into a fixed SQL template
             if card_name is not None:
-                sql_where += " card_name like ?"
-                sql_parameters += ("%" + card_name + "%",)
-            
-            # card_cost
-            if card_cost is not None:
-                if len(sql_where) > 5:
-                    sql_where += " AND"
-                sql_where += " card_cost = ?"
-                sql_parameters += (card_cost,)
-
-            # card_rarity
-            if card_rarity is not None:
-                if len(sql_where) > 5:
-                    sql_where += " AND"
-                sql_where += " card_rarity like ?"
-                sql_parameters += (card_rarity,)
-
-            # card_type
-            if card_type is not None:
-                if len(sql_where) > 5:
-                    sql_where += " AND"
-                sql_where += " card_type like ?"
-                sql_parameters += (card_type,)
-
-            # class_name
-            if class_name is not None:
-                if len(sql_where) > 5:
-                    sql_where += " AND"
-                sql_where += " class_name like ?"
-                sql_parameters += (class_name,)
-
-            # Create cursor
-            cursor = self.conn.cursor()
-            
+                card_name = "%" + card_name + "%"
+            predicates, sql_parameters = canonicalize(CARD_FILTERS, {
+                "card_name": card_name,
+                "card_cost": card_cost,
+                "card_rarity": card_rarity,
+                "card_type": card_type,
+                "class_name": class_name,
+                "format_name": format_name,
+            })
+
             # Execute query
-            if len(sql_where) > 5:
-                cursor.execute("""SELECT DISTINCT card_name FROM cards
-                                  INNER JOIN class_cards ON card_key=cc_cardkey
-                                  INNER JOIN classes ON cc_classkey=class_key
-                                  """ + sql_where, sql_parameters)
+            if len(predicates) > 0:
+                sql = select_template("""SELECT DISTINCT card_name FROM cards
+                                         INNER JOIN class_cards ON card_key=cc_cardkey
+                                         INNER JOIN classes ON cc_classkey=class_key""", predicates)
             else:
-                cursor.execute("SELECT card_name FROM cards")
-            
-            # Get all of the matching rows
-            result = cursor.fetchall()
+                sql = "SELECT card_name FROM cards"
             
+            # Get all of the matching rows, through the result cache. LIKE ignores the
+            # case, so the key does too.
+            key = ("get_cards", sql) + tuple(value.lower() if isinstance(value, str) else value for value in sql_parameters)
+            result = self._cached(key, lambda: tuple(res[0] for res in self._fetchall(sql, sql_parameters)))
+
             # Return result as a list (of card names)
-            return [res[0] for res in result]
+            return list(result)
 
         except Error as e:
             print("Error in get_cards:", e)
             return []
 
+    @instrumented
     def get_heroes(self, hero_name=None, class_name=None):
         """
         Return the name of all heroes that match the given parameters.
@@ -693,44 +1938,112 @@ class HSDB:
             Name of the class
         """
 
-        try:
-            # Construct SQL query
-            sql_where = "WHERE"
-            sql_parameters = ()
-            
-            # hero_name
+        if self.catalog is not None:
+            names = self.catalog.get_heroes(class_name)
             if hero_name is not None:
-                sql_where += " hero_name like ?"
-                sql_parameters += ("%" + hero_name + "%",)
-            
-            # class_name
-            if class_name is not None:
-                if len(sql_where) > 5:
-                    sql_where += " AND"
-                sql_where += " class_name like ?"
-                sql_parameters += (class_name,)
-
-            # Create cursor
-            cursor = self.conn.cursor()
-            
-            # Execute query
-            if len(sql_where) > 5:
-                cursor.execute("""SELECT hero_name FROM heroes
-                                  INNER JOIN classes ON hero_classkey=class_key
-                                  """ + sql_where, sql_parameters)
-            else:
-                cursor.execute("SELECT hero_name FROM heroes")
-            
-            # Get all of the matching rows
-            result = cursor.fetchall()
-            
-            # Return result as a list (of hero names)
-            return [res[0] for res in result]
+                names = [name for name in names if hero_name.lower() in name.lower()]
+            return names
 
-        except Error as e:
-            print("Error in get_heroes:", e)
+        # The heroes are few and read once, so they are filtered from the registry
+        registry = self.get_hero_registry()
+        if registry is None:
             return []
+        return registry.find(hero_name, class_name)
+
+    def iter_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None,
+                   page_size=STREAM_PAGE_SIZE, format_name=None):
+        """
+        Iterate over the cards that match the given parameters, as CardRow namedtuples in
+        card_key order. The rows are read page by page, so memory stays constant whatever
+        the size of the result.
+
+        Parameters
+        ----------
+        card_name : str
+            Full or partial card name
+        card_cost : int
+            Mana cost
+        card_rarity : str
+            Rarity, must be one of "Free", "Common", "Rare", "Epic", or "Legendary"
+        card_type : str
+            Type of card, must be one of "Minion", "Spell", or "Weapon"
+        class_name : str
+            Name of the class
+        page_size : int
+            The number of rows read per query
+        format_name : str
+            If not None, only the cards of this format (e.g. "Standard")
+        """
+
+        if card_name is not None:
+            card_name = "%" + card_name + "%"
+        predicates, sql_parameters = canonicalize(ITER_CARD_FILTERS, {
+            "card_name": card_name,
+            "card_cost": card_cost,
+            "card_rarity": card_rarity,
+            "card_type": card_type,
+            "class_name": class_name,
+            "format_name": format_name,
+        })
+        sql = select_template("""SELECT card_key, card_name, card_cost, card_rarity, card_type FROM cards""",
+                              predicates + ("card_key > ?",)) + " ORDER BY card_key LIMIT ?"
+        try:
+            yield from self._iter_keyset(sql, sql_parameters, CardRow, page_size)
+        except Error as e:
+            print("Error in iter_cards:", e)
+
+    def iter_card_info(self, page_size=STREAM_PAGE_SIZE):
+        """
+        Iterate over every card of the catalog, as CardInfo namedtuples (key, name, type,
+        cost, rarity, attack and health) in card_key order, page by page.
+
+        Parameters
+        ----------
+        page_size : int
+            The number of rows read per query
+        """
+
+        sql = """SELECT card_key, card_name, card_type, card_cost, card_rarity,
+                        COALESCE(minion_attack, weapon_attack), minion_health
+                 FROM cards
+                 LEFT JOIN minions ON minion_cardkey = card_key
+                 LEFT JOIN weapons ON weapon_cardkey = card_key
+                 WHERE card_key > ? ORDER BY card_key LIMIT ?"""
+        try:
+            yield from self._iter_keyset(sql, (), CardInfo, page_size)
+        except Error as e:
+            print("Error in iter_card_info:", e)
+
+    def iter_heroes(self, hero_name=None, class_name=None, page_size=STREAM_PAGE_SIZE):
+        """
+        Iterate over the heroes that match the given parameters, as HeroRow namedtuples in
+        the order they were inserted. The hero key is the rowid of the hero.
+
+        Parameters
+        ----------
+        hero_name : str
+            Full or partial hero name
+        class_name : str
+            Name of the class
+        page_size : int
+            The number of rows read per query
+        """
+
+        if hero_name is not None:
+            hero_name = "%" + hero_name + "%"
+        predicates, sql_parameters = canonicalize(HERO_FILTERS, {
+            "hero_name": hero_name,
+            "class_name": class_name,
+        })
+        sql = select_template("""SELECT heroes.rowid, hero_name, class_name, hero_power_name, hero_power_cost, hero_power_text
+                                 FROM heroes INNER JOIN classes ON hero_classkey=class_key""",
+                              predicates + ("heroes.rowid > ?",)) + " ORDER BY heroes.rowid LIMIT ?"
+        try:
+            yield from self._iter_keyset(sql, sql_parameters, HeroRow, page_size)
+        except Error as e:
+            print("Error in iter_heroes:", e)
 
+    @instrumented
     def get_hero_class(self, hero_name):
         """
         Return the class of the given hero.
@@ -741,20 +2054,17 @@ class HSDB:
             The hero name
         """
 
-        if self.check_hero(hero_name) == False:
-            print(hero_name, "does not exist in the database")
-            return None
+        if self.snapshot is not None and self.catalog is None:
+            hero_class = self.snapshot.get_hero_class(hero_name)
+        else:
+            hero = self.get_hero(hero_name)
+            hero_class = None if hero is None else hero.class_name
 
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""SELECT class_name FROM classes
-                              INNER JOIN heroes ON class_key=hero_classkey
-                              WHERE hero_name = ?""", (hero_name,))
-            return cursor.fetchone()[0]
-        except Error as e:
-            print("Error in get_hero_class:", e)
-            return None
+        if hero_class is None:
+            print(hero_name, "does not exist in the database")
+        return hero_class
 
+    @instrumented
     def get_card_statistics(self, card_name):
         """
         Return the statistics of the given card.
@@ -775,19 +2085,16 @@ class HSDB:
             stats = {}
 
             # Get the type of the card
-            cursor = self.conn.cursor()
-            cursor.execute("""SELECT card_type FROM cards
-                              WHERE card_name = ?""", (card_name,))
-            card_type = cursor.fetchone()[0]
+            card_type = self._fetchone("""SELECT card_type FROM cards
+                                          WHERE card_name = ?""", (card_name,))[0]
             stats["type"] = card_type
             
             if card_type == "Minion":
                 # Get all minion-related attributes
-                cursor.execute("""SELECT card_name, card_rarity, card_cost, minion_text, minion_attack, minion_health
-                                  FROM cards
-                                  INNER JOIN minions ON card_key = minion_cardkey
-                                  WHERE card_name = ?""", (card_name,))
-                card = cursor.fetchone()
+                card = self._fetchone("""SELECT card_name, card_rarity, card_cost, minion_text, minion_attack, minion_health
+                                         FROM cards
+                                         INNER JOIN minions ON card_key = minion_cardkey
+                                         WHERE card_name = ?""", (card_name,))
                 stats["minion_name"] = card[0]
                 stats["minion_rarity"] = card[1]
                 stats["minion_cost"] = card[2]
@@ -797,11 +2104,10 @@ class HSDB:
 
             elif card_type == "Spell":
                 # Get all spell-related attributes
-                cursor.execute("""SELECT card_name, card_rarity, card_cost, spell_text
-                                  FROM cards
-                                  INNER JOIN spells ON card_key = spell_cardkey
-                                  WHERE card_name = ?""", (card_name,))
-                card = cursor.fetchone()
+                card = self._fetchone("""SELECT card_name, card_rarity, card_cost, spell_text
+                                         FROM cards
+                                         INNER JOIN spells ON card_key = spell_cardkey
+                                         WHERE card_name = ?""", (card_name,))
                 stats["spell_name"] = card[0]
                 stats["spell_rarity"] = card[1]
                 stats["spell_cost"] = card[2]
@@ -809,11 +2115,10 @@ class HSDB:
             
             elif card_type == "Weapon":
                 # Get all weapon-related attributes
-                cursor.execute("""SELECT card_name, card_rarity, card_cost, weapon_text, weapon_attack, weapon_durability
-                                  FROM cards
-                                  INNER JOIN weapons ON card_key = weapon_cardkey
-                                  WHERE card_name = ?""", (card_name,))
-                card = cursor.fetchone()
+                card = self._fetchone("""SELECT card_name, card_rarity, card_cost, weapon_text, weapon_attack, weapon_durability
+                                         FROM cards
+                                         INNER JOIN weapons ON card_key = weapon_cardkey
+                                         WHERE card_name = ?""", (card_name,))
                 stats["weapon_name"] = card[0]
                 stats["weapon_rarity"] = card[1]
                 stats["weapon_cost"] = card[2]
@@ -828,11 +2133,11 @@ class HSDB:
             print("Error in get_card_statistics:", e)
             return None
             
-    def viewCardsByKeyword(self, keywords):
+    @instrumented
+    def viewCardsByKeyword(self, keywords, format_name=None):
         print("Checking for cards with these keywords: {}".format(keywords))
         cardList = []
         try:
-            cursor = self.conn.cursor()
             for keyword in keywords:
                 print("Searching for keyword: {}".format(keyword))
                 sql = '''select cardkey, card_name, text, keyword_name, keyword_description 
@@ -843,11 +2148,13 @@ class HSDB:
                                                             select weapon_cardkey, card_name, weapon_text from weapons, cards on weapon_cardkey = card_key
                                                             )
                             on cardkey = keyword_cards.card_key and keywords.keyword_key = keyword_cards.keyword_key
-                            where keyword_name = "{}"'''.format(keyword)
+                            where keyword_name = ?'''
+                parameters = (keyword,)
+                if format_name is not None:
+                    sql += " and " + FORMAT_FILTER
+                    parameters += (format_name,)
                 #print(sql)
-                cursor.execute(sql)
-                for row in cursor:
-                    cardList.append(row)
+                cardList.extend(self._cached(("viewCardsByKeyword", keyword, format_name), lambda: tuple(self._fetchall(sql, parameters))))
             print("Search Results:")
             print("{:<10} {:<25} {:<125} {:<15}".format("card_key","card_name", "card_text", "keyword"))
             for card in cardList:
@@ -855,4 +2162,73 @@ class HSDB:
                 print("{:<10} {:<25} {:<125} {:<15}".format(card[0], card[1], card[2], card[3]))
         except Error as e:
             print(e)
-        return cardList
\ No newline at end of file
+        return cardList
+
+    def iter_cards_by_keyword(self, keywords, page_size=STREAM_PAGE_SIZE, format_name=None):
+        """
+        Iterate over the cards that have the given keywords, as KeywordCardRow namedtuples:
+        the cards of the first keyword in card_key order, then those of the second one,
+        and so on, like viewCardsByKeyword but without printing or keeping the results.
+
+        Parameters
+        ----------
+        keywords : list of str
+            The keywords
+        page_size : int
+            The number of rows read per query
+        format_name : str
+            If not None, only the cards of this format
+        """
+
+        sql = """SELECT card_key, card_name, COALESCE(minion_text, spell_text, weapon_text), keyword_name, keyword_description
+                 FROM keyword_cards
+                 INNER JOIN keywords USING (keyword_key)
+                 INNER JOIN cards USING (card_key)
+                 LEFT JOIN minions ON minion_cardkey = card_key
+                 LEFT JOIN spells ON spell_cardkey = card_key
+                 LEFT JOIN weapons ON weapon_cardkey = card_key
+                 WHERE keyword_name = ?"""
+        if format_name is not None:
+            sql += " AND " + FORMAT_FILTER
+        sql += " AND card_key > ? ORDER BY card_key LIMIT ?"
+        try:
+            for keyword in keywords:
+                parameters = (keyword,) if format_name is None else (keyword, format_name)
+                yield from self._iter_keyset(sql, parameters, KeywordCardRow, page_size)
+        except Error as e:
+            print("Error in iter_cards_by_keyword:", e)
+
+    @instrumented
+    def cards_with_keywords(self, keywords, format_name=None):
+        """
+        Return the names of the cards that have every given keyword (case insensitive),
+        sorted and without duplicates. An empty list of keywords matches no card.
+
+        Parameters
+        ----------
+        keywords : list of str
+            The keywords
+        format_name : str
+            If not None, only the cards of this format
+        """
+
+        if self.catalog is not None:
+            return self.catalog.cards_with_keywords(keywords, format_name)
+
+        keywords = sorted(set(keyword.lower() for keyword in keywords))
+        if len(keywords) == 0:
+            return []
+        sql = """SELECT DISTINCT card_name FROM cards WHERE card_key IN (
+                     SELECT card_key FROM keyword_cards
+                     INNER JOIN keywords USING (keyword_key)
+                     WHERE lower(keyword_name) IN ({})
+                     GROUP BY card_key HAVING COUNT(DISTINCT lower(keyword_name)) = ?)""".format(", ".join("?" * len(keywords)))
+        parameters = tuple(keywords) + (len(keywords),)
+        if format_name is not None:
+            sql += " AND " + FORMAT_FILTER
+            parameters += (format_name,)
+        try:
+            return [row[0] for row in self._fetchall(sql + " ORDER BY card_name", parameters)]
+        except Error as e:
+            print("Error in cards_with_keywords:", e)
+            return []
@@ -0,0 +1,113 @@
+class HeroRegistry:
+    """
+    The heroes of the catalog, read once and indexed by lower case hero name and by lower
+    case class name, so that resolving a hero to its class (and hero power) or a class to
+    its heroes is a dictionary access instead of a query joining heroes and classes.
+
+    Attributes
+    ----------
+    heroes : list of HeroRow
+        Every hero, in the order they were inserted
+    """
+
+    def __init__(self, heroes):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        heroes : list of HeroRow
+            Every hero with its class and hero power. If two heroes share a name, the
+            first one wins, like the SQL lookups by name.
+        """
+
+        self.heroes = list(heroes)
+        self._by_name = {}
+        self._by_class = {}
+        for hero in self.heroes:
+            if hero.hero_name.lower() in self._by_name:
+                continue
+            self._by_name[hero.hero_name.lower()] = hero
+            self._by_class.setdefault(hero.class_name.lower(), []).append(hero.hero_name)
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, hero_name):
+        return hero_name.lower() in self._by_name
+
+    def get(self, hero_name):
+        """
+        Return the HeroRow (key, name, class, hero power name, cost and text) of the given
+        hero (case insensitive), or None if it does not exist.
+
+        Parameters
+        ----------
+        hero_name : str
+            The hero name
+        """
+
+        return self._by_name.get(hero_name.lower())
+
+    def get_class(self, hero_name):
+        """
+        Return the class of the given hero (case insensitive), or None if it does not
+        exist.
+
+        Parameters
+        ----------
+        hero_name : str
+            The hero name
+        """
+
+        hero = self._by_name.get(hero_name.lower())
+        return None if hero is None else hero.class_name
+
+    def get_heroes(self, class_name):
+        """
+        Return the names of the heroes of the given class (case insensitive), in the order
+        they were inserted. The list is shared, do not modify it.
+
+        Parameters
+        ----------
+        class_name : str
+            The class name
+        """
+
+        return self._by_class.get(class_name.lower(), [])
+
+    def resolve(self, hero_names):
+        """
+        Return the HeroRow of every given hero, in the same order, None for the heroes
+        that do not exist.
+
+        Parameters
+        ----------
+        hero_names : list of str
+            The hero names
+        """
+
+        by_name = self._by_name
+        return [by_name.get(hero_name.lower()) for hero_name in hero_names]
+
+    def find(self, hero_name=None, class_name=None):
+        """
+        Return the names of the heroes whose name contains hero_name and whose class is
+        class_name (both case insensitive, None for any), in the order they were inserted.
+
+        Parameters
+        ----------
+        hero_name : str
+            Full or partial hero name
+        class_name : str
+            Name of the class
+        """
+
+        if class_name is not None:
+            names = self.get_heroes(class_name)
+        else:
+            names = [hero.hero_name for hero in self._by_name.values()]
+        if hero_name is not None:
+            hero_name = hero_name.lower()
+            names = [name for name in names if hero_name in name.lower()]
+        return list(names)
@@ -0,0 +1,309 @@
+import sys
+import time
+import threading
+from functools import wraps
+from collections import deque
+
+def _report(method_stats):
+    # Turn {name: [calls, rows, sql time, wall time]} into a list of dictionaries, slowest first
+    report = []
+    for name, (calls, rows, sql_time, wall_time) in method_stats.items():
+        report.append({
+            "method": name,
+            "calls": calls,
+            "rows": rows,
+            "sql_time": sql_time,
+            "wall_time": wall_time,
+        })
+    report.sort(key=lambda entry: entry["wall_time"], reverse=True)
+    return report
+
+def _write_report(stream, report):
+    stream.write("{:<28} {:>8} {:>8} {:>12} {:>12}\n".format("Method", "Calls", "Rows", "SQL (ms)", "Wall (ms)"))
+    for entry in report:
+        stream.write("{:<28} {:>8} {:>8} {:>12.2f} {:>12.2f}\n".format(
+            entry["method"], entry["calls"], entry["rows"], entry["sql_time"] * 1000, entry["wall_time"] * 1000))
+    stream.flush()
+
+def instrumented(method):
+    """
+    Decorator for the methods of HSDB. Every call is counted and timed, and the SQL that
+    runs inside the call is attributed to it.
+    """
+
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return method(self, *args, **kwargs)
+        stack = instrumentation._stack()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            instrumentation.record_call(name, elapsed)
+
+    return wrapper
+
+class Instrumentation:
+    """
+    A class that records what every HSDB method costs: number of calls, rows returned by
+    its queries, time spent in SQL and wall time. Queries slower than a threshold are
+    kept in a slow-query log along with their query plan.
+
+    The bookkeeping is a handful of dictionary updates per call, so it can be left on.
+
+    Attributes
+    ----------
+    enabled : bool
+        If False, nothing is recorded
+    slow_query_threshold : float
+        Queries that take longer than this (in seconds) go to the slow-query log. None
+        disables the log.
+    stream : file
+        Where slow queries and periodic dumps are written, e.g. sys.stderr. None keeps
+        them in memory only.
+    method_stats : dict
+        [calls, rows, sql time, wall time] by method name
+    slow_queries : collections.deque
+        The most recent slow queries, as dictionaries
+    """
+
+    def __init__(self, enabled=True, slow_query_threshold=None, stream=None, max_slow_queries=100):
+        """
+        Constructor
+        """
+
+        self.enabled = enabled
+        self.slow_query_threshold = slow_query_threshold
+        self.stream = stream
+        self.method_stats = {}
+        self.slow_queries = deque(maxlen=max_slow_queries)
+        self._plans = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._dump_thread = None
+        self._dump_stop = None
+
+    def _stack(self):
+        # The methods currently running in this thread, innermost last
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current_method(self):
+        """
+        Return the name of the innermost instrumented method running in this thread, or
+        "(direct)" if there is none.
+        """
+
+        stack = self._stack()
+        return stack[-1] if len(stack) > 0 else "(direct)"
+
+    def _entry(self, name):
+        entry = self.method_stats.get(name)
+        if entry is None:
+            entry = self.method_stats[name] = [0, 0, 0.0, 0.0]
+        return entry
+
+    def record_call(self, name, elapsed):
+        """
+        Record one call of a method.
+
+        Parameters
+        ----------
+        name : str
+            The method name
+        elapsed : float
+            The wall time of the call, in seconds
+        """
+
+        with self._lock:
+            entry = self._entry(name)
+            entry[0] += 1
+            entry[3] += elapsed
+
+    def record_query(self, conn, sql, parameters, elapsed, rows, method=None):
+        """
+        Record one query. It is attributed to the given method, or to the innermost
+        instrumented method that is running, and logged if it is slower than the
+        threshold.
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            The connection the query ran on, used to get the plan of slow queries. None if
+            it must not be used, the plan is then only logged if it is already known.
+        sql : str
+            The SQL template
+        parameters : tuple
+            The values of the template placeholders
+        elapsed : float
+            The time spent in SQL, in seconds
+        rows : int
+            The number of rows fetched, None if the statement returns no rows
+        method : str
+            The method that ran the query (see current_method), None for the current one
+        """
+
+        if not self.enabled:
+            return
+
+        name = method if method is not None else self.current_method()
+        with self._lock:
+            entry = self._entry(name)
+            entry[1] += rows or 0
+            entry[2] += elapsed
+
+        if self.slow_query_threshold is not None and elapsed > self.slow_query_threshold:
+            self._log_slow_query(conn, name, sql, parameters, elapsed)
+
+    def _log_slow_query(self, conn, name, sql, parameters, elapsed):
+        # The plan only depends on the template, so it is captured once per template
+        plan = self._plans.get(sql)
+        if plan is None and conn is not None and sql.lstrip()[:6].lower() == "select":
+            try:
+                plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()]
+            except Exception as e:
+                plan = ["unavailable: {}".format(e)]
+            self._plans[sql] = plan
+
+        entry = {
+            "time": time.time(),
+            "method": name,
+            "sql": " ".join(sql.split()),
+            "parameters": parameters,
+            "elapsed": elapsed,
+            "plan": plan,
+        }
+        self.slow_queries.append(entry)
+
+        if self.stream is not None:
+            self.stream.write("Slow query in {} ({:.2f} ms): {} {}\n".format(name, elapsed * 1000, entry["sql"], parameters))
+            for step in plan or []:
+                self.stream.write("    {}\n".format(step))
+
+    def report(self):
+        """
+        Return the statistics of every method as a list of dictionaries, slowest first.
+        """
+
+        with self._lock:
+            return _report({name: list(entry) for name, entry in self.method_stats.items()})
+
+    def reset(self):
+        """
+        Clear the statistics and the slow-query log.
+        """
+
+        with self._lock:
+            self.method_stats = {}
+            self.slow_queries.clear()
+
+    def dump(self, stream=None):
+        """
+        Write the statistics in a table.
+
+        Parameters
+        ----------
+        stream : file
+            Where to write, defaults to the instrumentation stream or sys.stdout
+        """
+
+        if stream is None:
+            stream = self.stream if self.stream is not None else sys.stdout
+        _write_report(stream, self.report())
+
+    def measure(self):
+        """
+        Return a context manager that measures what happens inside the with block only:
+
+            with db.instrumentation.measure() as m:
+                deck.print_deck_statistics()
+            m.dump()
+        """
+
+        return _Measurement(self)
+
+    def start_periodic_dump(self, interval, stream=None):
+        """
+        Dump the statistics every interval seconds from a background thread.
+
+        Parameters
+        ----------
+        interval : float
+            Seconds between two dumps
+        stream : file
+            Where to write, defaults to the instrumentation stream or sys.stderr
+        """
+
+        self.stop_periodic_dump()
+        if stream is None:
+            stream = self.stream if self.stream is not None else sys.stderr
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.dump(stream)
+
+        self._dump_stop = stop
+        self._dump_thread = threading.Thread(target=run, name="hsdb-stats-dump", daemon=True)
+        self._dump_thread.start()
+
+    def stop_periodic_dump(self):
+        """
+        Stop the periodic dump, if it is running.
+        """
+
+        if self._dump_thread is not None:
+            self._dump_stop.set()
+            self._dump_thread.join()
+            self._dump_thread = None
+            self._dump_stop = None
+
+class _Measurement:
+    # The statistics recorded between __enter__ and __exit__, as a difference of totals
+
+    def __init__(self, instrumentation):
+        self.instrumentation = instrumentation
+        self.method_stats = {}
+        self.slow_queries = []
+        self._before = None
+        self._slow_before = None
+
+    def __enter__(self):
+        with self.instrumentation._lock:
+            self._before = {name: list(entry) for name, entry in self.instrumentation.method_stats.items()}
+        self._slow_before = list(self.instrumentation.slow_queries)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        with self.instrumentation._lock:
+            after = {name: list(entry) for name, entry in self.instrumentation.method_stats.items()}
+        for name, entry in after.items():
+            before = self._before.get(name, [0, 0, 0.0, 0.0])
+            delta = [a - b for a, b in zip(entry, before)]
+            if delta[0] > 0 or delta[1] > 0 or delta[2] > 0:
+                self.method_stats[name] = delta
+        self.slow_queries = [q for q in self.instrumentation.slow_queries if q not in self._slow_before]
+        return False
+
+    def report(self):
+        """
+        Return the statistics of the block as a list of dictionaries, slowest first.
+        """
+
+        return _report(self.method_stats)
+
+    def dump(self, stream=None):
+        """
+        Write the statistics of the block in a table.
+        """
+
+        _write_report(stream if stream is not None else sys.stdout, self.report())
@@ -0,0 +1,382 @@
+"""
+Meta report over a corpus of decks: card inclusion rates and average copies by class,
+mana curve distributions and keyword prevalence.
+
+MetaAggregator is a single-pass reducer: every deck is added once, nothing is kept per
+deck, and two aggregators can be merged. The corpus can therefore be split in chunks that
+are reduced in parallel processes, then merged:
+
+    python MetaReport.py decks/*.txt --processes 8 --top 15
+"""
+
+import sys
+import argparse
+import multiprocessing
+from collections import Counter
+from HSDB import HSDB
+from DecklistParser import MAX_CARDS, split_decklist
+
+CHUNK_SIZE = 1000           # deck files per task
+CURVE_BUCKETS = 12          # 0 to 10 mana, then 11+ like Deck.get_deck_statistics
+AVERAGE_COST_STEP = 0.5     # width of the buckets of the average cost distribution
+
+def load_catalog(db):
+    """
+    Return lower case card name -> (cost, keywords) for every card of the catalog, the
+    first card of a name winning like in HSDB, 0 being the cost of the cards without one. The catalog is a plain dictionary, so it
+    can be sent to worker processes.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database
+    """
+
+    catalog = {}
+    for card in db.get_facet_index().cards:
+        # Cards without a cost count as 0 mana, like in the deck statistics
+        catalog.setdefault(card["name"].lower(), (card["cost"] or 0, tuple(card["keywords"])))
+    return catalog
+
+def read_deck_file(path):
+    """
+    Return (class name, list of card names, one per copy) read from a decklist file,
+    tokenized like DecklistParser (comments, header lines in any order, card counts) but
+    without checking anything against the database. Lines with a count above MAX_CARDS
+    are skipped.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .txt file
+    """
+
+    with open(path, "r", encoding="utf-8-sig") as f:
+        header, _, card_lines = split_decklist(f.read())
+    cards = []
+    for _, count, name in card_lines:
+        if count is None:
+            count = 1
+        if count <= MAX_CARDS:
+            cards.extend([name] * count)
+    return header.get("class", ""), cards
+
+def _most_common(counter, top):
+    # Like Counter.most_common, but ties are sorted by name so that the report does not
+    # depend on the order in which partial results were merged
+    items = sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+    return items if top is None else items[:top]
+
+class ClassAggregate:
+    """
+    The running totals of the decks of one class.
+
+    Attributes
+    ----------
+    decks : int
+        The number of decks
+    cards : int
+        The number of cards in all the decks
+    card_decks : Counter
+        Card name -> number of decks that include it
+    card_copies : Counter
+        Card name -> number of copies in all the decks
+    curve : list of int
+        Number of cards of every mana cost (0 to 10, then 11+) in all the decks
+    average_costs : Counter
+        Deck average cost, rounded down to AVERAGE_COST_STEP -> number of decks
+    keyword_decks : Counter
+        Keyword -> number of decks with at least one card that has it
+    keyword_cards : Counter
+        Keyword -> number of cards that have it in all the decks
+    unknown_cards : int
+        Number of cards that are not in the catalog
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+
+        self.decks = 0
+        self.cards = 0
+        self.card_decks = Counter()
+        self.card_copies = Counter()
+        self.curve = [0] * CURVE_BUCKETS
+        self.average_costs = Counter()
+        self.keyword_decks = Counter()
+        self.keyword_cards = Counter()
+        self.unknown_cards = 0
+
+    def merge(self, other):
+        """
+        Add the totals of another aggregate to this one.
+
+        Parameters
+        ----------
+        other : ClassAggregate
+            The other aggregate
+        """
+
+        self.decks += other.decks
+        self.cards += other.cards
+        self.card_decks.update(other.card_decks)
+        self.card_copies.update(other.card_copies)
+        for cost, count in enumerate(other.curve):
+            self.curve[cost] += count
+        self.average_costs.update(other.average_costs)
+        self.keyword_decks.update(other.keyword_decks)
+        self.keyword_cards.update(other.keyword_cards)
+        self.unknown_cards += other.unknown_cards
+
+class MetaAggregator:
+    """
+    A streaming, mergeable reducer of decks into a meta report.
+
+    Attributes
+    ----------
+    catalog : dict
+        Lower case card name -> (cost, keywords), see load_catalog
+    classes : dict
+        ClassAggregate by class name
+    """
+
+    def __init__(self, catalog):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        catalog : dict
+            Lower case card name -> (cost, keywords), see load_catalog
+        """
+
+        self.catalog = catalog
+        self.classes = {}
+
+    def __getstate__(self):
+        # Partial results are sent back from worker processes without the catalog, which
+        # the receiving side already has
+        return {"catalog": None, "classes": self.classes}
+
+    def add_cards(self, class_name, cards):
+        """
+        Add one deck, given as its class and card names.
+
+        Parameters
+        ----------
+        class_name : str
+            The class of the deck
+        cards : list of str
+            The card names, one per copy
+        """
+
+        aggregate = self.classes.get(class_name)
+        if aggregate is None:
+            aggregate = self.classes[class_name] = ClassAggregate()
+
+        copies = Counter(cards)
+        keywords = set()
+        total_cost = 0
+        known = 0
+        for card_name, count in copies.items():
+            aggregate.card_decks[card_name] += 1
+            aggregate.card_copies[card_name] += count
+            info = self.catalog.get(card_name.lower())
+            if info is None:
+                aggregate.unknown_cards += count
+                continue
+            cost, card_keywords = info
+            cost = cost or 0
+            aggregate.curve[min(cost, CURVE_BUCKETS - 1)] += count
+            total_cost += cost * count
+            known += count
+            for keyword in card_keywords:
+                aggregate.keyword_cards[keyword] += count
+                keywords.add(keyword)
+
+        aggregate.decks += 1
+        aggregate.cards += len(cards)
+        aggregate.keyword_decks.update(keywords)
+        if known > 0:
+            aggregate.average_costs[int(total_cost / known / AVERAGE_COST_STEP) * AVERAGE_COST_STEP] += 1
+
+    def add(self, deck):
+        """
+        Add one deck.
+
+        Parameters
+        ----------
+        deck : Deck
+            The deck
+        """
+
+        self.add_cards(deck.hero_class, deck.cards)
+
+    def add_file(self, path):
+        """
+        Add the deck of a text file. Files that cannot be read are skipped.
+
+        Parameters
+        ----------
+        path : str
+            Path to the .txt file
+        """
+
+        try:
+            class_name, cards = read_deck_file(path)
+        except (OSError, UnicodeDecodeError) as e:
+            print("Error while reading {}: {}".format(path, e))
+            return
+        self.add_cards(class_name, cards)
+
+    def merge(self, other):
+        """
+        Add the partial result of another aggregator (e.g. from another process) to this
+        one.
+
+        Parameters
+        ----------
+        other : MetaAggregator
+            The other aggregator
+        """
+
+        for class_name, aggregate in other.classes.items():
+            if class_name not in self.classes:
+                self.classes[class_name] = ClassAggregate()
+            self.classes[class_name].merge(aggregate)
+
+    def report(self, top=None):
+        """
+        Return the meta report as a dictionary of class name -> dictionary with:
+            - decks (int): the number of decks
+            - cards (list of dict): card, inclusion_rate (fraction of the decks that
+              include it) and average_copies (per deck that includes it), most
+              included first
+            - curve (list of float): average number of cards of each mana cost per deck
+            - average_cost (dict): average cost bucket -> fraction of the decks
+            - keywords (list of dict): keyword, prevalence (fraction of the decks with
+              at least one card that has it) and cards_per_deck, most prevalent first
+            - unknown_cards (int): cards that are not in the catalog
+
+        Parameters
+        ----------
+        top : int
+            If not None, only keep the top cards and keywords of every class
+        """
+
+        report = {}
+        for class_name in sorted(self.classes):
+            aggregate = self.classes[class_name]
+            decks = aggregate.decks
+            cards = [{"card": card_name,
+                      "inclusion_rate": count / decks,
+                      "average_copies": aggregate.card_copies[card_name] / count}
+                     for card_name, count in _most_common(aggregate.card_decks, top)]
+            keywords = [{"keyword": keyword,
+                         "prevalence": count / decks,
+                         "cards_per_deck": aggregate.keyword_cards[keyword] / decks}
+                        for keyword, count in _most_common(aggregate.keyword_decks, top)]
+            report[class_name] = {
+                "decks": decks,
+                "cards": cards,
+                "curve": [count / decks for count in aggregate.curve],
+                "average_cost": {bucket: count / decks for bucket, count in sorted(aggregate.average_costs.items())},
+                "keywords": keywords,
+                "unknown_cards": aggregate.unknown_cards,
+            }
+        return report
+
+# The catalog of a worker process, sent once when the process starts instead of with
+# every task
+_worker_catalog = None
+
+def _init_worker(catalog):
+    global _worker_catalog
+    _worker_catalog = catalog
+
+def _aggregate_files(paths, catalog=None):
+    # Reduce a chunk of deck files, in a worker process unless a catalog is given
+    aggregator = MetaAggregator(catalog if catalog is not None else _worker_catalog)
+    for path in paths:
+        aggregator.add_file(path)
+    return aggregator
+
+def aggregate_files(paths, catalog, processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Reduce deck text files into one MetaAggregator, in chunks that run in parallel
+    processes.
+
+    Parameters
+    ----------
+    paths : iterable of str
+        Paths to the .txt files
+    catalog : dict
+        Lower case card name -> (cost, keywords), see load_catalog
+    processes : int
+        The number of worker processes, None for one per CPU, 1 to run in this process
+    chunk_size : int
+        The number of files per task
+    """
+
+    def chunks():
+        chunk = []
+        for path in paths:
+            chunk.append(path)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    result = MetaAggregator(catalog)
+    if processes == 1:
+        for chunk in chunks():
+            result.merge(_aggregate_files(chunk, catalog))
+    else:
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(catalog,)) as pool:
+            for partial in pool.imap_unordered(_aggregate_files, chunks()):
+                result.merge(partial)
+    return result
+
+def print_report(report):
+    """
+    Print the result of MetaAggregator.report.
+
+    Parameters
+    ----------
+    report : dict
+        The result of MetaAggregator.report
+    """
+
+    for class_name, entry in report.items():
+        print("{} ({} decks)".format(class_name, entry["decks"]))
+        print("{:<6} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5}".format("Mana", *range(11), "11+"))
+        print("{:<6} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5} {:<5}".format(
+            "Cards", *["{:.1f}".format(count) for count in entry["curve"]]))
+        print("{:<30} {:>10} {:>8}".format("Card", "Included", "Copies"))
+        for card in entry["cards"]:
+            print("{:<30} {:>9.1%} {:>8.2f}".format(card["card"][:30], card["inclusion_rate"], card["average_copies"]))
+        print("{:<30} {:>10} {:>8}".format("Keyword", "Decks", "Cards"))
+        for keyword in entry["keywords"]:
+            print("{:<30} {:>9.1%} {:>8.2f}".format(keyword["keyword"], keyword["prevalence"], keyword["cards_per_deck"]))
+        if entry["unknown_cards"] > 0:
+            print("Cards not in the catalog:", entry["unknown_cards"])
+        print("")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Meta report over a corpus of deck text files")
+    parser.add_argument("decks", nargs="+", help="deck text files")
+    parser.add_argument("--db", default="data/hs.sqlite", help="the database file")
+    parser.add_argument("--processes", type=int, help="number of worker processes, one per CPU by default")
+    parser.add_argument("--top", type=int, default=10, help="number of cards and keywords listed per class")
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db, read_only=True)
+    aggregator = aggregate_files(args.decks, load_catalog(db), args.processes)
+    print_report(aggregator.report(args.top))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
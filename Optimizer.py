@@ -0,0 +1,342 @@
+"""
+Deck optimizer: search the legal pool of a class for the decks that best match a target
+mana curve, required keywords and a rarity budget.
+
+Every search starts from a greedy deck (cards picked cost bucket by cost bucket to follow
+the target curve) and improves it by simulated annealing. A move replaces one card of the
+deck by one card of the pool, and its effect on the score is computed from the two cards
+only. Independent searches with different seeds run in parallel processes until the time
+budget is spent, and the best distinct decks of all of them are returned.
+
+    python Optimizer.py Mage --curve 0 2 4 5 5 4 3 3 2 1 1 0 --keyword Freeze 4 --rarity Legendary 2
+"""
+
+import sys
+import math
+import time
+import heapq
+import random
+import argparse
+import multiprocessing
+from HSDB import HSDB
+from Deck import Deck, RARITIES
+
+CURVE_BUCKETS = 12          # 0 to 10 mana, then 11+ like Deck.get_deck_statistics
+DECK_SIZE = 30
+MAX_COPIES = 2              # copies of a card in a deck
+MAX_LEGENDARY_COPIES = 1
+KEYWORD_WEIGHT = 2.0        # score of every missing required keyword card
+RARITY_WEIGHT = 2.0         # score of every card over the rarity budget
+START_TEMPERATURE = 2.0
+END_TEMPERATURE = 0.05
+TIME_CHECK_INTERVAL = 256   # moves between two looks at the clock
+
+def _score(state, targets):
+    # Full score of a state, lower is better: distance to the target curve, plus the
+    # missing required keyword cards and the cards over the rarity budget
+    curve, keywords, rarities = state
+    target_curve, required, budget = targets
+    score = sum(abs(curve[bucket] - target_curve[bucket]) for bucket in range(CURVE_BUCKETS))
+    score += KEYWORD_WEIGHT * sum(max(0, need - keywords.get(keyword, 0)) for keyword, need in required.items())
+    score += RARITY_WEIGHT * sum(max(0, rarities.get(rarity, 0) - limit) for rarity, limit in budget.items())
+    return score
+
+def _move_delta(state, targets, out_card, in_card):
+    # Change of the score if out_card is replaced by in_card, computed from the two
+    # cards only. Cards are (bucket, rarity, keywords) tuples.
+    curve, keywords, rarities = state
+    target_curve, required, budget = targets
+    delta = 0.0
+
+    out_bucket, out_rarity, out_keywords = out_card
+    in_bucket, in_rarity, in_keywords = in_card
+    if out_bucket != in_bucket:
+        for bucket, change in ((out_bucket, -1), (in_bucket, 1)):
+            before = curve[bucket]
+            delta += abs(before + change - target_curve[bucket]) - abs(before - target_curve[bucket])
+
+    for keyword in set(out_keywords).symmetric_difference(in_keywords):
+        need = required.get(keyword)
+        if need is not None:
+            change = 1 if keyword in in_keywords else -1
+            before = keywords.get(keyword, 0)
+            delta += KEYWORD_WEIGHT * (max(0, need - before - change) - max(0, need - before))
+
+    if out_rarity != in_rarity:
+        for rarity, change in ((out_rarity, -1), (in_rarity, 1)):
+            limit = budget.get(rarity)
+            if limit is not None:
+                before = rarities.get(rarity, 0)
+                delta += RARITY_WEIGHT * (max(0, before + change - limit) - max(0, before - limit))
+    return delta
+
+def _apply(state, card, change):
+    # Add (change 1) or remove (change -1) one copy of a card to the state
+    curve, keywords, rarities = state
+    bucket, rarity, card_keywords = card
+    curve[bucket] += change
+    rarities[rarity] = rarities.get(rarity, 0) + change
+    for keyword in card_keywords:
+        keywords[keyword] = keywords.get(keyword, 0) + change
+
+def _greedy_deck(pool, targets, deck_size, rng):
+    # Pick cards bucket by bucket to follow the target curve, then fill up at random
+    target_curve = targets[0]
+    limits = [MAX_LEGENDARY_COPIES if card[1] == "Legendary" else MAX_COPIES for card in pool]
+    copies = [0] * len(pool)
+    by_bucket = {}
+    for card_id, card in enumerate(pool):
+        by_bucket.setdefault(card[0], []).append(card_id)
+
+    deck = []
+    for bucket in range(CURVE_BUCKETS):
+        candidates = by_bucket.get(bucket, [])
+        rng.shuffle(candidates)
+        for card_id in candidates * MAX_COPIES:
+            if len(deck) == deck_size or sum(1 for i in deck if pool[i][0] == bucket) >= target_curve[bucket]:
+                break
+            if copies[card_id] < limits[card_id]:
+                copies[card_id] += 1
+                deck.append(card_id)
+
+    candidates = list(range(len(pool))) * MAX_COPIES
+    rng.shuffle(candidates)
+    for card_id in candidates:
+        if len(deck) == deck_size:
+            break
+        if copies[card_id] < limits[card_id]:
+            copies[card_id] += 1
+            deck.append(card_id)
+    return deck
+
+def _anneal(task):
+    # One simulated annealing search. Top-level so that it can run in a worker process.
+    # Return the best distinct decks found, as (score, sorted card ids) pairs.
+    pool, targets, deck_size, seconds, top, seed = task
+    rng = random.Random(seed)
+    limits = [MAX_LEGENDARY_COPIES if card[1] == "Legendary" else MAX_COPIES for card in pool]
+
+    deck = _greedy_deck(pool, targets, deck_size, rng)
+    copies = [0] * len(pool)
+    state = ([0] * CURVE_BUCKETS, {}, {})
+    for card_id in deck:
+        copies[card_id] += 1
+        _apply(state, pool[card_id], 1)
+    score = _score(state, targets)
+
+    # Heap of the best decks, the worst one first (scores are negated)
+    best = []
+    seen = set()
+
+    def remember():
+        key = tuple(sorted(deck))
+        if key in seen:
+            return
+        if len(best) < top:
+            heapq.heappush(best, (-score, key))
+            seen.add(key)
+        elif -best[0][0] > score:
+            _, removed = heapq.heappushpop(best, (-score, key))
+            seen.discard(removed)
+            seen.add(key)
+
+    remember()
+    start = time.perf_counter()
+    temperature = START_TEMPERATURE
+    moves = 0
+    while True:
+        moves += 1
+        if moves % TIME_CHECK_INTERVAL == 0:
+            elapsed = time.perf_counter() - start
+            if elapsed >= seconds:
+                break
+            # Geometric cooling over the time budget
+            temperature = START_TEMPERATURE * (END_TEMPERATURE / START_TEMPERATURE) ** (elapsed / seconds)
+
+        slot = rng.randrange(len(deck))
+        in_id = rng.randrange(len(pool))
+        out_id = deck[slot]
+        if in_id == out_id or copies[in_id] >= limits[in_id]:
+            continue
+
+        delta = _move_delta(state, targets, pool[out_id], pool[in_id])
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            _apply(state, pool[out_id], -1)
+            _apply(state, pool[in_id], 1)
+            copies[out_id] -= 1
+            copies[in_id] += 1
+            deck[slot] = in_id
+            score += delta
+            if len(best) < top or score < -best[0][0]:
+                remember()
+
+    return [(-negated, key) for negated, key in best]
+
+class DeckOptimizer:
+    """
+    A class that searches the legal pool of a class for the decks that best match a
+    target mana curve, required keywords and a rarity budget.
+
+    Attributes
+    ----------
+    db : HSDB
+        A reference to the Hearthstone database
+    hero_class : str
+        The class of the decks
+    cards : list of str
+        The legal pool of the class, the card ids are their indexes
+    pool : list of tuple
+        (cost bucket, rarity, keywords) of every card of the pool
+    """
+
+    def __init__(self, db, hero_class):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        db : HSDB
+            A reference to the Hearthstone database
+        hero_class : str
+            The class of the decks
+        """
+
+        self.db = db
+        self.hero_class = hero_class
+        self.cards = list(db.get_pool_cards(hero_class))
+
+        card_keywords = {}
+        for card in db.get_facet_index().cards:
+            card_keywords.setdefault(card["name"].lower(), tuple(card["keywords"]))
+        self.pool = []
+        for card_name in self.cards:
+            info = db.get_card_info(card_name)
+            # Cards without a cost count as 0 mana, like in the deck statistics
+            self.pool.append((min(info.card_cost or 0, CURVE_BUCKETS - 1), info.card_rarity,
+                              card_keywords.get(card_name.lower(), ())))
+
+    def optimize(self, target_curve, required_keywords=None, rarity_budget=None, top=5, seconds=5.0,
+                 processes=None, seed=None, deck_size=DECK_SIZE):
+        """
+        Return the best decks found within the time budget, best first, as dictionaries
+        with score (0 for a perfect match), cards (list of card names), curve (list of
+        int), keywords (dict) and rarity_count (dict).
+
+        Parameters
+        ----------
+        target_curve : list of int
+            Number of cards wanted for every mana cost, 0 to 10 then 11+
+        required_keywords : dict
+            Keyword -> minimum number of cards that have it
+        rarity_budget : dict
+            Rarity -> maximum number of cards of that rarity
+        top : int
+            The number of decks returned
+        seconds : float
+            The time budget of the search
+        processes : int
+            The number of parallel searches, None for one per CPU
+        seed : int
+            The random seed, a random one if None
+        deck_size : int
+            The number of cards in a deck
+        """
+
+        if len(self.pool) == 0:
+            print(self.hero_class, "has no legal cards")
+            return []
+        if len(target_curve) != CURVE_BUCKETS:
+            raise ValueError("The target curve must have {} buckets".format(CURVE_BUCKETS))
+
+        targets = (list(target_curve), dict(required_keywords or {}), dict(rarity_budget or {}))
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        seeds = random.Random(seed)
+        tasks = [(self.pool, targets, deck_size, seconds, top, seeds.randrange(2 ** 63)) for _ in range(processes)]
+
+        if processes == 1:
+            results = [_anneal(tasks[0])]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                results = pool.map(_anneal, tasks)
+
+        # Best distinct decks of all the searches
+        decks = {}
+        for result in results:
+            for score, key in result:
+                decks[key] = min(score, decks.get(key, score))
+        ranked = sorted(decks.items(), key=lambda item: (item[1], item[0]))[:top]
+        return [self._describe(key, score) for key, score in ranked]
+
+    def _describe(self, key, score):
+        curve = [0] * CURVE_BUCKETS
+        keywords = {}
+        rarity_count = {rarity: 0 for rarity in RARITIES}
+        for card_id in key:
+            bucket, rarity, card_keywords = self.pool[card_id]
+            curve[bucket] += 1
+            rarity_count[rarity] = rarity_count.get(rarity, 0) + 1
+            for keyword in card_keywords:
+                keywords[keyword] = keywords.get(keyword, 0) + 1
+        return {
+            "score": round(score, 6),
+            "cards": [self.cards[card_id] for card_id in key],
+            "curve": curve,
+            "keywords": keywords,
+            "rarity_count": rarity_count,
+        }
+
+    def build_deck(self, result, hero=None, name=None):
+        """
+        Return a Deck with the cards of one of the results of optimize.
+
+        Parameters
+        ----------
+        result : dict
+            One of the results of optimize
+        hero : str
+            The hero of the deck, the first hero of the class if None
+        name : str
+            The name of the deck
+        """
+
+        if hero is None:
+            hero = self.db.get_heroes(class_name=self.hero_class)[0]
+        deck = Deck(self.db, name, hero)
+        deck.set_cards(result["cards"])
+        return deck
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search for the decks that best match a mana curve and keyword targets")
+    parser.add_argument("hero_class", help="the class of the decks")
+    parser.add_argument("--db", default="data/hs.sqlite", help="the database file")
+    parser.add_argument("--curve", type=int, nargs=CURVE_BUCKETS, metavar="N", required=True,
+                        help="number of cards for every mana cost, 0 to 10 then 11+")
+    parser.add_argument("--keyword", nargs=2, action="append", default=[], metavar=("KEYWORD", "MIN"),
+                        help="require at least MIN cards with KEYWORD")
+    parser.add_argument("--rarity", nargs=2, action="append", default=[], metavar=("RARITY", "MAX"),
+                        help="allow at most MAX cards of RARITY")
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=5.0, help="time budget of the search")
+    parser.add_argument("--processes", type=int, help="number of parallel searches, one per CPU by default")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db, read_only=True)
+    optimizer = DeckOptimizer(db, args.hero_class)
+    results = optimizer.optimize(args.curve, {keyword: int(count) for keyword, count in args.keyword},
+                                 {rarity: int(count) for rarity, count in args.rarity},
+                                 args.top, args.seconds, args.processes, args.seed)
+    for rank, result in enumerate(results, 1):
+        print("#{} score {:g}".format(rank, result["score"]))
+        print("Curve:", " ".join(str(count) for count in result["curve"]))
+        print("Keywords:", ", ".join("{} {}".format(keyword, count) for keyword, count in sorted(result["keywords"].items())))
+        print("Rarity:", ", ".join("{} {}".format(rarity, count) for rarity, count in result["rarity_count"].items()))
+        for card_name in result["cards"]:
+            print("  " + card_name)
+        print("")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import time
+from functools import lru_cache
+
+# Number of prepared statements sqlite3 keeps per connection (the default is 128)
+STATEMENT_CACHE_SIZE = 512
+
+@lru_cache(maxsize=None)
+def select_template(select, predicates):
+    """
+    Return the SQL template for a SELECT statement with the given predicates. The same
+    combination of predicates always gives the same string, so sqlite3 can reuse the
+    prepared statement.
+
+    Parameters
+    ----------
+    select : str
+        The SELECT ... FROM ... part of the statement
+    predicates : tuple of str
+        The predicates of the WHERE clause, in canonical order, e.g. ("card_cost = ?",)
+    """
+
+    if len(predicates) == 0:
+        return select
+    return select + " WHERE " + " AND ".join(predicates)
+
+def canonicalize(filters, values):
+    """
+    Turn a set of optional filter values into a canonical tuple of predicates and the
+    matching tuple of parameters. Filters whose value is None are left out.
+
+    Parameters
+    ----------
+    filters : tuple of (str, str)
+        (name, predicate) pairs, in the canonical order of the template
+    values : dict
+        The value of each filter, by name
+    """
+
+    predicates = ()
+    parameters = ()
+    for name, predicate in filters:
+        value = values.get(name)
+        if value is not None:
+            predicates += (predicate,)
+            parameters += (value,)
+    return predicates, parameters
+
+class _StreamedCursor:
+    # The cursor of a query returned unfetched by QueryRunner.execute. The rows and the
+    # time spent fetching them are counted as they are consumed, and the query is passed
+    # to the observer once, when the cursor is exhausted, closed or dropped, with the
+    # context captured when the query ran.
+
+    def __init__(self, runner, conn, sql, parameters, cursor, elapsed, context):
+        self._runner = runner
+        self._conn = conn
+        self._sql = sql
+        self._parameters = parameters
+        self._cursor = cursor
+        self._elapsed = elapsed
+        self._context = context
+        self._rows = 0
+        self._done = False
+
+    def _fetched(self, start, rows, exhausted):
+        elapsed = time.perf_counter() - start
+        self._elapsed += elapsed
+        self._rows += rows
+        self._runner.stats[self._sql][1] += elapsed
+        if exhausted:
+            self._finish()
+
+    def _finish(self, dropped=False):
+        if not self._done:
+            self._done = True
+            if self._runner.observer is not None:
+                # A dropped cursor is finished by the garbage collector, maybe in another
+                # thread, where the connection must not be used
+                conn = None if dropped else self._conn
+                self._runner.observer(conn, self._sql, self._parameters, self._elapsed, self._rows, self._context)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, 0 if row is None else 1, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self._cursor.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __del__(self):
+        self._finish(dropped=True)
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount, description...
+        return getattr(self._cursor, name)
+
+class QueryRunner:
+    """
+    A class that runs every query of HSDB and keeps statistics per SQL template.
+
+    All the queries are fixed, parameterised templates, so the statistics are grouped
+    by template and sqlite3's statement cache is hit on every call after the first.
+
+    Attributes
+    ----------
+    stats : dict
+        [number of calls, total time in seconds] by SQL template
+    observer : callable
+        If not None, called as observer(conn, sql, parameters, elapsed, rows, context)
+        after every query, rows being None for statements that return no rows. For a
+        cursor returned unfetched, it is called once the cursor is exhausted, closed or
+        dropped, with the rows fetched and the fetch time included in elapsed, and conn
+        set to None if the cursor was dropped.
+    context : callable
+        If not None, called when a query runs, its result being the context passed to the
+        observer (e.g. the method that ran the query)
+    """
+
+    def __init__(self, observer=None, context=None):
+        """
+        Constructor
+        """
+
+        self.stats = {}
+        self.observer = observer
+        self.context = context
+
+    def execute(self, conn, sql, parameters=(), fetch=None):
+        """
+        Execute a SQL template and return the cursor, or the fetched row(s).
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            The connection to run the query on
+        sql : str
+            The SQL template
+        parameters : tuple
+            The values of the template placeholders
+        fetch : str
+            None to return the cursor, "one" to return the first row, "all" to return
+            every row. The fetch is included in the timing, also when the rows of the
+            cursor are fetched later.
+        """
+
+        rows = None
+        result = None
+        context = self.context() if self.context is not None else None
+        start = time.perf_counter()
+        try:
+            cursor = conn.execute(sql, parameters)
+            if fetch == "one":
+                result = cursor.fetchone()
+                rows = 0 if result is None else 1
+            elif fetch == "all":
+                result = cursor.fetchall()
+                rows = len(result)
+            elif cursor.description is not None:
+                result = _StreamedCursor(self, conn, sql, parameters, cursor, 0.0, context)
+            else:
+                result = cursor
+        finally:
+            elapsed = time.perf_counter() - start
+            entry = self.stats.get(sql)
+            if entry is None:
+                self.stats[sql] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+            if isinstance(result, _StreamedCursor):
+                # Reported when its rows are fetched
+                result._elapsed = elapsed
+            elif self.observer is not None:
+                self.observer(conn, sql, parameters, elapsed, rows, context)
+        return result
+
+    def report(self):
+        """
+        Return the statistics of every template as a list of dictionaries, slowest first.
+        """
+
+        report = []
+        for sql, (count, total) in self.stats.items():
+            report.append({
+                "template": " ".join(sql.split()),
+                "count": count,
+                "total_time": total,
+                "mean_time": total / count,
+            })
+        report.sort(key=lambda entry: entry["total_time"], reverse=True)
+        return report
+
+    def reset(self):
+        """
+        Clear the statistics.
+        """
+
+        self.stats = {}
@@ -0,0 +1,206 @@
+import sys
+import time
+
+class IngestReporter:
+    """
+    A class that receives the progress of HSDB.create_tables_from_data.
+
+    The reporter counts rows and collects errors per table, and turns them into
+    structured events (dictionaries) passed to emit(). This base class does not print
+    anything: subclass it and override emit() to display or forward the events.
+
+    Events
+    ------
+    {"event": "start_table", "table": str, "total": int or None}
+    {"event": "progress", "table": str, "rows": int, "total": int or None,
+     "rate": float (rows per second), "eta": float (seconds) or None}
+    {"event": "end_table", "table": str, "rows": int, "errors": int, "seconds": float}
+    {"event": "error", "table": str, "item": str, "message": str}
+    {"event": "message", "text": str}
+    {"event": "summary", "tables": dict, "errors": list, "seconds": float}
+
+    Attributes
+    ----------
+    interval : float
+        Minimum number of seconds between two progress events of the same table
+    tables : dict
+        Rows, errors, total and timing by table name
+    errors : list of dict
+        Every error reported during the ingest
+    """
+
+    def __init__(self, interval=1.0):
+        """
+        Constructor
+        """
+
+        self.interval = interval
+        self.tables = {}
+        self.errors = []
+        self._start = time.perf_counter()
+
+    def emit(self, event):
+        """
+        Receive an event. Does nothing, override it in a subclass.
+
+        Parameters
+        ----------
+        event : dict
+            The event, see the class documentation
+        """
+
+        pass
+
+    def start(self):
+        """
+        Reset the reporter at the beginning of an ingest.
+        """
+
+        self.tables = {}
+        self.errors = []
+        self._start = time.perf_counter()
+
+    def start_table(self, table, total=None):
+        """
+        Signal that rows are about to be read for a table.
+
+        Parameters
+        ----------
+        table : str
+            The table name
+        total : int
+            The number of rows that will be read, if known
+        """
+
+        now = time.perf_counter()
+        self.tables[table] = {"rows": 0, "errors": 0, "total": total, "start": now, "end": None, "last": now}
+        self.emit({"event": "start_table", "table": table, "total": total})
+
+    def row(self, table, count=1):
+        """
+        Count rows read for a table.
+
+        Parameters
+        ----------
+        table : str
+            The table name
+        count : int
+            The number of rows, one by default
+        """
+
+        entry = self.tables.get(table)
+        if entry is None:
+            self.start_table(table)
+            entry = self.tables[table]
+        entry["rows"] += count
+
+        now = time.perf_counter()
+        if now - entry["last"] >= self.interval:
+            entry["last"] = now
+            self.emit(self._progress(table, entry, now))
+
+    def _progress(self, table, entry, now):
+        elapsed = now - entry["start"]
+        rate = entry["rows"] / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if entry["total"] is not None and rate > 0:
+            eta = max(0, entry["total"] - entry["rows"]) / rate
+        return {"event": "progress", "table": table, "rows": entry["rows"], "total": entry["total"], "rate": rate, "eta": eta}
+
+    def end_table(self, table):
+        """
+        Signal that a table is done.
+
+        Parameters
+        ----------
+        table : str
+            The table name
+        """
+
+        entry = self.tables.get(table)
+        if entry is None:
+            return
+        entry["end"] = time.perf_counter()
+        self.emit({"event": "end_table", "table": table, "rows": entry["rows"], "errors": entry["errors"], "seconds": entry["end"] - entry["start"]})
+
+    def error(self, table, item, message):
+        """
+        Record an error. Errors are not printed as they happen, they are part of the
+        summary.
+
+        Parameters
+        ----------
+        table : str
+            The table name
+        item : str
+            What failed, e.g. the card name
+        message : str or Exception
+            The error
+        """
+
+        entry = self.tables.get(table)
+        if entry is not None:
+            entry["errors"] += 1
+        error = {"event": "error", "table": table, "item": item, "message": str(message)}
+        self.errors.append(error)
+        self.emit(error)
+
+    def message(self, text):
+        """
+        Report a free-form message.
+
+        Parameters
+        ----------
+        text : str
+            The message
+        """
+
+        self.emit({"event": "message", "text": text})
+
+    def finish(self):
+        """
+        Signal the end of the ingest and return the summary event.
+        """
+
+        tables = {}
+        for table, entry in self.tables.items():
+            end = entry["end"] if entry["end"] is not None else time.perf_counter()
+            tables[table] = {"rows": entry["rows"], "errors": entry["errors"], "seconds": end - entry["start"]}
+        summary = {"event": "summary", "tables": tables, "errors": list(self.errors), "seconds": time.perf_counter() - self._start}
+        self.emit(summary)
+        return summary
+
+class ConsoleReporter(IngestReporter):
+    """
+    A reporter that writes throttled progress lines (rows, rate and ETA) and a final
+    summary, including every error, to a stream.
+
+    Attributes
+    ----------
+    stream : file
+        Where to write, sys.stderr by default
+    """
+
+    def __init__(self, stream=None, interval=1.0):
+        """
+        Constructor
+        """
+
+        IngestReporter.__init__(self, interval)
+        self.stream = stream if stream is not None else sys.stderr
+
+    def emit(self, event):
+        kind = event["event"]
+        if kind == "progress":
+            total = "/{}".format(event["total"]) if event["total"] is not None else ""
+            eta = ", ETA {:.0f} s".format(event["eta"]) if event["eta"] is not None else ""
+            self.stream.write("{:<15} {}{} rows ({:.0f} rows/s{})\n".format(event["table"], event["rows"], total, event["rate"], eta))
+        elif kind == "end_table":
+            self.stream.write("{:<15} {} rows in {:.2f} s, {} errors\n".format(event["table"], event["rows"], event["seconds"], event["errors"]))
+        elif kind == "summary":
+            rows = sum(table["rows"] for table in event["tables"].values())
+            self.stream.write("Ingest finished: {} rows in {} tables, {:.2f} s, {} errors\n".format(
+                rows, len(event["tables"]), event["seconds"], len(event["errors"])))
+            for error in event["errors"]:
+                self.stream.write("  {} / {}: {}\n".format(error["table"], error["item"], error["message"]))
+        self.stream.flush()
@@ -0,0 +1,290 @@
+import sys
+import json
+import sqlite3
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_MAX_DISK_ENTRIES = 16384
+PRUNE_INTERVAL = 256            # disk stores between two prunings of the disk tier
+
+def result_size(value):
+    """
+    Return an estimate of the memory used by a result, in bytes: the size of the
+    container plus the size of everything it holds. Results are lists and tuples of
+    strings, numbers and tuples, so nothing is counted twice in practice.
+
+    Parameters
+    ----------
+    value : object
+        The result
+    """
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            size += result_size(item)
+    return size
+
+def _from_json(value):
+    # The lists of a decoded result back to tuples, so that it cannot be modified once
+    # cached
+    if isinstance(value, list):
+        return tuple(_from_json(item) for item in value)
+    return value
+
+class ResultCache:
+    """
+    A bounded LRU cache of query results, keyed on the normalized parameters of the
+    query, with an optional on-disk tier that persists across restarts.
+
+    The memory tier is bounded both by its number of entries and by the estimated size
+    of the results (see result_size), the least recently used entries being evicted
+    first. Every lookup gives the generation of the catalog: when it changes, the memory
+    tier is cleared. Entries of the disk tier are stamped instead (e.g. with the path of
+    the database and the sequence number of its change log), since generations do not
+    survive a restart, and entries with another stamp are ignored. Results are stored on
+    disk as JSON, so the disk tier only holds data, never code to run when it is read.
+
+    Attributes
+    ----------
+    max_entries : int
+        The maximum number of entries in memory
+    max_bytes : int
+        The maximum estimated size of the results in memory
+    path : str
+        The SQLite file of the disk tier, None for a memory-only cache
+    max_disk_entries : int
+        The maximum number of entries on disk, the least recently stored being pruned
+    generation : int
+        The catalog generation of the entries in memory
+    hits : int
+        Lookups answered from memory
+    disk_hits : int
+        Lookups answered from disk (the result is then promoted to memory)
+    misses : int
+        Lookups that had to run the query
+    evictions : int
+        Entries evicted from memory to respect the bounds
+    invalidations : int
+        Number of times the memory tier was cleared because the generation changed
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, path=None,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        max_entries : int
+            The maximum number of entries in memory
+        max_bytes : int
+            The maximum estimated size of the results in memory
+        path : str
+            The SQLite file of the disk tier, None for a memory-only cache
+        max_disk_entries : int
+            The maximum number of entries on disk
+        """
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self.generation = None
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._disk = None
+        self._disk_stores = 0
+        self._by_name = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _disk_conn(self):
+        # The disk tier is opened on first use, like the database
+        if self._disk is None and self.path is not None:
+            self._disk = sqlite3.connect(self.path)
+            self._disk.execute("""CREATE TABLE IF NOT EXISTS results (
+                result_key text primary key,
+                result_stamp text not null,
+                result_value blob not null,
+                result_order integer not null)""")
+            self._disk.execute("CREATE INDEX IF NOT EXISTS results_order_index ON results (result_order)")
+            self._disk.commit()
+        return self._disk
+
+    def _count(self, name, hit):
+        counts = self._by_name.get(name)
+        if counts is None:
+            counts = self._by_name[name] = [0, 0]
+        counts[0 if hit else 1] += 1
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            if len(self._entries) > 0:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self.generation = generation
+
+    def get(self, key, generation, stamp=None):
+        """
+        Return (True, result) if the result of the query is cached, (False, None)
+        otherwise.
+
+        Parameters
+        ----------
+        key : tuple
+            The name of the query followed by its normalized parameters
+        generation : int
+            The current catalog generation
+        stamp : str
+            The current stamp of the disk tier entries, None to skip the disk tier
+        """
+
+        self._check_generation(generation)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._count(key[0], True)
+            return True, entry[0]
+
+        if stamp is not None and self.path is not None:
+            try:
+                row = self._disk_conn().execute("SELECT result_value FROM results WHERE result_key = ? AND result_stamp = ?",
+                                                (repr(key), stamp)).fetchone()
+            except (sqlite3.Error, OSError) as e:
+                print("Error in ResultCache.get:", e)
+                row = None
+            if row is not None:
+                try:
+                    value = _from_json(json.loads(row[0]))
+                except ValueError as e:
+                    # Not JSON, e.g. written by an older version: run the query again
+                    print("Error in ResultCache.get:", e)
+                    row = None
+            if row is not None:
+                self._put_memory(key, value)
+                self.disk_hits += 1
+                self._count(key[0], True)
+                return True, value
+
+        self.misses += 1
+        self._count(key[0], False)
+        return False, None
+
+    def put(self, key, value, generation, stamp=None):
+        """
+        Cache the result of a query.
+
+        Parameters
+        ----------
+        key : tuple
+            The name of the query followed by its normalized parameters
+        value : object
+            The result, which must not be modified afterwards (e.g. a tuple). On disk, the
+            result is read back with its lists turned into tuples.
+        generation : int
+            The catalog generation the result was computed from
+        stamp : str
+            The stamp of the disk tier entry, None to keep the result in memory only
+        """
+
+        self._check_generation(generation)
+        self._put_memory(key, value)
+        if stamp is not None and self.path is not None:
+            try:
+                conn = self._disk_conn()
+                self._disk_stores += 1
+                # The order is taken from the file, not from this process, so that it keeps
+                # growing across restarts and processes sharing the disk tier
+                conn.execute("""INSERT OR REPLACE INTO results
+                                SELECT ?, ?, ?, COALESCE(MAX(result_order), 0) + 1 FROM results""",
+                             (repr(key), stamp, json.dumps(value)))
+                if self._disk_stores % PRUNE_INTERVAL == 0:
+                    self._prune_disk(conn, stamp)
+                conn.commit()
+            except (sqlite3.Error, OSError, TypeError, ValueError) as e:
+                print("Error in ResultCache.put:", e)
+
+    def _put_memory(self, key, value):
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def _prune_disk(self, conn, stamp):
+        # Drop the entries of other stamps, then the oldest ones above the bound
+        conn.execute("DELETE FROM results WHERE result_stamp != ?", (stamp,))
+        conn.execute("""DELETE FROM results WHERE result_order <=
+                        (SELECT result_order FROM results ORDER BY result_order DESC LIMIT 1 OFFSET ?)""", (self.max_disk_entries,))
+
+    def clear(self, disk=True):
+        """
+        Drop every entry in memory and, if disk is True, on disk.
+
+        Parameters
+        ----------
+        disk : bool
+            Also drop the entries of the disk tier
+        """
+
+        self._entries.clear()
+        self._bytes = 0
+        if disk and self.path is not None:
+            try:
+                conn = self._disk_conn()
+                conn.execute("DELETE FROM results")
+                conn.commit()
+            except (sqlite3.Error, OSError) as e:
+                print("Error in ResultCache.clear:", e)
+
+    def stats(self):
+        """
+        Return the metrics of the cache as a dictionary with:
+            - hits, disk_hits, misses (int) and hit_rate (float, memory and disk hits over
+              lookups)
+            - entries (int) and bytes (int): the size of the memory tier
+            - evictions (int) and invalidations (int)
+            - queries (dict): query name -> {"hits": int, "misses": int, "hit_rate": float}
+        """
+
+        lookups = self.hits + self.disk_hits + self.misses
+        queries = {}
+        for name, (hits, misses) in sorted(self._by_name.items()):
+            queries[name] = {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups > 0 else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "queries": queries,
+        }
+
+    def close(self):
+        """
+        Close the disk tier, if it is open.
+        """
+
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
@@ -0,0 +1,327 @@
+"""
+Monte Carlo draw simulator for Hearthstone decks.
+
+The deck is turned into a list of (cost, card id, keyword ids) entries, and every trial
+draws a random permutation prefix of it: the opening hand plus one card per turn. The
+trials only fill counters and histograms (first draw a card or keyword is seen), so
+chunks of trials can run in separate processes and be merged by adding them up. Where the
+probability has a closed form (hypergeometric distribution), the exact value is reported
+next to the simulated one.
+
+    python Simulator.py deck.txt --trials 1000000 --seed 42
+"""
+
+import sys
+import random
+import argparse
+import multiprocessing
+from math import comb
+from HSDB import HSDB
+from Deck import Deck
+
+DEFAULT_TRIALS = 100000
+DEFAULT_TURNS = 10
+CHUNK_SIZE = 50000          # trials per task, fixed so that results do not depend on the process count
+OPENING_HAND_FIRST = 3      # cards in the opening hand of the player who goes first
+OPENING_HAND_SECOND = 4     # and of the player who goes second (the coin is not drawn from the deck)
+
+def hypergeometric_at_least_one(population, successes, draws):
+    """
+    Return the probability of drawing at least one of the successes when drawing the given
+    number of cards without replacement.
+
+    Parameters
+    ----------
+    population : int
+        The number of cards in the deck
+    successes : int
+        The number of cards of the deck that count as a success
+    draws : int
+        The number of cards drawn
+    """
+
+    draws = min(draws, population)
+    return 1 - comb(population - successes, draws) / comb(population, draws)
+
+def _run_chunk(task):
+    # Run trials and return the counts. Top-level so that it can be sent to a worker
+    # process. Position p of a histogram counts the trials where the event first happened
+    # at draw p (draw number max_draws meaning never).
+    entries, num_cards, num_keywords, draws, trials, seed = task
+    rng = random.Random(seed)
+    sample = rng.sample
+    max_draws = draws[-1]
+    never = max_draws
+    turns = range(1, len(draws) + 1)
+
+    curve_hit = [0] * len(draws)
+    perfect_curve = [0] * len(draws)
+    card_first = [[0] * (max_draws + 1) for _ in range(num_cards)]
+    keyword_first = [[0] * (max_draws + 1) for _ in range(num_keywords)]
+    keyword_count = [[0] * max_draws for _ in range(num_keywords)]
+    for _ in range(trials):
+        seen_costs = {}
+        seen_cards = {}
+        seen_keywords = {}
+        for position, (cost, card, keywords) in enumerate(sample(entries, max_draws)):
+            if cost not in seen_costs:
+                seen_costs[cost] = position
+            if card not in seen_cards:
+                seen_cards[card] = position
+            for keyword in keywords:
+                keyword_count[keyword][position] += 1
+                if keyword not in seen_keywords:
+                    seen_keywords[keyword] = position
+
+        perfect = True
+        for turn in turns:
+            if seen_costs.get(turn, never) < draws[turn - 1]:
+                curve_hit[turn - 1] += 1
+                if perfect:
+                    perfect_curve[turn - 1] += 1
+            else:
+                perfect = False
+        for card in range(num_cards):
+            card_first[card][seen_cards.get(card, never)] += 1
+        for keyword in range(num_keywords):
+            keyword_first[keyword][seen_keywords.get(keyword, never)] += 1
+
+    return [curve_hit, perfect_curve], card_first, keyword_first, keyword_count
+
+def _merge(total, part):
+    # Add the counts of part to total
+    for histograms, part_histograms in zip(total, part):
+        for histogram, part_histogram in zip(histograms, part_histograms):
+            for position, count in enumerate(part_histogram):
+                histogram[position] += count
+
+class DrawSimulator:
+    """
+    A class that simulates the opening hand and the draws of a deck, turn by turn.
+
+    On turn t, the player has seen the opening hand plus t cards (one draw per turn,
+    including turn 1). A turn is "on curve" if a card of cost t has been seen by then.
+
+    Attributes
+    ----------
+    deck : Deck
+        The simulated deck
+    turns : int
+        The number of turns simulated
+    going_first : bool
+        True for the player who goes first, False for the one with the coin
+    cards : list of str
+        The distinct card names of the deck, the card ids are their indexes
+    keywords : list of str
+        The keywords found on the cards of the deck, the keyword ids are their indexes
+    entries : list of tuple
+        (cost, card id, keyword ids) for every card of the deck
+    """
+
+    def __init__(self, deck, turns=DEFAULT_TURNS, going_first=True):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        deck : Deck
+            The deck, with at least one card
+        turns : int
+            The number of turns to simulate
+        going_first : bool
+            True to simulate the player who goes first
+        """
+
+        if len(deck.cards) == 0:
+            raise ValueError("Cannot simulate an empty deck")
+
+        self.deck = deck
+        self.turns = turns
+        self.going_first = going_first
+
+        # Keywords by card name, the first card of a name winning like in HSDB
+        card_keywords = {}
+        for card in deck.db.get_facet_index().cards:
+            card_keywords.setdefault(card["name"].lower(), card["keywords"])
+
+        self.cards = sorted(deck.card_counts)
+        card_ids = {card_name: i for i, card_name in enumerate(self.cards)}
+        self.keywords = sorted(set(keyword for card_name in self.cards for keyword in card_keywords.get(card_name.lower(), [])))
+        keyword_ids = {keyword: i for i, keyword in enumerate(self.keywords)}
+
+        self.entries = []
+        for card_name in deck.cards:
+            info = deck.db.get_card_info(card_name)
+            cost = info.card_cost if info is not None else -1
+            keywords = tuple(keyword_ids[keyword] for keyword in card_keywords.get(card_name.lower(), []))
+            self.entries.append((cost, card_ids[card_name], keywords))
+
+    def cards_seen(self, turn):
+        """
+        Return the number of cards seen by the given turn.
+
+        Parameters
+        ----------
+        turn : int
+            The turn, starting at 1
+        """
+
+        opening = OPENING_HAND_FIRST if self.going_first else OPENING_HAND_SECOND
+        return min(opening + turn, len(self.entries))
+
+    def exact(self):
+        """
+        Return the hypergeometric (exact) probabilities, by turn, as a dictionary with:
+            - curve_hit (list of float): a card of cost t is seen by turn t
+            - cards (dict): card name -> at least one copy seen by turn t
+            - keywords (dict): keyword -> {"at_least_one": list of float,
+              "expected": list of float (expected number of cards seen)}
+        """
+
+        size = len(self.entries)
+        draws = [self.cards_seen(turn) for turn in range(1, self.turns + 1)]
+        cost_count = {}
+        card_count = [0] * len(self.cards)
+        keyword_count = [0] * len(self.keywords)
+        for cost, card, keywords in self.entries:
+            cost_count[cost] = cost_count.get(cost, 0) + 1
+            card_count[card] += 1
+            for keyword in keywords:
+                keyword_count[keyword] += 1
+
+        return {
+            "curve_hit": [hypergeometric_at_least_one(size, cost_count.get(turn, 0), draws[turn - 1])
+                          for turn in range(1, self.turns + 1)],
+            "cards": {card_name: [hypergeometric_at_least_one(size, card_count[card], n) for n in draws]
+                      for card, card_name in enumerate(self.cards)},
+            "keywords": {keyword_name: {
+                             "at_least_one": [hypergeometric_at_least_one(size, keyword_count[keyword], n) for n in draws],
+                             "expected": [n * keyword_count[keyword] / size for n in draws],
+                         } for keyword, keyword_name in enumerate(self.keywords)},
+        }
+
+    def simulate(self, trials=DEFAULT_TRIALS, seed=None, processes=None):
+        """
+        Run the trials and return the simulated probabilities, by turn, as a dictionary
+        with:
+            - trials (int), seed (int), going_first (bool), deck_size (int)
+            - cards_seen (list of int): the number of cards seen by turn t
+            - curve_hit (list of float): a card of cost t is seen by turn t
+            - perfect_curve (list of float): turns 1 to t were all on curve
+            - cards (dict): card name -> at least one copy seen by turn t
+            - keywords (dict): keyword -> {"at_least_one": list of float,
+              "expected": list of float (average number of cards seen)}
+            - exact (dict): the result of exact()
+
+        The same seed always gives the same result, whatever the number of processes.
+
+        Parameters
+        ----------
+        trials : int
+            The number of simulated games
+        seed : int
+            The random seed, a random one if None
+        processes : int
+            The number of worker processes, None for one per CPU, 1 to run in this process
+        """
+
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        draws = [self.cards_seen(turn) for turn in range(1, self.turns + 1)]
+        max_draws = draws[-1]
+
+        # One task per chunk of trials, each with its own seed derived from the main one
+        seeds = random.Random(seed)
+        tasks = []
+        remaining = trials
+        while remaining > 0:
+            chunk = min(CHUNK_SIZE, remaining)
+            tasks.append((self.entries, len(self.cards), len(self.keywords), draws, chunk, seeds.randrange(2 ** 63)))
+            remaining -= chunk
+
+        total = ([[0] * self.turns, [0] * self.turns], [[0] * (max_draws + 1) for _ in self.cards], [[0] * (max_draws + 1) for _ in self.keywords],
+                 [[0] * max_draws for _ in self.keywords])
+        if processes == 1 or len(tasks) <= 1:
+            for task in tasks:
+                _merge(total, _run_chunk(task))
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for part in pool.imap_unordered(_run_chunk, tasks):
+                    _merge(total, part)
+        (curve_hit, perfect_curve), card_first, keyword_first, keyword_count = total
+
+        def cumulative(histogram):
+            # Fraction of the trials where the event happened within the first n draws
+            return [sum(histogram[:n]) / trials for n in draws]
+
+        return {
+            "trials": trials,
+            "seed": seed,
+            "going_first": self.going_first,
+            "deck_size": len(self.entries),
+            "cards_seen": draws,
+            "curve_hit": [count / trials for count in curve_hit],
+            "perfect_curve": [count / trials for count in perfect_curve],
+            "cards": {card_name: cumulative(card_first[card]) for card, card_name in enumerate(self.cards)},
+            "keywords": {keyword_name: {
+                             "at_least_one": cumulative(keyword_first[keyword]),
+                             "expected": [sum(keyword_count[keyword][:n]) / trials for n in draws],
+                         } for keyword, keyword_name in enumerate(self.keywords)},
+            "exact": self.exact(),
+        }
+
+def print_report(result):
+    """
+    Print the result of DrawSimulator.simulate as tables, simulated / exact.
+
+    Parameters
+    ----------
+    result : dict
+        The result of DrawSimulator.simulate
+    """
+
+    turns = len(result["cards_seen"])
+    exact = result["exact"]
+    row = "{:<25}" + " {:>11}" * turns
+
+    def pairs(simulated, expected):
+        return ["{:.2f}/{:.2f}".format(s, e) for s, e in zip(simulated, expected)]
+
+    print("{} trials, seed {}, going {}, {} cards".format(
+        result["trials"], result["seed"], "first" if result["going_first"] else "second", result["deck_size"]))
+    print(row.format("Turn", *range(1, turns + 1)))
+    print(row.format("Cards seen", *result["cards_seen"]))
+    print(row.format("On curve", *pairs(result["curve_hit"], exact["curve_hit"])))
+    print(row.format("Perfect curve", *["{:.2f}".format(p) for p in result["perfect_curve"]]))
+    print("")
+    print("Probability of drawing at least one copy (simulated/exact)")
+    for card_name, probabilities in result["cards"].items():
+        print(row.format(card_name[:25], *pairs(probabilities, exact["cards"][card_name])))
+    print("")
+    print("Expected number of cards seen with each keyword (simulated/exact)")
+    for keyword, values in result["keywords"].items():
+        print(row.format(keyword[:25], *pairs(values["expected"], exact["keywords"][keyword]["expected"])))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the draws of a Hearthstone deck")
+    parser.add_argument("deck", help="deck text file (Name/Class/Hero lines, then one card per line)")
+    parser.add_argument("--db", default="data/hs.sqlite", help="the database file")
+    parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS)
+    parser.add_argument("--turns", type=int, default=DEFAULT_TURNS)
+    parser.add_argument("--second", action="store_true", help="simulate the player who goes second")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--processes", type=int, help="number of worker processes, one per CPU by default")
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db, read_only=True)
+    deck = Deck(db)
+    if not deck.generate_deck_from_text_file(args.deck):
+        return 1
+
+    simulator = DrawSimulator(deck, args.turns, going_first=not args.second)
+    print_report(simulator.simulate(args.trials, args.seed, args.processes))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,572 @@
+import os
+import sys
+import mmap
+import struct
+import sqlite3
+from array import array
+
+# File layout
+# -----------
+# header    : magic (8s), version (I), byte order (I), number of sections (I)
+# directory : one entry per section: name (16s), typecode (1s), padding (3x), offset (Q), count (Q)
+# sections  : raw column data, each section aligned on 8 bytes
+#
+# Every column is a fixed-width array in the native byte order of the machine that
+# wrote it. Strings are stored once in a string table (offsets + utf-8 blob) and the
+# columns refer to them by index. The class, keyword, pool and format columns of the
+# cards are unsigned 64-bit masks, bit i standing for the i-th class, keyword or format.
+MAGIC = b"HSDBSNAP"
+VERSION = 3
+_HEADER = struct.Struct("<8sIII")
+_ENTRY = struct.Struct("<16sc3xQQ")
+_BYTE_ORDER = 1 if sys.byteorder == "little" else 2
+
+# The value stored in the attack/health columns of cards that do not have one
+NO_VALUE = -1
+
+class CatalogSnapshot:
+    """
+    A read-only, memory-mapped snapshot of the card catalog.
+
+    The snapshot file is mapped with mmap and every column is a memoryview over the
+    mapping, so loading it copies nothing and processes that map the same file share
+    the same pages.
+
+    Attributes
+    ----------
+    path : str
+        The path to the snapshot file
+    num_cards : int
+        The number of cards in the snapshot
+    num_classes : int
+        The number of classes in the snapshot
+    num_heroes : int
+        The number of heroes in the snapshot
+    num_keywords : int
+        The number of keywords in the snapshot
+    num_formats : int
+        The number of formats in the snapshot
+    """
+
+    def __init__(self, path):
+        """
+        Constructor, map the given snapshot file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the snapshot file
+        """
+
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._columns = {}
+
+        magic, version, byte_order, num_sections = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("{} is not a catalog snapshot".format(path))
+        if version != VERSION:
+            self.close()
+            raise ValueError("{} has snapshot version {}, expected {}".format(path, version, VERSION))
+        if byte_order != _BYTE_ORDER:
+            self.close()
+            raise ValueError("{} was written on a machine with a different byte order".format(path))
+
+        for i in range(num_sections):
+            name, typecode, offset, count = _ENTRY.unpack_from(self._buffer, _HEADER.size + i * _ENTRY.size)
+            name = name.rstrip(b"\0").decode()
+            typecode = typecode.decode()
+            size = array(typecode).itemsize
+            self._columns[name] = self._buffer[offset:offset + count * size].cast(typecode)
+
+        self.num_cards = len(self._columns["card_key"])
+        self.num_classes = len(self._columns["class_name"])
+        self.num_heroes = len(self._columns["hero_name"])
+        self.num_keywords = len(self._columns["keyword_name"])
+        self.num_formats = len(self._columns["format_name"])
+
+    def close(self):
+        """
+        Release the memory mapping.
+        """
+
+        for column in self._columns.values():
+            column.release()
+        self._columns = {}
+        self._buffer.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def column(self, name):
+        """
+        Return a column of the snapshot as a memoryview (no copy).
+
+        Parameters
+        ----------
+        name : str
+            The name of the column, e.g. "card_cost"
+        """
+
+        return self._columns[name]
+
+    def string(self, index):
+        """
+        Return the string stored at the given index of the string table.
+
+        Parameters
+        ----------
+        index : int
+            The index in the string table
+        """
+
+        offsets = self._columns["string_offsets"]
+        return bytes(self._columns["string_data"][offsets[index]:offsets[index + 1]]).decode()
+
+    def card_name(self, row):
+        """
+        Return the name of the card at the given row.
+
+        Parameters
+        ----------
+        row : int
+            The row of the card in the snapshot
+        """
+
+        return self.string(self._columns["card_name"][row])
+
+    def class_name(self, index):
+        """
+        Return the name of the class at the given index.
+
+        Parameters
+        ----------
+        index : int
+            The index of the class in the snapshot
+        """
+
+        return self.string(self._columns["class_name"][index])
+
+    def _search(self, index_column, name_column, row_column, name):
+        # Binary search over a column of rows sorted by lower case name
+        name = name.lower()
+        index = self._columns[index_column]
+        lo = 0
+        hi = len(index)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(self._columns[name_column][index[mid]]).lower() < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(index) and self.string(self._columns[name_column][index[lo]]).lower() == name:
+            return index[lo] if row_column is None else self._columns[row_column][index[lo]]
+        return -1
+
+    def find_card(self, card_name):
+        """
+        Return the row of the given card (case insensitive), or -1 if it does not exist.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name
+        """
+
+        return self._search("card_name_index", "card_name", None, card_name)
+
+    def find_class(self, class_name):
+        """
+        Return the index of the given class (case insensitive), or -1 if it does not exist.
+
+        Parameters
+        ----------
+        class_name : str
+            The class name
+        """
+
+        for i in range(self.num_classes):
+            if self.class_name(i).lower() == class_name.lower():
+                return i
+        return -1
+
+    def find_format(self, format_name):
+        """
+        Return the index of the given format (case insensitive), or -1 if it does not exist.
+
+        Parameters
+        ----------
+        format_name : str
+            The format name
+        """
+
+        for i in range(self.num_formats):
+            if self.string(self._columns["format_name"][i]).lower() == format_name.lower():
+                return i
+        return -1
+
+    def find_hero(self, hero_name):
+        """
+        Return the row of the given hero (case insensitive), or -1 if it does not exist.
+
+        Parameters
+        ----------
+        hero_name : str
+            The hero name
+        """
+
+        return self._search("hero_name_index", "hero_name", None, hero_name)
+
+    def check_card(self, card_name, format_name=None):
+        """
+        Return True if the given card exists in the snapshot (and is part of the given
+        format, if not None).
+        """
+
+        row = self.find_card(card_name)
+        if row < 0:
+            return False
+        if format_name is None:
+            return True
+        format_index = self.find_format(format_name)
+        return format_index >= 0 and (self._columns["card_formats"][row] >> format_index) & 1 == 1
+
+    def get_card_key(self, card_name):
+        """
+        Return the key of the given card (case insensitive), or None if it does not exist.
+        """
+
+        row = self.find_card(card_name)
+        return None if row < 0 else self._columns["card_key"][row]
+
+    def is_legal(self, card_name, class_name, format_name=None):
+        """
+        Return True if the given card is in the pool of the given class (and part of the
+        given format, if not None).
+        """
+
+        row = self.find_card(card_name)
+        class_index = self.find_class(class_name)
+        if row < 0 or class_index < 0 or (self._columns["card_pools"][row] >> class_index) & 1 == 0:
+            return False
+        if format_name is None:
+            return True
+        format_index = self.find_format(format_name)
+        return format_index >= 0 and (self._columns["card_formats"][row] >> format_index) & 1 == 1
+
+    def pool_rows(self, class_name):
+        """
+        Return the rows of every card in the pool of the given class, in card key order.
+
+        Parameters
+        ----------
+        class_name : str
+            The class name
+        """
+
+        class_index = self.find_class(class_name)
+        if class_index < 0:
+            return []
+        pools = self._columns["card_pools"]
+        return [row for row in range(self.num_cards) if (pools[row] >> class_index) & 1]
+
+    def format_keys(self, format_name):
+        """
+        Return the keys of every card of the given format, in card key order.
+
+        Parameters
+        ----------
+        format_name : str
+            The format name
+        """
+
+        format_index = self.find_format(format_name)
+        if format_index < 0:
+            return []
+        formats = self._columns["card_formats"]
+        keys = self._columns["card_key"]
+        return [keys[row] for row in range(self.num_cards) if (formats[row] >> format_index) & 1]
+
+    def check_class(self, class_name):
+        """
+        Return True if the given class exists in the snapshot.
+        """
+
+        return self.find_class(class_name) >= 0
+
+    def check_hero(self, hero_name):
+        """
+        Return True if the given hero exists in the snapshot.
+        """
+
+        return self.find_hero(hero_name) >= 0
+
+    def check_card_class(self, card_name, class_name):
+        """
+        Return True if the given class has access to the given card.
+        """
+
+        row = self.find_card(card_name)
+        class_index = self.find_class(class_name)
+        if row < 0 or class_index < 0:
+            return False
+        return (self._columns["card_classes"][row] >> class_index) & 1 == 1
+
+    def get_hero_class(self, hero_name):
+        """
+        Return the class of the given hero, or None if the hero does not exist.
+        """
+
+        row = self.find_hero(hero_name)
+        if row < 0:
+            return None
+        return self.class_name(self._columns["hero_class"][row])
+
+    def get_card_info(self, card_name):
+        """
+        Return the key, name, type, cost, rarity, attack and health of the given card (case
+        insensitive) as a tuple, like HSDB.get_card_info, or None if it does not exist. The
+        health is only given for minions.
+
+        Parameters
+        ----------
+        card_name : str
+            The card name
+        """
+
+        row = self.find_card(card_name)
+        if row < 0:
+            return None
+        c = self._columns
+        card_type = self.string(c["type_name"][c["card_type"][row]])
+        return (c["card_key"][row], self.card_name(row), card_type, _value(c["card_cost"][row]),
+                self.string(c["rarity_name"][c["card_rarity"][row]]), _value(c["card_attack"][row]),
+                _value(c["card_health"][row]) if card_type == "Minion" else None)
+
+    def _hero(self, row):
+        # The hero at the given row as a tuple, like HSDB.HeroRow, None if it has no class
+        c = self._columns
+        if c["hero_class"][row] < 0:
+            return None
+        return (c["hero_key"][row], self.string(c["hero_name"][row]), self.class_name(c["hero_class"][row]),
+                self.string(c["hero_power_name"][row]), _value(c["hero_power_cost"][row]),
+                self.string(c["hero_power_text"][row]))
+
+    def get_hero(self, hero_name):
+        """
+        Return the key, name, class, hero power name, cost and text of the given hero (case
+        insensitive) as a tuple, like HSDB.get_hero, or None if it does not exist.
+
+        Parameters
+        ----------
+        hero_name : str
+            The hero name
+        """
+
+        row = self.find_hero(hero_name)
+        return None if row < 0 else self._hero(row)
+
+    def hero_rows(self):
+        """
+        Return every hero that has a class as a tuple (see get_hero), in the order they
+        were inserted.
+        """
+
+        heroes = (self._hero(row) for row in range(self.num_heroes))
+        return [hero for hero in heroes if hero is not None]
+
+    def get_card_row(self, row):
+        """
+        Return the attributes of the card at the given row as a dictionary.
+
+        Parameters
+        ----------
+        row : int
+            The row of the card in the snapshot
+        """
+
+        c = self._columns
+        return {
+            "card_key": c["card_key"][row],
+            "card_name": self.card_name(row),
+            "card_cost": c["card_cost"][row],
+            "card_rarity": self.string(c["rarity_name"][c["card_rarity"][row]]),
+            "card_type": self.string(c["type_name"][c["card_type"][row]]),
+            "card_attack": None if c["card_attack"][row] == NO_VALUE else c["card_attack"][row],
+            "card_health": None if c["card_health"][row] == NO_VALUE else c["card_health"][row],
+            "card_classes": [self.class_name(i) for i in range(self.num_classes) if (c["card_classes"][row] >> i) & 1],
+            "card_keywords": [self.string(c["keyword_name"][i]) for i in range(self.num_keywords) if (c["card_keywords"][row] >> i) & 1],
+        }
+
+def _value(value):
+    # A number of the attack/health/cost columns, None if it has no value
+    return None if value == NO_VALUE else value
+
+def write_snapshot(conn, path):
+    """
+    Export the catalog stored in the given database connection to a snapshot file.
+    The file is written next to its destination and renamed into place, so readers
+    that have the old snapshot mapped are not affected.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        A connection to a database built by HSDB.create_tables_from_data
+    path : str
+        The path to the snapshot file
+    """
+
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        value = "" if value is None else str(value)
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    cursor = conn.cursor()
+
+    # Classes, ordered by key. A class is referred to by its position in this list.
+    cursor.execute("SELECT class_key, class_name FROM classes ORDER BY class_key")
+    classes = cursor.fetchall()
+    class_index = {key: i for i, (key, _) in enumerate(classes)}
+
+    # Keywords, ordered by key
+    cursor.execute("SELECT keyword_key, keyword_name FROM keywords ORDER BY keyword_key")
+    keywords = cursor.fetchall()
+    keyword_index = {key: i for i, (key, _) in enumerate(keywords)}
+
+    if len(classes) > 64 or len(keywords) > 64:
+        raise ValueError("A snapshot supports at most 64 classes and 64 keywords")
+
+    # Cards, with the attack/health of minions and the attack/durability of weapons
+    cursor.execute("""SELECT card_key, card_name, card_cost, card_rarity, card_type,
+                             coalesce(minion_attack, weapon_attack), coalesce(minion_health, weapon_durability)
+                      FROM cards
+                      LEFT JOIN minions ON card_key = minion_cardkey
+                      LEFT JOIN weapons ON card_key = weapon_cardkey
+                      ORDER BY card_key""")
+    cards = cursor.fetchall()
+    card_row = {card[0]: row for row, card in enumerate(cards)}
+
+    card_classes = array("Q", [0] * len(cards))
+    cursor.execute("SELECT cc_cardkey, cc_classkey FROM class_cards")
+    for card_key, class_key in cursor.fetchall():
+        if card_key in card_row and class_key in class_index:
+            card_classes[card_row[card_key]] |= 1 << class_index[class_key]
+
+    card_keywords = array("Q", [0] * len(cards))
+    cursor.execute("SELECT keyword_key, card_key FROM keyword_cards")
+    for keyword_key, card_key in cursor.fetchall():
+        if card_key in card_row and keyword_key in keyword_index:
+            card_keywords[card_row[card_key]] |= 1 << keyword_index[keyword_key]
+
+    # The pool of every class (its own cards and the neutral ones), from class_pools when
+    # the triggers are installed, else from class_cards like HSDB._load_pools
+    card_pools = array("Q", [0] * len(cards))
+    try:
+        cursor.execute("SELECT pool_classkey, pool_cardkey FROM class_pools")
+    except sqlite3.Error:
+        cursor.execute("""SELECT class_key, cc_cardkey FROM classes INNER JOIN class_cards ON cc_classkey = class_key
+                          UNION
+                          SELECT class_key, cc_cardkey FROM classes, class_cards
+                          WHERE cc_classkey IN (SELECT class_key FROM classes WHERE class_name = 'Neutral')""")
+    for class_key, card_key in cursor.fetchall():
+        if card_key in card_row and class_key in class_index:
+            card_pools[card_row[card_key]] |= 1 << class_index[class_key]
+
+    # Formats, ordered by key, if the database has them
+    try:
+        cursor.execute("SELECT format_key, format_name FROM formats ORDER BY format_key")
+        formats = cursor.fetchall()
+        cursor.execute("SELECT fc_formatkey, fc_cardkey FROM format_cards")
+        format_cards = cursor.fetchall()
+    except sqlite3.Error:
+        formats = []
+        format_cards = []
+    format_index = {key: i for i, (key, _) in enumerate(formats)}
+    if len(formats) > 64:
+        raise ValueError("A snapshot supports at most 64 formats")
+
+    card_formats = array("Q", [0] * len(cards))
+    for format_key, card_key in format_cards:
+        if card_key in card_row and format_key in format_index:
+            card_formats[card_row[card_key]] |= 1 << format_index[format_key]
+
+    rarities = []
+    types = []
+    for card in cards:
+        if card[3] not in rarities:
+            rarities.append(card[3])
+        if card[4] not in types:
+            types.append(card[4])
+
+    def number(value):
+        return NO_VALUE if value is None or value == "" else int(value)
+
+    cursor.execute("""SELECT hero_name, hero_classkey, hero_power_name, hero_power_cost, hero_power_text, rowid
+                      FROM heroes ORDER BY rowid""")
+    heroes = cursor.fetchall()
+
+    sections = [
+        ("card_key", array("i", [card[0] for card in cards])),
+        ("card_name", array("i", [intern(card[1]) for card in cards])),
+        ("card_cost", array("i", [number(card[2]) for card in cards])),
+        ("card_rarity", array("i", [rarities.index(card[3]) for card in cards])),
+        ("card_type", array("i", [types.index(card[4]) for card in cards])),
+        ("card_attack", array("i", [number(card[5]) for card in cards])),
+        ("card_health", array("i", [number(card[6]) for card in cards])),
+        ("card_classes", card_classes),
+        ("card_keywords", card_keywords),
+        ("card_pools", card_pools),
+        ("card_formats", card_formats),
+        ("card_name_index", array("i", sorted(range(len(cards)), key=lambda row: cards[row][1].lower()))),
+        ("class_name", array("i", [intern(name) for _, name in classes])),
+        ("keyword_name", array("i", [intern(name) for _, name in keywords])),
+        ("rarity_name", array("i", [intern(name) for name in rarities])),
+        ("type_name", array("i", [intern(name) for name in types])),
+        ("format_name", array("i", [intern(name) for _, name in formats])),
+        ("hero_key", array("i", [hero[5] for hero in heroes])),
+        ("hero_name", array("i", [intern(hero[0]) for hero in heroes])),
+        ("hero_class", array("i", [class_index.get(hero[1], -1) for hero in heroes])),
+        ("hero_power_name", array("i", [intern(hero[2]) for hero in heroes])),
+        ("hero_power_cost", array("i", [number(hero[3]) for hero in heroes])),
+        ("hero_power_text", array("i", [intern(hero[4]) for hero in heroes])),
+        ("hero_name_index", array("i", sorted(range(len(heroes)), key=lambda row: heroes[row][0].lower()))),
+    ]
+
+    # The string table goes last, once every string has been interned
+    encoded = [s.encode() for s in strings]
+    offsets = array("q", [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    sections.append(("string_offsets", offsets))
+    sections.append(("string_data", array("B", b"".join(encoded))))
+
+    # Lay out the sections after the header and the directory
+    directory = []
+    offset = _HEADER.size + _ENTRY.size * len(sections)
+    for name, data in sections:
+        offset = (offset + 7) // 8 * 8
+        directory.append((name, data, offset))
+        offset += len(data) * data.itemsize
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, _BYTE_ORDER, len(sections)))
+        for name, data, offset in directory:
+            f.write(_ENTRY.pack(name.encode(), data.typecode.encode(), offset, len(data)))
+        for name, data, offset in directory:
+            f.write(b"\0" * (offset - f.tell()))
+            data.tofile(f)
+    os.replace(tmp_path, path)
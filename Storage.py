@@ -0,0 +1,938 @@
+"""
+Storage backends: catalog reads, keyword search and the deck repository behind one
+interface.
+
+- SQLiteBackend serves the catalog through HSDB and keeps the decks in two tables of the
+  same database file.
+- MemoryBackend keeps everything in dictionaries and arrays. Its catalog is copied from
+  another backend once (MemoryBackend.load), and its decks only live as long as the
+  process.
+
+Both are pluggable per deployment, without changes to Deck or App:
+- main.py --catalog-storage selects where HSDB serves its catalog reads from (card, class
+  and hero lookups, get_cards, class pools, legality and keyword search): the database
+  (sqlite), or a MemoryBackend loaded from it at startup (memory), see HSDB.use_catalog.
+  Full-text search, facets, autocomplete, the iterators and the writes always use the
+  database.
+- main.py --deck-storage selects where App keeps its decks: durable (sqlite) or in
+  memory only (memory).
+
+Stored decks carry a revision, incremented on every write. Passing the revision that
+was loaded to save_deck or delete_deck makes the write a compare-and-swap: it is
+refused if another client wrote the deck in between, instead of silently overwriting
+it. A write that fails (e.g. the database is locked) raises a StorageError, so that it
+cannot be mistaken for a refused one. With a GroupCommitWriter, the deck writes of many
+threads are queued and committed together, one transaction per batch instead of one per
+write.
+
+check_conformance compares a backend with a reference backend. tests/test_storage.py runs
+it on a copy of the shipped database, and it can be run on any database:
+
+    python Storage.py data/hs.sqlite
+"""
+
+import sys
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from collections import namedtuple
+from sqlite3 import Error
+from HSDB import HSDB, CardInfo
+from Triggers import NEUTRAL_CLASS
+
+StoredDeck = namedtuple("StoredDeck", ["name", "hero", "cards", "format_name", "revision"])
+
+DEFAULT_MAX_BATCH = 256         # writes per transaction of a GroupCommitWriter
+DEFAULT_MAX_DELAY = 0.002       # seconds a GroupCommitWriter waits for more writes
+WRITER_TIMEOUT = 30.0           # seconds a writer waits for the lock of the database
+
+DECK_TABLES = (
+    """CREATE TABLE IF NOT EXISTS decks (
+        deck_key integer primary key autoincrement,
+        deck_name varchar(50) unique not null,
+        deck_hero varchar(30) not null,
+        deck_format varchar(15),
+        deck_revision integer not null default 0)""",
+    """CREATE TABLE IF NOT EXISTS deck_cards (
+        dc_deckkey integer,
+        dc_position integer,
+        dc_cardname varchar(30) not null,
+        primary key (dc_deckkey, dc_position)) WITHOUT ROWID""",
+)
+
+# Searches compared by check_conformance, on top of one search per card, class and keyword
+CONFORMANCE_SEARCHES = [
+    {},
+    {"card_cost": 2},
+    {"card_cost": 5, "card_type": "minion"},
+    {"card_rarity": "Legendary"},
+    {"card_rarity": "common", "card_type": "Spell"},
+    {"card_name": "storm"},
+    {"card_name": "a", "card_cost": 3},
+]
+CONFORMANCE_DECK = "__conformance__"
+CONFORMANCE_LEGALITY_CARDS = 200    # cards whose legality is compared in every class and format
+
+class StorageError(Exception):
+    """
+    Raised when a deck write fails, as opposed to being refused by its compare-and-swap.
+    """
+
+def _create_deck_tables(conn):
+    for statement in DECK_TABLES:
+        conn.execute(statement)
+    # Deck tables created before revisions existed
+    if "deck_revision" not in [row[1] for row in conn.execute("PRAGMA table_info(decks)")]:
+        conn.execute("ALTER TABLE decks ADD COLUMN deck_revision integer not null default 0")
+
+def _write_deck(conn, name, hero, cards, format_name, revision):
+    # Insert or replace a deck, without committing. Return its new revision, or None if
+    # revision is not None and is not the stored revision (0 if there is no deck).
+    row = conn.execute("SELECT deck_key, deck_revision FROM decks WHERE deck_name = ?", (name,)).fetchone()
+    if revision is not None and (0 if row is None else row[1]) != revision:
+        return None
+    if row is None:
+        try:
+            deck_key = conn.execute("INSERT INTO decks (deck_name, deck_hero, deck_format, deck_revision) VALUES (?,?,?,1)",
+                                    (name, hero, format_name)).lastrowid
+        except sqlite3.IntegrityError:
+            # Another connection created the deck since the SELECT
+            return None
+        new_revision = 1
+    else:
+        deck_key = row[0]
+        cursor = conn.execute("""UPDATE decks SET deck_hero = ?, deck_format = ?, deck_revision = deck_revision + 1
+                                 WHERE deck_key = ? AND deck_revision = ?""", (hero, format_name, deck_key, row[1]))
+        if cursor.rowcount == 0:
+            return None
+        new_revision = row[1] + 1
+        conn.execute("DELETE FROM deck_cards WHERE dc_deckkey = ?", (deck_key,))
+    conn.executemany("INSERT INTO deck_cards VALUES (?,?,?)",
+                     [(deck_key, position, card_name) for position, card_name in enumerate(cards)])
+    return new_revision
+
+def _remove_deck(conn, name, revision):
+    # Delete a deck, without committing. Return True if it existed (with the given
+    # revision, if not None).
+    row = conn.execute("SELECT deck_key, deck_revision FROM decks WHERE deck_name = ?", (name,)).fetchone()
+    if row is None or (revision is not None and row[1] != revision):
+        return False
+    if conn.execute("DELETE FROM decks WHERE deck_key = ? AND deck_revision = ?", (row[0], row[1])).rowcount == 0:
+        return False
+    conn.execute("DELETE FROM deck_cards WHERE dc_deckkey = ?", (row[0],))
+    return True
+
+class StorageBackend(ABC):
+    """
+    The interface of the storage backends. Card, class, hero and keyword names are case
+    insensitive, deck names are not. If two cards share a name, the first one (by card
+    key) wins, like in HSDB.
+
+    Attributes
+    ----------
+    name : str
+        The name of the backend, for reports
+    """
+
+    name = None
+
+    @abstractmethod
+    def get_card(self, card_name):
+        """
+        Return the CardInfo (key, name, type, cost, rarity, attack and health) of the given
+        card, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def check_card(self, card_name, format_name=None):
+        """
+        Return True if the given card exists (and is part of the given format, if not
+        None).
+        """
+
+    @abstractmethod
+    def check_class(self, class_name):
+        """
+        Return True if the given class exists.
+        """
+
+    @abstractmethod
+    def is_legal(self, card_name, class_name, format_name=None):
+        """
+        Return True if the given card is in the pool of the given class (and part of the
+        given format, if not None).
+        """
+
+    @abstractmethod
+    def find_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None,
+                   format_name=None):
+        """
+        Return the names of the cards that match the given parameters (same parameters as
+        HSDB.get_cards), sorted and without duplicates.
+        """
+
+    @abstractmethod
+    def get_pool_cards(self, class_name, format_name=None):
+        """
+        Return the names of every card the given class can put in a deck (class cards and
+        neutral cards), of the given format if not None, sorted.
+        """
+
+    @abstractmethod
+    def get_hero(self, hero_name):
+        """
+        Return the HeroRow of the given hero, or None if it does not exist.
+        """
+
+    @abstractmethod
+    def get_heroes(self, class_name=None):
+        """
+        Return the names of the heroes of the given class (None for every hero), in the
+        order they were inserted.
+        """
+
+    @abstractmethod
+    def cards_with_keywords(self, keywords, format_name=None):
+        """
+        Return the names of the cards that have every given keyword (and are part of the
+        given format, if not None), sorted and without duplicates. An empty list of
+        keywords matches no card.
+        """
+
+    @abstractmethod
+    def export_catalog(self):
+        """
+        Return (cards, heroes): the cards as dictionaries with the keys card_key, name,
+        cost, rarity, type, attack, health, classes, keywords and formats, in card_key
+        order, and the heroes as HeroRow namedtuples, in the order they were inserted.
+        """
+
+    @abstractmethod
+    def save_deck(self, name, hero, cards, format_name=None, revision=None):
+        """
+        Store a deck, replacing the deck of the same name if there is one. Return the new
+        revision of the deck, or None if the write was refused. Raise a StorageError if the
+        write failed.
+
+        If revision is not None, the write is a compare-and-swap: it only happens if the
+        stored deck still has this revision, 0 meaning that there must be no deck of this
+        name yet.
+        """
+
+    @abstractmethod
+    def load_deck(self, name):
+        """
+        Return the StoredDeck (name, hero, cards, format_name, revision) of the given name,
+        or None if there is none.
+        """
+
+    @abstractmethod
+    def delete_deck(self, name, revision=None):
+        """
+        Delete the deck of the given name. Return True if there was one (with the given
+        revision, if not None). Raise a StorageError if the deletion failed.
+        """
+
+    @abstractmethod
+    def deck_names(self):
+        """
+        Return the names of the stored decks, sorted.
+        """
+
+    def close(self):
+        """
+        Release the resources of the backend.
+        """
+
+class SQLiteBackend(StorageBackend):
+    """
+    The backend of the SQLite database of an HSDB: the catalog is read through the HSDB
+    (and its caches), the decks are stored in the decks and deck_cards tables.
+
+    Attributes
+    ----------
+    db : HSDB
+        The database manager
+    writer : GroupCommitWriter
+        If not None, the deck writes go through this writer instead of the connection of
+        the HSDB
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db, writer=None):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        db : HSDB
+            The database manager
+        writer : GroupCommitWriter
+            If not None, the deck writes go through this writer, e.g. a writer shared by
+            the backends of several threads
+        """
+
+        self.db = db
+        self.writer = writer
+        self._deck_tables = False
+
+    def get_card(self, card_name):
+        return self.db.get_card_info(card_name)
+
+    def check_card(self, card_name, format_name=None):
+        return self.db.check_card(card_name, format_name)
+
+    def check_class(self, class_name):
+        return self.db.check_class(class_name)
+
+    def is_legal(self, card_name, class_name, format_name=None):
+        return self.db.is_legal(card_name, class_name, format_name)
+
+    def find_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None,
+                   format_name=None):
+        return sorted(set(self.db.get_cards(card_name, card_cost, card_rarity, card_type, class_name, format_name)))
+
+    def get_pool_cards(self, class_name, format_name=None):
+        return list(self.db.get_pool_cards(class_name, format_name))
+
+    def get_hero(self, hero_name):
+        return self.db.get_hero(hero_name)
+
+    def get_heroes(self, class_name=None):
+        return self.db.get_heroes(class_name=class_name)
+
+    def cards_with_keywords(self, keywords, format_name=None):
+        return self.db.cards_with_keywords(keywords, format_name)
+
+    def export_catalog(self):
+        # The cards of the facet index are shared, the formats are added to copies
+        card_formats = {}
+        for format_name in self.db.get_formats():
+            for card_key in self.db.get_format_ids(format_name):
+                card_formats.setdefault(card_key, []).append(format_name)
+        cards = [dict(card, formats=card_formats.get(card["card_key"], [])) for card in self.db.get_facet_index().cards]
+        registry = self.db.get_hero_registry()
+        return cards, [] if registry is None else registry.heroes
+
+    def _ensure_deck_tables(self):
+        if not self._deck_tables:
+            _create_deck_tables(self.db.conn)
+            self._deck_tables = True
+
+    def save_deck(self, name, hero, cards, format_name=None, revision=None):
+        self.db._check_writable("save_deck")
+        if self.writer is not None:
+            return self.writer.save_deck(name, hero, cards, format_name, revision)
+        conn = self.db.conn
+        try:
+            self._ensure_deck_tables()
+            new_revision = _write_deck(conn, name, hero, cards, format_name, revision)
+            conn.commit()
+            return new_revision
+        except Error as e:
+            conn.rollback()
+            raise StorageError("cannot save {}: {}".format(name, e)) from e
+
+    def load_deck(self, name):
+        try:
+            # One statement, so that the cards always match the revision
+            rows = self.db._fetchall("""SELECT deck_hero, deck_format, deck_revision, dc_cardname FROM decks
+                                        LEFT JOIN deck_cards ON dc_deckkey = deck_key
+                                        WHERE deck_name = ? ORDER BY dc_position""", (name,))
+        except Error:
+            # No deck was ever saved in this database
+            return None
+        if len(rows) == 0:
+            return None
+        hero, format_name, revision, _ = rows[0]
+        return StoredDeck(name, hero, [row[3] for row in rows if row[3] is not None], format_name, revision)
+
+    def delete_deck(self, name, revision=None):
+        self.db._check_writable("delete_deck")
+        if self.writer is not None:
+            return self.writer.delete_deck(name, revision)
+        conn = self.db.conn
+        try:
+            self._ensure_deck_tables()
+            deleted = _remove_deck(conn, name, revision)
+            conn.commit()
+            return deleted
+        except Error as e:
+            conn.rollback()
+            raise StorageError("cannot delete {}: {}".format(name, e)) from e
+
+    def deck_names(self):
+        try:
+            return [row[0] for row in self.db._fetchall("SELECT deck_name FROM decks ORDER BY deck_name")]
+        except Error:
+            return []
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+class MemoryBackend(StorageBackend):
+    """
+    A backend that keeps everything in memory: one row per card, with the columns that
+    are scanned by find_cards in arrays and lists, and dictionaries from lower case
+    names to rows. Nothing is persisted.
+
+    Attributes
+    ----------
+    cards : list of dict
+        The cards as returned by export_catalog, in card_key order
+    heroes : list of HeroRow
+        The heroes, in the order they were inserted
+    """
+
+    name = "memory"
+
+    def __init__(self, cards=(), heroes=()):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        cards : list of dict
+            The cards, see StorageBackend.export_catalog
+        heroes : list of HeroRow
+            The heroes
+        """
+
+        self._decks = {}
+        self._decks_lock = threading.Lock()
+        self._index(list(cards), list(heroes))
+
+    def load(self, backend, decks=True):
+        """
+        Replace the catalog with the catalog of another backend, e.g. a SQLiteBackend, and
+        copy its decks.
+
+        Parameters
+        ----------
+        backend : StorageBackend
+            The backend to copy
+        decks : bool
+            Also copy the decks of the backend
+        """
+
+        self._index(*backend.export_catalog())
+        if decks:
+            for name in backend.deck_names():
+                deck = backend.load_deck(name)
+                if deck is not None:
+                    with self._decks_lock:
+                        self._decks[deck.name] = StoredDeck(deck.name, deck.hero, list(deck.cards), deck.format_name,
+                                                            deck.revision)
+
+    def _index(self, cards, heroes):
+        self.cards = cards
+        self.heroes = heroes
+        self._info = []
+        self._lower_names = []
+        # A list rather than an array: a card can have no cost (None), which, like NULL in
+        # SQL, matches no card_cost filter
+        self._costs = []
+        self._rarities = []
+        self._types = []
+        self._by_name = {}
+        self._class_rows = {}
+        self._keyword_rows = {}
+        self._format_rows = {}
+        for row, card in enumerate(cards):
+            self._info.append(CardInfo(card["card_key"], card["name"], card["type"], card["cost"], card["rarity"],
+                                       card["attack"], card["health"] if card["type"] == "Minion" else None))
+            self._lower_names.append(card["name"].lower())
+            self._costs.append(card["cost"])
+            self._rarities.append(card["rarity"].lower())
+            self._types.append(card["type"].lower())
+            self._by_name.setdefault(card["name"].lower(), row)
+            for class_name in set(class_name.lower() for class_name in card["classes"]):
+                self._class_rows.setdefault(class_name, array("l")).append(row)
+            for keyword in card["keywords"]:
+                self._keyword_rows.setdefault(keyword.lower(), set()).add(row)
+            for format_name in card.get("formats", ()):
+                self._format_rows.setdefault(format_name.lower(), set()).add(row)
+
+        self._heroes = {}
+        self._class_heroes = {}
+        for hero in heroes:
+            if hero.hero_name.lower() not in self._heroes:
+                self._heroes[hero.hero_name.lower()] = hero
+                self._class_heroes.setdefault(hero.class_name.lower(), []).append(hero.hero_name)
+
+        # Every class can play its cards and the neutral cards
+        neutral = self._class_rows.get(NEUTRAL_CLASS.lower(), array("l"))
+        self._pools = {}
+        self._pool_rows = {}
+        for class_name in set(self._class_rows) | set(self._class_heroes):
+            rows = self._pool_rows[class_name] = set(self._class_rows.get(class_name, ())) | set(neutral)
+            self._pools[class_name] = sorted(set(cards[row]["name"] for row in rows))
+
+    def get_card(self, card_name):
+        row = self._by_name.get(card_name.lower())
+        return None if row is None else self._info[row]
+
+    def check_card(self, card_name, format_name=None):
+        row = self._by_name.get(card_name.lower())
+        if row is None or format_name is None:
+            return row is not None
+        return row in self._format_rows.get(format_name.lower(), ())
+
+    def check_class(self, class_name):
+        # The classes of the cards and of the heroes
+        return class_name.lower() in self._pool_rows
+
+    def is_legal(self, card_name, class_name, format_name=None):
+        row = self._by_name.get(card_name.lower())
+        if row is None or row not in self._pool_rows.get(class_name.lower(), ()):
+            return False
+        return format_name is None or row in self._format_rows.get(format_name.lower(), ())
+
+    def find_cards(self, card_name=None, card_cost=None, card_rarity=None, card_type=None, class_name=None,
+                   format_name=None):
+        if class_name is not None:
+            rows = self._class_rows.get(class_name.lower(), ())
+        elif card_name is None and card_cost is None and card_rarity is None and card_type is None:
+            rows = range(len(self.cards))
+        else:
+            # Like the SQL search, a filter only matches cards that belong to a class
+            rows = sorted(set(row for class_rows in self._class_rows.values() for row in class_rows))
+
+        if card_name is not None:
+            card_name = card_name.lower()
+            rows = [row for row in rows if card_name in self._lower_names[row]]
+        if card_cost is not None:
+            costs = self._costs
+            rows = [row for row in rows if costs[row] == card_cost]
+        if card_rarity is not None:
+            card_rarity = card_rarity.lower()
+            rows = [row for row in rows if self._rarities[row] == card_rarity]
+        if card_type is not None:
+            card_type = card_type.lower()
+            rows = [row for row in rows if self._types[row] == card_type]
+        if format_name is not None:
+            format_rows = self._format_rows.get(format_name.lower(), set())
+            rows = [row for row in rows if row in format_rows]
+        return sorted(set(self.cards[row]["name"] for row in rows))
+
+    def get_pool_cards(self, class_name, format_name=None):
+        if format_name is None:
+            return list(self._pools.get(class_name.lower(), []))
+        rows = self._pool_rows.get(class_name.lower(), set()) & self._format_rows.get(format_name.lower(), set())
+        return sorted(set(self.cards[row]["name"] for row in rows))
+
+    def get_hero(self, hero_name):
+        return self._heroes.get(hero_name.lower())
+
+    def get_heroes(self, class_name=None):
+        if class_name is None:
+            return [hero.hero_name for hero in self._heroes.values()]
+        return list(self._class_heroes.get(class_name.lower(), []))
+
+    def cards_with_keywords(self, keywords, format_name=None):
+        keywords = set(keyword.lower() for keyword in keywords)
+        if len(keywords) == 0:
+            return []
+        rows = None if format_name is None else self._format_rows.get(format_name.lower(), set())
+        for keyword in sorted(keywords, key=lambda keyword: len(self._keyword_rows.get(keyword, ()))):
+            matches = self._keyword_rows.get(keyword, set())
+            rows = set(matches) if rows is None else rows & matches
+            if len(rows) == 0:
+                return []
+        return sorted(set(self.cards[row]["name"] for row in rows))
+
+    def export_catalog(self):
+        return self.cards, self.heroes
+
+    def save_deck(self, name, hero, cards, format_name=None, revision=None):
+        with self._decks_lock:
+            deck = self._decks.get(name)
+            stored_revision = 0 if deck is None else deck.revision
+            if revision is not None and revision != stored_revision:
+                return None
+            self._decks[name] = StoredDeck(name, hero, list(cards), format_name, stored_revision + 1)
+            return stored_revision + 1
+
+    def load_deck(self, name):
+        deck = self._decks.get(name)
+        return None if deck is None else deck._replace(cards=list(deck.cards))
+
+    def delete_deck(self, name, revision=None):
+        with self._decks_lock:
+            deck = self._decks.get(name)
+            if deck is None or (revision is not None and revision != deck.revision):
+                return False
+            del self._decks[name]
+            return True
+
+    def deck_names(self):
+        return sorted(self._decks)
+
+class _PendingWrite:
+    # A queued write and, once its batch is committed, its result, or why it failed
+
+    def __init__(self, operation, arguments):
+        self.operation = operation
+        self.arguments = arguments
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class GroupCommitWriter:
+    """
+    A queue of deck writes applied by one thread with its own connection. The writer
+    takes every write queued while the previous batch was committing (waiting max_delay
+    for more if there is only one), applies them in order in a single transaction and
+    commits once, so that a burst of small edits from many clients costs one commit
+    instead of one per edit. The compare-and-swap of each write is checked inside the
+    transaction, so a conflict only refuses that write, and each write runs in its own
+    savepoint, so an error only fails that write.
+
+    save_deck and delete_deck block until the batch of the write is committed, and can be
+    called from any thread. They raise a StorageError if the write or its batch failed
+    (e.g. the commit could not take the lock), if the writer is closed, or if its thread
+    stopped before applying the write.
+
+    Attributes
+    ----------
+    db_file : str
+        The path to the database (.sqlite) file
+    max_batch : int
+        The maximum number of writes per transaction
+    max_delay : float
+        The number of seconds to wait for more writes before committing a single one
+    writes : int
+        Writes applied (committed and not refused)
+    conflicts : int
+        Writes refused: the revision did not match, or the deck to delete did not exist
+    failures : int
+        Writes that failed, alone or with their batch
+    batches : int
+        Transactions committed
+    """
+
+    def __init__(self, db_file, max_batch=DEFAULT_MAX_BATCH, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Constructor
+
+        Parameters
+        ----------
+        db_file : str
+            The path to the database (.sqlite) file
+        max_batch : int
+            The maximum number of writes per transaction
+        max_delay : float
+            The number of seconds to wait for more writes before committing a single one
+        """
+
+        self.db_file = db_file
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.writes = 0
+        self.conflicts = 0
+        self.failures = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        # Guards _closed, so that no write is queued after the stop marker of close()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="GroupCommitWriter", daemon=True)
+        self._thread.start()
+
+    def _submit(self, operation, arguments):
+        pending = _PendingWrite(operation, arguments)
+        with self._lock:
+            if self._closed:
+                raise StorageError("the writer of {} is closed".format(self.db_file))
+            self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise StorageError(pending.error)
+        return pending.result
+
+    def save_deck(self, name, hero, cards, format_name=None, revision=None):
+        """
+        Queue a deck write and wait for it, see StorageBackend.save_deck. Return the new
+        revision of the deck, or None if the write was refused.
+        """
+
+        return self._submit(_write_deck, (name, hero, list(cards), format_name, revision))
+
+    def delete_deck(self, name, revision=None):
+        """
+        Queue a deck deletion and wait for it, see StorageBackend.delete_deck. Return True
+        if the deck was deleted.
+        """
+
+        return self._submit(_remove_deck, (name, revision)) is True
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_delay
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            try:
+                if self._queue.qsize() > 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _fail(self, batch, error):
+        # Fail the writes of a batch that were not answered yet
+        for pending in batch:
+            if pending is not None and not pending.done.is_set():
+                pending.result = None
+                pending.error = error
+                self.failures += 1
+                pending.done.set()
+
+    def _apply(self, conn, batch):
+        # Apply a batch in one transaction. Each write runs in its own savepoint, so that a
+        # write that raises is rolled back and failed alone, and the others are committed.
+        try:
+            conn.execute("BEGIN")
+            applied = []
+            for pending in batch:
+                conn.execute("SAVEPOINT deck_write")
+                try:
+                    pending.result = pending.operation(conn, *pending.arguments)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO deck_write")
+                    print("Error in GroupCommitWriter:", e)
+                    self._fail([pending], "the write failed: {}".format(e))
+                else:
+                    applied.append(pending)
+                conn.execute("RELEASE deck_write")
+            conn.execute("COMMIT")
+        except Error as e:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK")
+                except Error:
+                    pass
+            print("Error in GroupCommitWriter:", e)
+            self._fail(batch, "the batch of {} writes failed: {}".format(len(batch), e))
+            return
+        self.batches += 1
+        refused = sum(1 for pending in applied if pending.result is None or pending.result is False)
+        self.writes += len(applied) - refused
+        self.conflicts += refused
+
+    def _run(self):
+        conn = None
+        batch = []
+        error = "the writer of {} is closed".format(self.db_file)
+        try:
+            # Autocommit mode: the transactions and savepoints are issued explicitly
+            conn = sqlite3.connect(self.db_file, timeout=WRITER_TIMEOUT, isolation_level=None)
+            try:
+                _create_deck_tables(conn)
+            except Error as e:
+                print("Error in GroupCommitWriter:", e)
+
+            running = True
+            while running:
+                batch = self._next_batch()
+                if batch[-1] is None:
+                    # close() was called, apply what was queued before it and stop
+                    batch.pop()
+                    running = False
+                if len(batch) > 0:
+                    self._apply(conn, batch)
+                for pending in batch:
+                    pending.done.set()
+        except Exception as e:
+            print("Error in GroupCommitWriter:", e)
+            error = "the writer of {} stopped: {}".format(self.db_file, e)
+        finally:
+            # Refuse new writes, then fail the writes of the current batch and the queued
+            # ones, so that no caller waits forever
+            with self._lock:
+                self._closed = True
+            queued = []
+            while True:
+                try:
+                    queued.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._fail(batch + queued, error)
+            if conn is not None:
+                conn.close()
+
+    def stats(self):
+        """
+        Return the metrics of the writer as a dictionary with writes, conflicts, failures,
+        batches (int) and writes_per_batch (float, applied and refused writes per
+        committed transaction).
+        """
+
+        return {
+            "writes": self.writes,
+            "conflicts": self.conflicts,
+            "failures": self.failures,
+            "batches": self.batches,
+            "writes_per_batch": (self.writes + self.conflicts) / self.batches if self.batches > 0 else 0.0,
+        }
+
+    def close(self):
+        """
+        Apply the queued writes and stop the writer thread. Writes submitted after close
+        raise a StorageError.
+        """
+
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                self._queue.put(None)
+        self._thread.join()
+
+def _compare(mismatches, what, expected, actual):
+    if expected != actual:
+        mismatches.append("{}: expected {!r}, got {!r}".format(what, expected, actual))
+
+def check_deck_repository(backend):
+    """
+    Save, overwrite, load and delete a deck named CONFORMANCE_DECK in the given backend
+    and return the list of what went wrong (empty if the repository behaves).
+
+    Parameters
+    ----------
+    backend : StorageBackend
+        The backend to check
+    """
+
+    mismatches = []
+    before = backend.deck_names()
+    if CONFORMANCE_DECK in before:
+        return ["{}: a deck named {} already exists".format(backend.name, CONFORMANCE_DECK)]
+
+    cards = ["Card {}".format(i % 7) for i in range(30)]
+    _compare(mismatches, "save_deck", 1, backend.save_deck(CONFORMANCE_DECK, "Hero", cards, revision=0))
+    _compare(mismatches, "load_deck", StoredDeck(CONFORMANCE_DECK, "Hero", cards, None, 1), backend.load_deck(CONFORMANCE_DECK))
+    _compare(mismatches, "deck_names", sorted(before + [CONFORMANCE_DECK]), backend.deck_names())
+    _compare(mismatches, "save_deck of an existing deck as new", None, backend.save_deck(CONFORMANCE_DECK, "Hero", [], revision=0))
+    _compare(mismatches, "save_deck", 2, backend.save_deck(CONFORMANCE_DECK, "Other hero", cards[:3], "Standard", revision=1))
+    _compare(mismatches, "save_deck with a stale revision", None, backend.save_deck(CONFORMANCE_DECK, "Hero", [], revision=1))
+    _compare(mismatches, "load_deck after save", StoredDeck(CONFORMANCE_DECK, "Other hero", cards[:3], "Standard", 2),
+             backend.load_deck(CONFORMANCE_DECK))
+    _compare(mismatches, "save_deck without revision", 3, backend.save_deck(CONFORMANCE_DECK, "Other hero", cards[:3], "Standard"))
+    _compare(mismatches, "load_deck of an unknown deck", None, backend.load_deck(CONFORMANCE_DECK.upper()))
+    _compare(mismatches, "delete_deck with a stale revision", False, backend.delete_deck(CONFORMANCE_DECK, 2))
+    _compare(mismatches, "delete_deck", True, backend.delete_deck(CONFORMANCE_DECK, 3))
+    _compare(mismatches, "delete_deck twice", False, backend.delete_deck(CONFORMANCE_DECK))
+    _compare(mismatches, "load_deck after delete", None, backend.load_deck(CONFORMANCE_DECK))
+    _compare(mismatches, "deck_names after delete", before, backend.deck_names())
+    return ["{}: {}".format(backend.name, mismatch) for mismatch in mismatches]
+
+def check_conformance(backend, reference):
+    """
+    Compare the catalog reads and keyword searches of a backend with those of a
+    reference backend, on every card, hero, class and keyword of the reference catalog,
+    and return the list of differences (empty if the backend conforms).
+
+    Parameters
+    ----------
+    backend : StorageBackend
+        The backend to check
+    reference : StorageBackend
+        The backend that is right, e.g. the SQLiteBackend of the database
+    """
+
+    mismatches = []
+    cards, heroes = reference.export_catalog()
+    names = set(card["name"] for card in cards)
+    for card_name in sorted(names):
+        for variant in (card_name, card_name.upper()):
+            _compare(mismatches, "get_card({!r})".format(variant), reference.get_card(variant), backend.get_card(variant))
+            _compare(mismatches, "check_card({!r})".format(variant), reference.check_card(variant), backend.check_card(variant))
+    _compare(mismatches, "get_card of an unknown card", None, backend.get_card("No such card"))
+    _compare(mismatches, "check_card of an unknown card", False, backend.check_card("No such card"))
+
+    classes = sorted(set(class_name for card in cards for class_name in card["classes"]) |
+                     set(hero.class_name for hero in heroes))
+    searches = list(CONFORMANCE_SEARCHES)
+    searches.extend({"class_name": class_name} for class_name in classes)
+    searches.extend({"class_name": class_name.lower(), "card_cost": 1} for class_name in classes)
+    for search in searches:
+        _compare(mismatches, "find_cards({})".format(search), reference.find_cards(**search), backend.find_cards(**search))
+    # Legality of a sample of the cards, in every class
+    sample = sorted(names)[:CONFORMANCE_LEGALITY_CARDS] + ["No such card"]
+    for class_name in classes + ["No such class"]:
+        _compare(mismatches, "check_class({!r})".format(class_name.upper()),
+                 reference.check_class(class_name.upper()), backend.check_class(class_name.upper()))
+        for card_name in sample:
+            _compare(mismatches, "is_legal({!r}, {!r})".format(card_name, class_name),
+                     reference.is_legal(card_name, class_name), backend.is_legal(card_name, class_name))
+        _compare(mismatches, "get_pool_cards({!r})".format(class_name),
+                 reference.get_pool_cards(class_name), backend.get_pool_cards(class_name))
+        _compare(mismatches, "get_heroes({!r})".format(class_name),
+                 reference.get_heroes(class_name), backend.get_heroes(class_name))
+    _compare(mismatches, "get_heroes()", reference.get_heroes(), backend.get_heroes())
+    for hero in heroes:
+        _compare(mismatches, "get_hero({!r})".format(hero.hero_name),
+                 reference.get_hero(hero.hero_name.lower()), backend.get_hero(hero.hero_name.lower()))
+    _compare(mismatches, "get_hero of an unknown hero", None, backend.get_hero("No such hero"))
+
+    keywords = sorted(set(keyword for card in cards for keyword in card["keywords"]))
+    searches = [[keyword] for keyword in keywords] + [list(pair) for pair in zip(keywords, keywords[1:])]
+    searches += [[], ["No such keyword"], [keyword.upper() for keyword in keywords[:1]]]
+    for search in searches:
+        _compare(mismatches, "cards_with_keywords({})".format(search),
+                 reference.cards_with_keywords(search), backend.cards_with_keywords(search))
+
+    # Databases built before formats existed have none to compare
+    formats = sorted(set(format_name for card in cards for format_name in card["formats"]))
+    for format_name in formats + ["No such format"] if len(formats) > 0 else []:
+        for search in CONFORMANCE_SEARCHES[:2] + [{"class_name": class_name} for class_name in classes]:
+            search = dict(search, format_name=format_name)
+            _compare(mismatches, "find_cards({})".format(search), reference.find_cards(**search), backend.find_cards(**search))
+        for card_name in sample:
+            _compare(mismatches, "check_card({!r}, {!r})".format(card_name, format_name),
+                     reference.check_card(card_name, format_name), backend.check_card(card_name, format_name))
+        for class_name in classes:
+            for card_name in sample:
+                _compare(mismatches, "is_legal({!r}, {!r}, {!r})".format(card_name, class_name, format_name),
+                         reference.is_legal(card_name, class_name, format_name),
+                         backend.is_legal(card_name, class_name, format_name))
+            _compare(mismatches, "get_pool_cards({!r}, {!r})".format(class_name, format_name),
+                     reference.get_pool_cards(class_name, format_name), backend.get_pool_cards(class_name, format_name))
+        for keyword in keywords:
+            _compare(mismatches, "cards_with_keywords([{!r}], {!r})".format(keyword, format_name),
+                     reference.cards_with_keywords([keyword], format_name), backend.cards_with_keywords([keyword], format_name))
+    return ["{}: {}".format(backend.name, mismatch) for mismatch in mismatches]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the storage backends agree on a database")
+    parser.add_argument("db_file", help="the .sqlite database, built by main.py")
+    parser.add_argument("--read-only", action="store_true",
+                        help="open the database read-only and skip the deck repository of the SQLite backend")
+    args = parser.parse_args(argv)
+
+    db = HSDB()
+    db.connect(args.db_file, read_only=args.read_only)
+    sqlite_backend = SQLiteBackend(db)
+    memory_backend = MemoryBackend()
+    memory_backend.load(sqlite_backend)
+
+    mismatches = check_conformance(memory_backend, sqlite_backend)
+    mismatches += check_deck_repository(memory_backend)
+    if not args.read_only:
+        mismatches += check_deck_repository(sqlite_backend)
+        writer_backend = SQLiteBackend(db, GroupCommitWriter(args.db_file))
+        mismatches += ["group commit " + mismatch for mismatch in check_deck_repository(writer_backend)]
+        writer_backend.close()
+    for mismatch in mismatches:
+        print(mismatch)
+    print("{} cards, {} heroes: {} mismatches".format(len(memory_backend.cards), len(memory_backend.heroes), len(mismatches)))
+    return 1 if len(mismatches) > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+# Tables derived from the catalog, and the triggers that keep them consistent with it on
+# every insert, update or delete of cards, the type tables (minions, spells, weapons),
+# class_cards, classes and keywords. Once installed (HSDB.install_triggers), a patch of
+# the catalog only touches the rows derived from the rows it changes.
+#
+# Derived data:
+#   - keyword_cards: the keywords found in the text of a card (case-sensitive substring,
+#     like HSDB.checkForKeywords)
+#   - class_pools: the legal card pool of every class: its cards, dual-class cards
+#     included, plus every neutral card (the pool of Neutral is the neutral cards only)
+#   - card_details: one denormalized row per card, with its stats, text and classes
+#   - card_search: full-text index (FTS5) of the card names and texts, rowid = card_key
+#   - format_cards: the cards of every format, see Formats.py
+
+from Formats import DEFAULT_SET, FORMAT_TRIGGERS
+
+# The class whose cards are in the pool of every class
+NEUTRAL_CLASS = "Neutral"
+
+CARD_DETAILS_TABLE = """CREATE TABLE IF NOT EXISTS card_details (
+    card_key integer primary key,
+    card_name varchar(25) not null,
+    card_cost integer,
+    card_rarity varchar(10),
+    card_type varchar(10),
+    card_attack integer,
+    card_health integer,
+    card_text text,
+    card_classes text)"""
+
+CARD_SEARCH_TABLE = """CREATE VIRTUAL TABLE IF NOT EXISTS card_search USING fts5 (card_name, card_text)"""
+
+CLASS_POOLS_TABLE = """CREATE TABLE IF NOT EXISTS class_pools (
+    pool_classkey integer,
+    pool_cardkey integer,
+    primary key (pool_classkey, pool_cardkey))"""
+
+# The text, attack and health of a card, from whichever type table it is in. The health
+# of a weapon is its durability.
+_CARD_STATS = """SELECT card_key,
+       COALESCE(minion_attack, weapon_attack) AS card_attack,
+       COALESCE(minion_health, weapon_durability) AS card_health,
+       COALESCE(minion_text, spell_text, weapon_text) AS card_text
+FROM cards
+LEFT JOIN (SELECT minion_cardkey, MIN(minion_attack) AS minion_attack, MIN(minion_health) AS minion_health,
+                  MIN(minion_text) AS minion_text FROM minions GROUP BY minion_cardkey) ON minion_cardkey = card_key
+LEFT JOIN (SELECT spell_cardkey, MIN(spell_text) AS spell_text FROM spells GROUP BY spell_cardkey) ON spell_cardkey = card_key
+LEFT JOIN (SELECT weapon_cardkey, MIN(weapon_attack) AS weapon_attack, MIN(weapon_durability) AS weapon_durability,
+                  MIN(weapon_text) AS weapon_text FROM weapons GROUP BY weapon_cardkey) ON weapon_cardkey = card_key"""
+
+# The classes of a card, "|" separated like in cards.csv
+_CARD_CLASSES = """(SELECT group_concat(class_name, '|') FROM
+                       (SELECT DISTINCT class_name FROM class_cards INNER JOIN classes ON cc_classkey = class_key
+                        WHERE cc_cardkey = {key} ORDER BY class_name))"""
+
+# Indexes on the card keys, so that every trigger only reads the rows of the cards it
+# maintains
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS minions_card_index ON minions (minion_cardkey)",
+    "CREATE INDEX IF NOT EXISTS spells_card_index ON spells (spell_cardkey)",
+    "CREATE INDEX IF NOT EXISTS weapons_card_index ON weapons (weapon_cardkey)",
+    "CREATE INDEX IF NOT EXISTS class_cards_card_index ON class_cards (cc_cardkey)",
+    "CREATE INDEX IF NOT EXISTS keyword_cards_card_index ON keyword_cards (card_key)",
+    "CREATE INDEX IF NOT EXISTS class_pools_card_index ON class_pools (pool_cardkey)",
+)
+
+# Rebuild every derived table from the catalog, run once when the triggers are installed
+BACKFILL = (
+    "DELETE FROM card_details",
+    """INSERT INTO card_details
+       SELECT cards.card_key, card_name, card_cost, card_rarity, card_type, card_attack, card_health, card_text, """
+       + _CARD_CLASSES.format(key="cards.card_key") + """
+       FROM cards INNER JOIN (""" + _CARD_STATS + """) AS stats ON stats.card_key = cards.card_key""",
+    "DELETE FROM keyword_cards",
+    """INSERT INTO keyword_cards (keyword_key, card_key)
+       SELECT keyword_key, card_key FROM keywords, card_details WHERE instr(card_text, keyword_name) > 0""",
+    "DELETE FROM class_pools",
+    """INSERT INTO class_pools (pool_classkey, pool_cardkey)
+       SELECT class_key, cc_cardkey FROM classes INNER JOIN class_cards ON cc_classkey = class_key
+       UNION
+       SELECT class_key, cc_cardkey FROM classes, class_cards
+       WHERE cc_classkey IN (SELECT class_key FROM classes WHERE class_name = '{}')""".format(NEUTRAL_CLASS),
+)
+
+SEARCH_BACKFILL = (
+    "DELETE FROM card_search",
+    "INSERT INTO card_search (rowid, card_name, card_text) SELECT card_key, card_name, COALESCE(card_text, '') FROM card_details",
+)
+
+# Statements shared by the triggers, {key} being NEW.x or OLD.x
+_RELINK_KEYWORDS = """DELETE FROM keyword_cards WHERE card_key = {key};
+    INSERT INTO keyword_cards (keyword_key, card_key)
+        SELECT keyword_key, {key} FROM keywords, card_details
+        WHERE card_details.card_key = {key} AND instr(card_text, keyword_name) > 0;"""
+
+_REFRESH_POOL = """DELETE FROM class_pools WHERE pool_cardkey = {key};
+    INSERT OR IGNORE INTO class_pools (pool_classkey, pool_cardkey)
+        SELECT class_key, {key} FROM classes
+        WHERE class_key IN (SELECT cc_classkey FROM class_cards WHERE cc_cardkey = {key})
+           OR EXISTS (SELECT 1 FROM class_cards INNER JOIN classes AS neutral ON cc_classkey = neutral.class_key
+                      WHERE cc_cardkey = {key} AND neutral.class_name = '""" + NEUTRAL_CLASS + """');
+    UPDATE card_details SET card_classes = """ + _CARD_CLASSES + """ WHERE card_key = {key};"""
+
+def _refresh_stats(key):
+    # Recompute the stats of a card from the type tables, then its keywords
+    return """UPDATE card_details SET
+        card_attack = COALESCE((SELECT MIN(minion_attack) FROM minions WHERE minion_cardkey = {key}),
+                               (SELECT MIN(weapon_attack) FROM weapons WHERE weapon_cardkey = {key})),
+        card_health = COALESCE((SELECT MIN(minion_health) FROM minions WHERE minion_cardkey = {key}),
+                               (SELECT MIN(weapon_durability) FROM weapons WHERE weapon_cardkey = {key})),
+        card_text = COALESCE((SELECT MIN(minion_text) FROM minions WHERE minion_cardkey = {key}),
+                             (SELECT MIN(spell_text) FROM spells WHERE spell_cardkey = {key}),
+                             (SELECT MIN(weapon_text) FROM weapons WHERE weapon_cardkey = {key}))
+        WHERE card_key = {key};
+    """.format(key=key) + _RELINK_KEYWORDS.format(key=key)
+
+def _type_triggers(table, key):
+    # The insert, update and delete triggers of a type table
+    return (
+        ("{}_insert".format(table), "AFTER INSERT ON {}".format(table), _refresh_stats("NEW." + key)),
+        ("{}_update".format(table), "AFTER UPDATE ON {}".format(table), _refresh_stats("OLD." + key) + _refresh_stats("NEW." + key)),
+        ("{}_delete".format(table), "AFTER DELETE ON {}".format(table), _refresh_stats("OLD." + key)),
+    )
+
+# (name, event, body) of every trigger
+TRIGGERS = (
+    ("cards_insert", "AFTER INSERT ON cards",
+     """INSERT INTO card_details (card_key, card_name, card_cost, card_rarity, card_type)
+            VALUES (NEW.card_key, NEW.card_name, NEW.card_cost, NEW.card_rarity, NEW.card_type);
+    INSERT OR IGNORE INTO card_sets (cs_cardkey, cs_setkey)
+            SELECT NEW.card_key, set_key FROM sets WHERE set_name = '""" + DEFAULT_SET + """';"""),
+    ("cards_update", "AFTER UPDATE ON cards",
+     """UPDATE card_details SET card_name = NEW.card_name, card_cost = NEW.card_cost, card_rarity = NEW.card_rarity,
+            card_type = NEW.card_type WHERE card_key = NEW.card_key;"""),
+    ("cards_delete", "AFTER DELETE ON cards",
+     """DELETE FROM minions WHERE minion_cardkey = OLD.card_key;
+    DELETE FROM spells WHERE spell_cardkey = OLD.card_key;
+    DELETE FROM weapons WHERE weapon_cardkey = OLD.card_key;
+    DELETE FROM class_cards WHERE cc_cardkey = OLD.card_key;
+    DELETE FROM keyword_cards WHERE card_key = OLD.card_key;
+    DELETE FROM class_pools WHERE pool_cardkey = OLD.card_key;
+    DELETE FROM card_sets WHERE cs_cardkey = OLD.card_key;
+    DELETE FROM card_details WHERE card_key = OLD.card_key;"""),
+) + _type_triggers("minions", "minion_cardkey") + _type_triggers("spells", "spell_cardkey") \
+  + _type_triggers("weapons", "weapon_cardkey") + (
+    ("class_cards_insert", "AFTER INSERT ON class_cards", _REFRESH_POOL.format(key="NEW.cc_cardkey")),
+    ("class_cards_update", "AFTER UPDATE ON class_cards",
+     _REFRESH_POOL.format(key="OLD.cc_cardkey") + _REFRESH_POOL.format(key="NEW.cc_cardkey")),
+    ("class_cards_delete", "AFTER DELETE ON class_cards", _REFRESH_POOL.format(key="OLD.cc_cardkey")),
+    ("classes_insert", "AFTER INSERT ON classes",
+     """INSERT OR IGNORE INTO class_pools (pool_classkey, pool_cardkey)
+            SELECT NEW.class_key, cc_cardkey FROM class_cards INNER JOIN classes ON cc_classkey = class_key
+            WHERE class_name = '""" + NEUTRAL_CLASS + """';"""),
+    ("classes_delete", "AFTER DELETE ON classes",
+     """DELETE FROM class_pools WHERE pool_classkey = OLD.class_key;
+    DELETE FROM class_cards WHERE cc_classkey = OLD.class_key;"""),
+    ("keywords_insert", "AFTER INSERT ON keywords",
+     """INSERT INTO keyword_cards (keyword_key, card_key)
+            SELECT NEW.keyword_key, card_key FROM card_details WHERE instr(card_text, NEW.keyword_name) > 0;"""),
+    ("keywords_update", "AFTER UPDATE OF keyword_name ON keywords",
+     """DELETE FROM keyword_cards WHERE keyword_key = OLD.keyword_key;
+    INSERT INTO keyword_cards (keyword_key, card_key)
+            SELECT NEW.keyword_key, card_key FROM card_details WHERE instr(card_text, NEW.keyword_name) > 0;"""),
+    ("keywords_delete", "AFTER DELETE ON keywords",
+     """DELETE FROM keyword_cards WHERE keyword_key = OLD.keyword_key;"""),
+) + FORMAT_TRIGGERS
+
+# The full-text index is optional (SQLite may be built without FTS5), so its triggers are
+# installed separately
+SEARCH_TRIGGERS = (
+    ("card_search_insert", "AFTER INSERT ON card_details",
+     """INSERT INTO card_search (rowid, card_name, card_text) VALUES (NEW.card_key, NEW.card_name, COALESCE(NEW.card_text, ''));"""),
+    ("card_search_update", "AFTER UPDATE OF card_name, card_text ON card_details",
+     """UPDATE card_search SET card_name = NEW.card_name, card_text = COALESCE(NEW.card_text, '') WHERE rowid = NEW.card_key;"""),
+    ("card_search_delete", "AFTER DELETE ON card_details",
+     """DELETE FROM card_search WHERE rowid = OLD.card_key;"""),
+)
+
+def trigger_statements(triggers):
+    """
+    Return the DROP/CREATE statements that (re)install the given triggers.
+
+    Parameters
+    ----------
+    triggers : tuple of (str, str, str)
+        (name, event, body) of every trigger
+    """
+
+    statements = []
+    for name, event, body in triggers:
+        statements.append("DROP TRIGGER IF EXISTS {}".format(name))
+        statements.append("CREATE TRIGGER {} {} FOR EACH ROW BEGIN\n    {}\nEND".format(name, event, body))
+    return statements
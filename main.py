@@ -1,15 +1,26 @@
-import pandas as pd
+import time
+_START_TIME = time.perf_counter()
+
+import os
+import sys
+import argparse
 from HSDB import HSDB
 from App import App
+from Reporter import ConsoleReporter
+from ResultCache import ResultCache
+from Storage import SQLiteBackend, MemoryBackend, GroupCommitWriter
 
-def main():
-    # Read in the data
-    cards = pd.read_csv('data/cards.csv')
-    heroes = pd.read_csv('data/heroes.csv')
+DB_FILE = 'data/hs.sqlite'
 
-    # Initialize a database manager and establish connection to the database
-    db = HSDB()
-    db.connect('data/hs.sqlite')
+def rebuild_database(db):
+    """
+    Drop every table and rebuild the whole catalog from the csv files in the data folder.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database manager
+    """
 
     # Drop all tables
     db.drop_table("Cards")
@@ -21,14 +32,153 @@ def main():
     db.drop_table("class_cards")
     db.drop_table("keywords")
     db.drop_table("keyword_cards")
+    db.drop_table("class_pools")
+    db.drop_table("card_details")
+    db.drop_table("card_search")
+    db.drop_table("sets")
+    db.drop_table("card_sets")
+    db.drop_table("formats")
+    db.drop_table("format_sets")
+    db.drop_table("format_cards")
 
     # this fn will generate and populate Heroes, Classes, Cards, and other related tables
-    # for use from the cards/classes/heroes csv files.
-    db.create_tables_from_data(cards, heroes)
+    # for use from the cards/classes/heroes csv files. Progress and errors go to stderr.
+    db.reporter = ConsoleReporter()
+    db.create_tables_from_data()
+
+def update_database(db):
+    """
+    Apply the changes of the csv files in the data folder to the existing catalog, and
+    print what changed.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database manager
+    """
+
+    db.reporter = ConsoleReporter()
+    result = db.update_tables_from_data()
+    for table, operations in sorted(result["changes"].items()):
+        print("{:<10} {:>5} inserted {:>5} updated {:>5} deleted".format(
+            table, operations["insert"], operations["update"], operations["delete"]))
+    print("Catalog sequence:", result["sequence"])
+    return result
+
+def profile_startup(db, app, imports_done):
+    """
+    Report how long it takes to reach the first prompt and to answer the first query,
+    then exit without entering the main loop.
+
+    Parameters
+    ----------
+    db : HSDB
+        The database manager
+    app : App
+        The application, ready to display its first prompt
+    imports_done : float
+        The time (perf_counter) at which all the modules were imported
+    """
+
+    first_prompt = time.perf_counter()
+    db.get_heroes()
+    first_query = time.perf_counter()
+
+    print("Startup profile")
+    print("{:<24} {:>10.2f} ms".format("Imports", (imports_done - _START_TIME) * 1000))
+    print("{:<24} {:>10.2f} ms".format("Time to first prompt", (first_prompt - _START_TIME) * 1000))
+    print("{:<24} {:>10.2f} ms".format("Time to first query", (first_query - _START_TIME) * 1000))
+    print("{:<24} {:>10}".format("Pandas imported", "yes" if "pandas" in sys.modules else "no"))
+
+def main(argv=None):
+    imports_done = time.perf_counter()
+
+    parser = argparse.ArgumentParser(description="Hearthstone database app")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop and rebuild all tables from the csv files before starting")
+    parser.add_argument("--update", action="store_true",
+                        help="apply only the changes of the csv files to the existing tables before starting, "
+                             "upgrading a database built by an older version")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report time to first prompt and time to first query, then exit")
+    parser.add_argument("--read-only", action="store_true",
+                        help="serve the existing database as an immutable, read-only file")
+    parser.add_argument("--slow-query-ms", type=float, metavar="MS",
+                        help="log queries slower than MS milliseconds, with their query plan, to stderr")
+    parser.add_argument("--stats-interval", type=float, metavar="SECONDS",
+                        help="dump per-method query statistics to stderr every SECONDS seconds")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="validate cards against the memory-mapped catalog snapshot at PATH, "
+                             "exporting it from the database first if it does not exist")
+    parser.add_argument("--result-cache", metavar="PATH",
+                        help="keep the results of popular searches in the SQLite file PATH across restarts")
+    parser.add_argument("--catalog-storage", choices=["sqlite", "memory"], default="sqlite",
+                        help="serve the card, hero and keyword lookups from the database (the default) or from "
+                             "a copy of the catalog loaded in memory at startup")
+    parser.add_argument("--deck-storage", choices=["memory", "sqlite"], default="memory",
+                        help="keep the decks in memory only (the default) or in the database across restarts")
+    parser.add_argument("--group-commit", action="store_true",
+                        help="with --deck-storage sqlite, queue the deck writes and commit them in batches "
+                             "instead of one transaction per write")
+    args = parser.parse_args(argv)
+
+    if args.read_only and args.rebuild:
+        parser.error("--rebuild cannot be used with --read-only")
+    if args.read_only and args.deck_storage == "sqlite":
+        parser.error("--deck-storage sqlite cannot be used with --read-only")
+    if args.group_commit and args.deck_storage != "sqlite":
+        parser.error("--group-commit needs --deck-storage sqlite")
+    if args.read_only and args.update:
+        parser.error("--update cannot be used with --read-only")
+    if args.rebuild and args.update:
+        parser.error("--update cannot be used with --rebuild")
+    if args.read_only and not os.path.isfile(DB_FILE):
+        parser.error("--read-only needs an existing database, {} does not exist".format(DB_FILE))
+
+    # Initialize a database manager, the database file is only opened on the first query
+    db = HSDB()
+    db.connect(DB_FILE, read_only=args.read_only)
+    if args.result_cache is not None:
+        db.result_cache = ResultCache(path=args.result_cache)
+    if args.slow_query_ms is not None:
+        db.instrumentation.slow_query_threshold = args.slow_query_ms / 1000
+        db.instrumentation.stream = sys.stderr
+    if args.stats_interval is not None:
+        db.instrumentation.start_periodic_dump(args.stats_interval, sys.stderr)
+
+    # Only rebuild when asked to, or when there is no database file yet
+    if not args.read_only and (args.rebuild or not os.path.isfile(DB_FILE) or os.path.getsize(DB_FILE) == 0):
+        rebuild_database(db)
+    elif args.update:
+        update_database(db)
+
+    if args.snapshot is not None:
+        if args.rebuild or args.update or not os.path.isfile(args.snapshot):
+            db.export_snapshot(args.snapshot)
+        try:
+            db.load_snapshot(args.snapshot)
+        except ValueError as e:
+            # Written by an older version, export it again
+            print("Error in load_snapshot:", e)
+            db.export_snapshot(args.snapshot)
+            db.load_snapshot(args.snapshot)
+
+    if args.catalog_storage == "memory":
+        catalog = MemoryBackend()
+        catalog.load(SQLiteBackend(db), decks=False)
+        db.use_catalog(catalog)
 
     # Start the application
-    app = App(db)
-    app.run()
+    if args.deck_storage == "sqlite":
+        storage = SQLiteBackend(db, GroupCommitWriter(DB_FILE) if args.group_commit else None)
+    else:
+        storage = MemoryBackend()
+    app = App(db, storage)
+    if args.profile_startup:
+        profile_startup(db, app, imports_done)
+    else:
+        app.run()
+    storage.close()
 
 if __name__ == '__main__':
     main()
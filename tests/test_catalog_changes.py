@@ -0,0 +1,85 @@
+import os
+import sys
+import csv
+import shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from HSDB import HSDB
+
+CSV_FILES = ("cards.csv", "classes.csv", "heroes.csv", "keywords.csv")
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # A copy of the csv files, edited by the tests
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for file_name in CSV_FILES:
+        shutil.copyfile(os.path.join(ROOT, "data", file_name), str(data_dir / file_name))
+    return str(data_dir)
+
+@pytest.fixture
+def db(tmp_path, data_dir):
+    # A copy of the shipped database, updated from the copy of the csv files
+    db_file = str(tmp_path / "hs.sqlite")
+    shutil.copyfile(os.path.join(ROOT, "data", "hs.sqlite"), db_file)
+    db = HSDB()
+    db.data_dir = data_dir
+    db.connect(db_file)
+    yield db
+    db.conn.close()
+
+def read_rows(path):
+    with open(path, "r", newline="") as f:
+        return list(csv.reader(f, skipinitialspace=True))
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as f:
+        csv.writer(f, quoting=csv.QUOTE_NONNUMERIC).writerows(rows)
+
+def test_update_logs_changes(db, data_dir):
+    # The ingest gives the type and class rows of a duplicated card name to its first
+    # card only, the first update writes those of the others
+    assert db.update_tables_from_data()["errors"] == []
+    sequence = db.catalog_sequence()
+    assert db.update_tables_from_data()["changes"] == {}
+    assert db.changes_since(sequence) == []
+
+    cards_file = os.path.join(data_dir, "cards.csv")
+    rows = read_rows(cards_file)
+    header, updated, deleted = rows[0], rows[1], rows[2]
+    updated[3] = str(int(updated[3]) + 1)
+    inserted = ["Test Card", "Minion", "Common", "1", "1", "1", "", "Neutral"]
+    write_rows(cards_file, [header, updated] + rows[3:] + [inserted])
+
+    result = db.update_tables_from_data()
+    assert result["errors"] == []
+    assert result["changes"] == {"cards": {"insert": 1, "update": 1, "delete": 1}}
+    changes = db.changes_since(sequence)
+    assert result["sequence"] == changes[-1].sequence
+    assert sorted((change.table, change.name, change.operation) for change in changes) == sorted([
+        ("cards", "Test Card", "insert"), ("cards", updated[0], "update"), ("cards", deleted[0], "delete")])
+    for change in changes:
+        if change.operation == "delete":
+            assert db.get_card_key(change.name) is None
+        else:
+            assert db.get_card_key(change.name) == change.key
+    assert db.get_card_info(updated[0]).card_cost == int(updated[3])
+
+    # Tailing from the last change seen returns nothing new
+    assert db.changes_since(result["sequence"]) == []
+
+def test_rebuild_logs_reset(tmp_path, data_dir):
+    db = HSDB()
+    db.data_dir = data_dir
+    db.connect(str(tmp_path / "rebuilt.sqlite"))
+    try:
+        summary = db.create_tables_from_data()
+        assert summary["errors"] == []
+        changes = db.changes_since(0)
+        assert [(change.table, change.operation) for change in changes] == [("*", "reset")]
+        assert db.catalog_sequence() == changes[0].sequence
+    finally:
+        db.conn.close()
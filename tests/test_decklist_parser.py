@@ -0,0 +1,78 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from HSDB import HSDB
+from DecklistParser import DecklistParser, Diagnostic
+
+@pytest.fixture(scope="module")
+def parser():
+    db = HSDB()
+    db.connect(os.path.join(ROOT, "data", "hs.sqlite"), read_only=True)
+    yield DecklistParser(db)
+    db.conn.close()
+
+def test_count_forms(parser):
+    parsed = parser.parse_text("Name Counts\nClass Mage\nHero Medivh\n2x Frostbolt\nFlamestrike x2\n2 Counterspell\nMana Wyrm\n")
+    assert parsed.ok
+    assert parsed.cards == ["Frostbolt"] * 2 + ["Flamestrike"] * 2 + ["Counterspell"] * 2 + ["Mana Wyrm"]
+
+def test_comments(parser):
+    text = ("# A full line comment\n"
+            "// Another one\n"
+            "Name Comments   # trailing\n"
+            "Class Mage\n"
+            "Hero Medivh // trailing\n"
+            "\n"
+            "2x Frostbolt    # two copies\n"
+            "Mana Wyrm       // one copy\n")
+    parsed = parser.parse_text(text)
+    assert parsed.ok
+    assert parsed.name == "Comments"
+    assert parsed.hero == "Medivh"
+    assert parsed.cards == ["Frostbolt", "Frostbolt", "Mana Wyrm"]
+
+def test_header_order(parser):
+    parsed = parser.parse_text("Hero Medivh\nName Any Order\nClass mage\nFrostbolt\n")
+    assert parsed.ok
+    assert (parsed.name, parsed.class_name, parsed.hero) == ("Any Order", "Mage", "Medivh")
+
+    # A header line after the first card is a card line, a repeated one is ignored
+    parsed = parser.parse_text("Name Late\nHero Medivh\nName Again\nFrostbolt\nClass Mage\n")
+    assert parsed.name == "Late"
+    assert Diagnostic(3, "warning", "Name is given again, line 3 is ignored") in parsed.diagnostics
+    assert Diagnostic(0, "error", "missing Class line") in parsed.diagnostics
+    assert any(diagnostic.line == 5 and diagnostic.severity == "error" for diagnostic in parsed.diagnostics)
+
+def test_copy_limits(parser):
+    parsed = parser.parse_text("Name Limits\nClass Mage\nHero Medivh\n3x Frostbolt\n2x Archmage Antonidas\n")
+    assert parsed.ok
+    assert parsed.diagnostics == [Diagnostic(4, "warning", "3 copies of Frostbolt, the limit is 2"),
+                                  Diagnostic(5, "warning", "2 copies of Archmage Antonidas, the limit is 1")]
+
+    # Copies on separate lines add up, and the warning is given once
+    parsed = parser.parse_text("Name Limits\nClass Mage\nHero Medivh\nFrostbolt\nFrostbolt\nFrostbolt\nFrostbolt\n")
+    assert parsed.diagnostics == [Diagnostic(6, "warning", "3 copies of Frostbolt, the limit is 2")]
+
+def test_diagnostic_lines(parser):
+    text = ("Name Errors\n"
+            "Class Warrior\n"
+            "Hero Medivh\n"
+            "# comment\n"
+            "Frostbolt\n"
+            "No Such Card\n"
+            "0x Mana Wyrm\n"
+            "31x Frostbolt\n")
+    parsed = parser.parse_text(text, "errors.txt")
+    assert not parsed.ok
+    assert [(diagnostic.line, diagnostic.severity) for diagnostic in parsed.diagnostics] == [
+        (2, "error"), (6, "error"), (7, "warning"), (8, "error")]
+    assert parsed.diagnostics[0].message == "Medivh is a Mage hero, not Warrior"
+    assert parsed.diagnostics[1].message.startswith("unknown card 'No Such Card'")
+    assert parsed.format_diagnostics()[0] == "errors.txt:2: error: Medivh is a Mage hero, not Warrior"
+
+    parsed = parser.parse_text("Name Illegal\nClass Mage\nHero Medivh\nWhirlwind\n")
+    assert parsed.diagnostics == [Diagnostic(4, "error", "Whirlwind cannot be played by Mage")]
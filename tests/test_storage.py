@@ -0,0 +1,83 @@
+import os
+import sys
+import shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from HSDB import HSDB
+from Storage import SQLiteBackend, MemoryBackend, GroupCommitWriter, check_conformance, check_deck_repository
+
+@pytest.fixture
+def db(tmp_path):
+    # A copy of the shipped database, so that the deck writes do not touch it
+    db_file = str(tmp_path / "hs.sqlite")
+    shutil.copyfile(os.path.join(ROOT, "data", "hs.sqlite"), db_file)
+    db = HSDB()
+    db.connect(db_file)
+    yield db
+    db.conn.close()
+
+def test_memory_backend_conforms(db):
+    sqlite_backend = SQLiteBackend(db)
+    memory_backend = MemoryBackend()
+    memory_backend.load(sqlite_backend)
+    assert len(memory_backend.cards) > 0
+    assert check_conformance(memory_backend, sqlite_backend) == []
+
+def test_sqlite_backend_conforms(db):
+    sqlite_backend = SQLiteBackend(db)
+    memory_backend = MemoryBackend()
+    memory_backend.load(sqlite_backend)
+    assert check_conformance(sqlite_backend, memory_backend) == []
+
+def test_deck_repositories(db):
+    memory_backend = MemoryBackend()
+    assert check_deck_repository(memory_backend) == []
+    assert check_deck_repository(SQLiteBackend(db)) == []
+    writer_backend = SQLiteBackend(db, GroupCommitWriter(db.db_file))
+    try:
+        assert check_deck_repository(writer_backend) == []
+    finally:
+        writer_backend.close()
+
+def test_memory_backend_loads_decks(db):
+    sqlite_backend = SQLiteBackend(db)
+    assert sqlite_backend.save_deck("Saved", "Hero", ["Card"], "Wild") == 1
+    memory_backend = MemoryBackend()
+    memory_backend.load(sqlite_backend)
+    assert memory_backend.load_deck("Saved") == sqlite_backend.load_deck("Saved")
+
+def test_memory_backend_card_without_cost(db):
+    db.conn.execute("UPDATE cards SET card_cost = NULL WHERE card_key = 1")
+    db.conn.commit()
+    card_name = db.conn.execute("SELECT card_name FROM cards WHERE card_key = 1").fetchone()[0]
+    sqlite_backend = SQLiteBackend(db)
+    memory_backend = MemoryBackend()
+    memory_backend.load(sqlite_backend)
+    assert memory_backend.get_card(card_name).card_cost is None
+    assert check_conformance(memory_backend, sqlite_backend) == []
+
+def test_hsdb_reads_catalog_from_backend(db):
+    memory_backend = MemoryBackend()
+    memory_backend.load(SQLiteBackend(db), decks=False)
+    card_name = db.conn.execute("SELECT card_name FROM cards WHERE card_key = 1").fetchone()[0]
+    hero_name, class_name = db.conn.execute(
+        "SELECT hero_name, class_name FROM heroes INNER JOIN classes ON hero_classkey = class_key LIMIT 1").fetchone()
+    expected = (db.get_card_info(card_name), db.get_hero(hero_name), db.is_legal(card_name, class_name),
+                sorted(db.get_cards(class_name=class_name)))
+
+    db.use_catalog(memory_backend)
+    db.queries.reset()
+    assert (db.get_card_info(card_name), db.get_hero(hero_name), db.is_legal(card_name, class_name),
+            sorted(db.get_cards(class_name=class_name))) == expected
+    assert db.check_card(card_name) and db.check_class(class_name) and db.check_hero(hero_name)
+    assert not db.check_card("No Such Card")
+    assert db.query_stats() == []
+
+    # The memory catalog answers, even after the card is gone from the database
+    db.conn.execute("DELETE FROM cards WHERE card_key = 1")
+    assert db.get_card_info(card_name) is not None
+    db.use_catalog(None)
+    assert db.get_card_info(card_name) is None
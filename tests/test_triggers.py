@@ -0,0 +1,86 @@
+import os
+import sys
+import shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from HSDB import HSDB
+from Triggers import BACKFILL, SEARCH_BACKFILL
+
+@pytest.fixture
+def db(tmp_path):
+    # A copy of the shipped database, which has the triggers installed
+    db_file = str(tmp_path / "hs.sqlite")
+    shutil.copyfile(os.path.join(ROOT, "data", "hs.sqlite"), db_file)
+    db = HSDB()
+    db.connect(db_file)
+    assert db.has_triggers()
+    yield db
+    db.conn.close()
+
+def derived_rows(conn):
+    # The content of the derived tables
+    return {
+        "card_details": sorted(conn.execute("SELECT * FROM card_details").fetchall()),
+        "class_pools": sorted(conn.execute("SELECT pool_classkey, pool_cardkey FROM class_pools").fetchall()),
+        "card_search": sorted(conn.execute("SELECT rowid, card_name, card_text FROM card_search").fetchall()),
+        "keyword_cards": sorted(conn.execute("SELECT keyword_key, card_key FROM keyword_cards").fetchall()),
+    }
+
+def rebuilt_rows(conn):
+    # The content of the derived tables rebuilt from the catalog, which is left unchanged
+    for sql in BACKFILL + SEARCH_BACKFILL:
+        conn.execute(sql)
+    rows = derived_rows(conn)
+    conn.rollback()
+    return rows
+
+def pool_classes(conn, card_key):
+    return sorted(row[0] for row in conn.execute("""SELECT class_name FROM class_pools INNER JOIN classes ON pool_classkey = class_key
+                                                    WHERE pool_cardkey = ?""", (card_key,)))
+
+def search(conn, query):
+    return [row[0] for row in conn.execute("SELECT rowid FROM card_search WHERE card_search MATCH ?", (query,))]
+
+def test_triggers_keep_derived_tables_in_sync(db):
+    conn = db.conn
+    assert derived_rows(conn) == rebuilt_rows(conn)
+    class_keys = dict(conn.execute("SELECT class_name, class_key FROM classes"))
+    keyword = conn.execute("SELECT keyword_name FROM keywords ORDER BY keyword_key LIMIT 1").fetchone()[0]
+
+    # Insert
+    card_key = conn.execute("""INSERT INTO cards (card_name, card_cost, card_rarity, card_type)
+                               VALUES ('Trigger Test', 2, 'Rare', 'Minion')""").lastrowid
+    conn.execute("INSERT INTO minions (minion_cardkey, minion_attack, minion_health, minion_text) VALUES (?, 3, 4, ?)",
+                 (card_key, "Zephyrite. " + keyword))
+    conn.execute("INSERT INTO class_cards (cc_cardkey, cc_classkey) VALUES (?, ?)", (card_key, class_keys["Mage"]))
+    conn.commit()
+    assert conn.execute("SELECT * FROM card_details WHERE card_key = ?", (card_key,)).fetchone() == \
+        (card_key, "Trigger Test", 2, "Rare", "Minion", 3, 4, "Zephyrite. " + keyword, "Mage")
+    assert pool_classes(conn, card_key) == ["Mage"]
+    assert search(conn, "zephyrite") == [card_key]
+    assert conn.execute("SELECT COUNT(*) FROM keyword_cards WHERE card_key = ?", (card_key,)).fetchone()[0] > 0
+    assert derived_rows(conn) == rebuilt_rows(conn)
+
+    # Update: the card becomes neutral, so it joins the pool of every class
+    conn.execute("UPDATE cards SET card_name = 'Trigger Test Updated', card_cost = 5 WHERE card_key = ?", (card_key,))
+    conn.execute("UPDATE minions SET minion_attack = 1, minion_text = 'Quetzal.' WHERE minion_cardkey = ?", (card_key,))
+    conn.execute("UPDATE class_cards SET cc_classkey = ? WHERE cc_cardkey = ?", (class_keys["Neutral"], card_key))
+    conn.commit()
+    assert conn.execute("SELECT * FROM card_details WHERE card_key = ?", (card_key,)).fetchone() == \
+        (card_key, "Trigger Test Updated", 5, "Rare", "Minion", 1, 4, "Quetzal.", "Neutral")
+    assert pool_classes(conn, card_key) == sorted(class_keys)
+    assert search(conn, "zephyrite") == []
+    assert search(conn, "quetzal") == [card_key]
+    assert conn.execute("SELECT COUNT(*) FROM keyword_cards WHERE card_key = ?", (card_key,)).fetchone()[0] == 0
+    assert derived_rows(conn) == rebuilt_rows(conn)
+
+    # Delete
+    conn.execute("DELETE FROM cards WHERE card_key = ?", (card_key,))
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM card_details WHERE card_key = ?", (card_key,)).fetchone()[0] == 0
+    assert pool_classes(conn, card_key) == []
+    assert search(conn, "quetzal") == []
+    assert derived_rows(conn) == rebuilt_rows(conn)